@@ -0,0 +1,385 @@
+"""Reproducible benchmarks of the space mission and NAV pipelines, with a comparison against a baseline.
+
+Run from this directory, e.g.:
+
+    python benchmarks.py --output results.json
+    python benchmarks.py --output new.json --baseline results.json
+    python benchmarks.py --workloads nav_linear bounds_lp --size nav_linear=10 --repeats 5
+
+The space mission modules are imported from ../space_mission; utils, which has a copy in both directories,
+is taken from this one.
+"""
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import platform
+import statistics
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from importlib.metadata import version
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+from p_tqdm import p_umap
+from pacti.contracts import PolyhedralIoContract
+from scipy.stats import qmc
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.resolve() / "space_mission"))
+
+from utils import all_variable_bounds, contract_shift, cpu_info_message  # noqa: E402
+from nav_projection import NAVScenarioGeometric, NAVScenarioLinear  # noqa: E402
+from generators import make_5step_scenario_from_ranges, make_20step_scenario_from_ranges, make_range  # noqa: E402
+from schedulability import (  # noqa: E402
+    schedulability_analysis5,
+    schedulability_analysis5_batch,
+    schedulability_analysis5_grouped,
+)
+
+benchmark_format = 1
+
+# The hyperparameter ranges of hyper_scenarios.py.
+l_bounds = [2.0, 3.0, 0.1, 0.2, 0.1, 0.3, 2.0, 1.0, 0.8, -0.3, 1.0, 0.3]
+u_bounds = [2.5, 6.0, 0.4, 1.0, 0.4, 0.7, 5.0, 1.5, 1.5, 0.8, 2.0, 0.8]
+
+# The operational requirement ranges of hyper_requirements.py.
+op_l_bounds = [90.0, 5.0, 5.0, 60.0, 40.0, 60.0]
+op_u_bounds = [100.0, 30.0, 100.0, 100.0, 90.0, 100.0]
+
+# The NAV parameters of nav_linear.ipynb.
+nav_parameters: Dict[str, Any] = dict(mu=0.005, gain=(0.2, 0.3), max_dv=10, me=(0.9, 1.1), tactics_order=[5, 4, 1, 2, 3])
+
+
+@dataclass(frozen=True)
+class Workload:
+    """
+    A benchmark: `setup(size, seed)` prepares the inputs, untimed, and `run(inputs)` is timed.
+
+    `run` returns a summary of its result, e.g., a number of constraints, recorded to detect changes of results
+    along with changes of performance.
+    """
+
+    name: str
+    setup: Callable[[int, int], Any]
+    run: Callable[[Any], Any]
+    size: int
+    description: str
+    default: bool = True
+
+
+def scenario_ranges(n: int, seed: int) -> List[List[Tuple[float, float]]]:
+    """
+    Args:
+        n: the number of scenarios
+        seed: the seed of the Latin hypercube samplers
+
+    Returns:
+        The ranges of n scenario variations, sampled as in hyper_scenarios.py.
+    """
+    means = qmc.scale(qmc.LatinHypercube(d=len(l_bounds), seed=seed).random(n), l_bounds, u_bounds)
+    devs = qmc.LatinHypercube(d=len(l_bounds), seed=seed + 1).random(n)
+    return [[make_range(m, d) for m, d in zip(mean, dev)] for mean, dev in zip(means, devs)]
+
+
+def requirements(m: int, seed: int) -> np.ndarray:
+    """
+    Args:
+        m: the number of requirement variations
+        seed: the seed of the Latin hypercube sampler
+
+    Returns:
+        An (m x 6) array of operational requirements, sampled as in hyper_requirements.py.
+    """
+    return qmc.scale(qmc.LatinHypercube(d=len(op_l_bounds), seed=seed + 2).random(m), op_l_bounds, op_u_bounds)
+
+
+def constraint_count(c: PolyhedralIoContract) -> int:
+    return len(c.a.terms) + len(c.g.terms)
+
+
+def scenarios5(n: int, seed: int) -> List[Tuple[List[Tuple[float, float]], PolyhedralIoContract]]:
+    return [(ranges, make_5step_scenario_from_ranges(ranges)) for ranges in scenario_ranges(n, seed)]
+
+
+def schedulability_scenario(seed: int) -> Tuple[List[Tuple[float, float]], PolyhedralIoContract]:
+    # The first of 3 sampled scenarios: with seed 0, 2 of the default 60 requirement variations are admissible,
+    # whereas none are for the scenario sampled alone.
+    ranges = scenario_ranges(3, seed)[0]
+    return ranges, make_5step_scenario_from_ranges(ranges)
+
+
+def schedulability_inputs(size: int, seed: int) -> List[Tuple[Any, np.ndarray]]:
+    # One scenario analyzed against `size` requirement variations.
+    scenario = schedulability_scenario(seed)
+    return [(scenario, reqs) for reqs in requirements(size, seed)]
+
+
+def outcomes(results: List[Any]) -> Dict[str, int]:
+    """
+    Args:
+        results: schedulability results
+
+    Returns:
+        The number of admissible results and of failed results per contract whose merge failed, so that the result
+        summary still detects changes when few or no requirement variations are admissible.
+    """
+    counts = Counter("admissible" if r.__class__.__name__ == "Schedule" else f"failed:{r.failed_name}" for r in results)
+    return dict(sorted(counts.items()))
+
+
+def nav_contract(size: int, seed: int) -> PolyhedralIoContract:
+    # The composition of `size` NAV loops; the NAV workloads do not depend on the seed.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return NAVScenarioLinear(iterations=size - 2, variables=["t", "trtd"], **nav_parameters).currents[-1]
+
+
+def run_nav_linear(size: int) -> int:
+    with contextlib.redirect_stdout(io.StringIO()):
+        ns = NAVScenarioLinear(iterations=size, variables=["t", "trtd"], **nav_parameters)
+    return constraint_count(ns.currents[-1])
+
+
+def run_nav_geometric(size: int) -> int:
+    with contextlib.redirect_stdout(io.StringIO()):
+        ns = NAVScenarioGeometric(iterations=size, variables=["t", "trtd"], **nav_parameters)
+    return constraint_count(ns.currents[-1])
+
+
+def run_shift(c: PolyhedralIoContract, repeats: int = 100) -> int:
+    for k in range(1, repeats + 1):
+        shifted = contract_shift(c, offset=4 * k)
+    return constraint_count(shifted)
+
+
+def variable_names(c: PolyhedralIoContract) -> Tuple[PolyhedralIoContract, List[str]]:
+    return c, sorted(v.name for v in c.vars)
+
+
+def bounds_checksum(b: np.ndarray) -> float:
+    return round(float(np.nansum(np.abs(b))), 6)
+
+
+workloads: Dict[str, Workload] = {
+    w.name: w
+    for w in [
+        Workload(
+            "scenario5",
+            lambda size, seed: scenario_ranges(size, seed),
+            lambda rs: [constraint_count(make_5step_scenario_from_ranges(r)) for r in rs],
+            2,
+            "composition of `size` 5-step scenarios",
+        ),
+        Workload(
+            "scenario20",
+            lambda size, seed: scenario_ranges(size, seed),
+            lambda rs: [constraint_count(make_20step_scenario_from_ranges(r)) for r in rs],
+            1,
+            "composition of `size` 20-step scenarios (slow: not run by default)",
+            default=False,
+        ),
+        Workload(
+            "schedulability_ungrouped",
+            schedulability_inputs,
+            lambda srs: outcomes(
+                [r for _, r in p_umap(schedulability_analysis5, srs, num_cpus=1, disable=True)]
+            ),
+            60,
+            "schedulability of a 5-step scenario for `size` requirements, one task per requirement",
+        ),
+        Workload(
+            "schedulability_grouped",
+            schedulability_inputs,
+            lambda srs: outcomes(
+                [
+                    r
+                    for group in p_umap(
+                        schedulability_analysis5_grouped,
+                        [tuple(srs[i : i + 5]) for i in range(0, len(srs), 5)],
+                        num_cpus=1,
+                        disable=True,
+                    )
+                    for _, r in group
+                ]
+            ),
+            60,
+            "schedulability of a 5-step scenario for `size` requirements, in tasks of 5 requirements",
+        ),
+        Workload(
+            "schedulability_batch",
+            lambda size, seed: (schedulability_scenario(seed), requirements(size, seed)),
+            lambda sr: outcomes(schedulability_analysis5_batch(sr)[1]),
+            60,
+            "schedulability of a 5-step scenario for `size` requirements, as a single batch",
+        ),
+        Workload(
+            "nav_linear",
+            lambda size, seed: size,
+            run_nav_linear,
+            6,
+            "NAVScenarioLinear with `size` iterations",
+        ),
+        Workload(
+            "nav_geometric",
+            lambda size, seed: size,
+            run_nav_geometric,
+            2,
+            "NAVScenarioGeometric with `size` iterations",
+        ),
+        Workload(
+            "contract_shift",
+            nav_contract,
+            run_shift,
+            8,
+            "100 shifts of the composition of `size` NAV loops",
+        ),
+        Workload(
+            "bounds_lp",
+            lambda size, seed: variable_names(nav_contract(size, seed)),
+            lambda cv: bounds_checksum(all_variable_bounds(*cv, mode="lp")),
+            8,
+            "LP bounds of all the variables of the composition of `size` NAV loops",
+        ),
+        Workload(
+            "bounds_interval",
+            lambda size, seed: variable_names(nav_contract(size, seed)),
+            lambda cv: bounds_checksum(all_variable_bounds(*cv, mode="interval")),
+            8,
+            "interval bounds of all the variables of the composition of `size` NAV loops",
+        ),
+    ]
+}
+
+
+def run_workload(w: Workload, size: int, seed: int, repeats: int) -> Dict[str, Any]:
+    """
+    Runs a workload.
+
+    Args:
+        w: the workload
+        size: its size parameter
+        seed: the seed of its inputs
+        repeats: the number of timed runs
+
+    Returns:
+        The size, the setup time, the time of each run and their minimum and median, and the result summary.
+    """
+    ta = time.perf_counter()
+    inputs = w.setup(size, seed)
+    setup_time = time.perf_counter() - ta
+    times = []
+    for _ in range(repeats):
+        ta = time.perf_counter()
+        result = w.run(inputs)
+        times.append(time.perf_counter() - ta)
+    return {
+        "size": size,
+        "setup_time": setup_time,
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+        "result": result,
+    }
+
+
+def run_suite(
+    names: List[str], sizes: Dict[str, int], seed: int, repeats: int, log: Callable[[str], None] = print
+) -> Dict[str, Any]:
+    """
+    Runs workloads.
+
+    Args:
+        names: the workload names
+        sizes: the sizes overriding the default size of the workloads
+        seed: the seed of the inputs
+        repeats: the number of timed runs of each workload
+        log: reports the result of each workload
+
+    Returns:
+        The benchmark results, with the versions and machine they were measured with.
+    """
+    results: Dict[str, Any] = {
+        "format": benchmark_format,
+        "seed": seed,
+        "repeats": repeats,
+        "python": platform.python_version(),
+        "pacti": version("pacti"),
+        "machine": cpu_info_message,
+        "workloads": {},
+    }
+    for name in names:
+        w = workloads[name]
+        r = run_workload(w, sizes.get(name, w.size), seed, repeats)
+        results["workloads"][name] = r
+        log(f"{name}(size={r['size']}): median {r['median']:.3f}s, min {r['min']:.3f}s; result {r['result']}")
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compares benchmark results with a baseline.
+
+    Workloads are compared by their median time, if they were run with the same size and seed.
+
+    Args:
+        results: the benchmark results
+        baseline: the baseline results
+        tolerance: the relative slowdown above which a workload regressed, e.g., 0.2 for 20%
+
+    Returns:
+        The regressions: the workloads slower than the baseline beyond the tolerance or whose result changed.
+    """
+    regressions = []
+    for name, r in results["workloads"].items():
+        b = baseline["workloads"].get(name)
+        if b is None or b["size"] != r["size"] or baseline["seed"] != results["seed"]:
+            print(f"{name}: no baseline with size {r['size']} and seed {results['seed']}")
+            continue
+        ratio = r["median"] / b["median"] if b["median"] > 0 else float("inf")
+        status = "ok"
+        if ratio > 1 + tolerance:
+            status = "REGRESSION"
+            regressions.append(f"{name}: {ratio:.2f}x slower")
+        if r["result"] != b["result"]:
+            status = "CHANGED RESULT"
+            regressions.append(f"{name}: result {r['result']} instead of {b['result']}")
+        print(f"{name}: {b['median']:.3f}s -> {r['median']:.3f}s ({ratio:.2f}x) {status}")
+    if baseline.get("machine") != results["machine"]:
+        print(f"Note: the baseline was measured on {baseline.get('machine')}")
+    return regressions
+
+
+def parse_sizes(sizes: List[str]) -> Dict[str, int]:
+    parsed = {}
+    for s in sizes:
+        name, _, value = s.partition("=")
+        if name not in workloads or not value.isdigit():
+            raise ValueError(f"Expected <workload>=<size> with a workload among {list(workloads)}; got: {s}")
+        parsed[name] = int(value)
+    return parsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the space mission and NAV benchmarks.")
+    parser.add_argument("--workloads", nargs="+", choices=list(workloads), help="all the default workloads if omitted")
+    parser.add_argument("--size", nargs="*", default=[], help="workload sizes, e.g. nav_linear=10")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the Latin hypercube samplers")
+    parser.add_argument("--repeats", type=int, default=3, help="number of timed runs of each workload")
+    parser.add_argument("--output", type=pathlib.Path, help="JSON file of the results")
+    parser.add_argument("--baseline", type=pathlib.Path, help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    names = args.workloads or [name for name, w in workloads.items() if w.default]
+    results = run_suite(names, parse_sizes(args.size), args.seed, args.repeats)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n".join(["Regressions:"] + regressions))
+            sys.exit(1)
@@ -0,0 +1,191 @@
+"""Removal of redundant constraints from polyhedral contracts, as a cheaper alternative to simplifying them."""
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from pacti.contracts import PolyhedralIoContract
+from pacti.terms.polyhedra import PolyhedralTermList
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix, diags, vstack
+
+from utils import termlist_csr
+
+
+@dataclass(frozen=True)
+class PruneReport:
+    """The number of constraints removed by each pass of `prune_contract`."""
+
+    constraints: int
+    syntactic: int
+    lp: int
+    lp_checks: int
+    prune_time: float
+
+    def __str__(self) -> str:
+        return (
+            f"pruned {self.syntactic} duplicate or dominated and {self.lp} LP-redundant constraints "
+            f"of {self.constraints} ({self.lp_checks} LP checks) in {self.prune_time:.3f}s"
+        )
+
+
+def _normalized(mat: csr_matrix, vec: np.ndarray, decimals: int) -> Tuple[list, np.ndarray]:
+    # Scale each row by its largest coefficient so that rows with the same direction have the same coefficients;
+    # the key of a row is its sorted column indices and rounded scaled coefficients.
+    mat = csr_matrix(mat)
+    mat.sum_duplicates()
+    mat.eliminate_zeros()
+    scale = abs(mat).max(axis=1).toarray().reshape(-1)
+    scale[scale == 0] = 1.0
+    scaled = diags(1 / scale) @ mat
+    scaled.sort_indices()
+    keys = [
+        (scaled.indices[a:b].tobytes(), np.round(scaled.data[a:b], decimals).tobytes())
+        for a, b in zip(scaled.indptr[:-1], scaled.indptr[1:])
+    ]
+    return keys, vec / scale
+
+
+def syntactic_redundancies(
+    mat: csr_matrix, vec: np.ndarray, context: Optional[Tuple[csr_matrix, np.ndarray]] = None, decimals: int = 9
+) -> np.ndarray:
+    """
+    Finds the rows that are identical to or dominated by another row after normalization.
+
+    Rows are grouped by hashing their sparse normalized coefficients, without densifying the matrix.
+
+    A row is dominated by a row with the same normalized coefficients and a smaller or equal normalized constant;
+    of several identical rows, the first one is kept. Rows without coefficients and a nonnegative constant
+    always hold.
+
+    Args:
+        mat: the coefficient matrix of the rows
+        vec: the constants of the rows
+        context: optional rows that hold, e.g., the assumptions when pruning the guarantees;
+            rows dominated by a context row are redundant
+        decimals: the precision of the normalized coefficients
+
+    Returns:
+        The mask of the redundant rows.
+    """
+    n = len(vec)
+    keys, constants = _normalized(mat, vec, decimals)
+    if context is not None and len(context[1]):
+        ctx_keys, ctx_constants = _normalized(*context, decimals)
+        keys = keys + ctx_keys
+        constants = np.concatenate([constants, ctx_constants])
+    if not len(constants):
+        return np.zeros(0, dtype=bool)
+    origin = np.arange(len(constants))
+    is_context = origin >= n
+    group_of: Dict[tuple, int] = {}
+    groups = np.array([group_of.setdefault(k, len(group_of)) for k in keys], dtype=np.int64)
+    # Within a group, the row kept has the least constant, preferring context rows and then earlier rows.
+    order = np.lexsort((origin, ~is_context, constants, groups))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = groups[order][1:] != groups[order][:-1]
+    redundant = np.ones(len(constants), dtype=bool)
+    redundant[order[first]] = False
+    trivial = np.array([not k[0] for k in keys]) & (constants >= 0)
+    return (redundant | trivial)[:n]
+
+
+def lp_redundancies(
+    mat: csr_matrix,
+    vec: np.ndarray,
+    context: Optional[Tuple[csr_matrix, np.ndarray]] = None,
+    max_checks: Optional[int] = None,
+    tolerance: float = 1e-9,
+) -> Tuple[np.ndarray, int]:
+    """
+    Finds rows implied by the other rows with linear programs.
+
+    A row `a x <= b` is redundant if the maximum of `a x` subject to the other remaining rows and the context
+    is at most `b`. Rows are checked in order and removed as soon as they are found redundant,
+    so that of two equivalent rows only one is removed.
+
+    Args:
+        mat: the coefficient matrix of the rows
+        vec: the constants of the rows
+        context: optional rows that hold, e.g., the assumptions when pruning the guarantees
+        max_checks: the maximum number of linear programs, all candidates by default
+        tolerance: the tolerance on `b`
+
+    Returns:
+        The mask of the redundant rows and the number of linear programs solved.
+    """
+    redundant = np.zeros(len(vec), dtype=bool)
+    ctx_mat, ctx_vec = context if context is not None else (csr_matrix((0, mat.shape[1])), np.zeros(0))
+    # The rows of each LP are selected from the stacked rows and context, which are only stacked once.
+    all_mat = vstack([mat, ctx_mat], format="csr")
+    all_vec = np.concatenate([vec, ctx_vec])
+    selected = np.ones(len(all_vec), dtype=bool)
+    checks = 0
+    for i in range(len(vec)):
+        if max_checks is not None and checks >= max_checks:
+            break
+        selected[: len(vec)] = ~redundant
+        selected[i] = False
+        checks += 1
+        res = linprog(
+            -mat[i].toarray().reshape(-1),
+            A_ub=all_mat[selected],
+            b_ub=all_vec[selected],
+            bounds=(None, None),
+            method="highs",
+        )
+        if res.status == 0 and -res.fun <= vec[i] + tolerance:
+            redundant[i] = True
+    return redundant, checks
+
+
+def prune_contract(
+    c: PolyhedralIoContract, max_lp_checks: Optional[int] = None
+) -> Tuple[PolyhedralIoContract, PruneReport]:
+    """
+    Removes redundant assumptions and guarantees.
+
+    The first pass removes duplicate and dominated rows after normalizing them, in batch;
+    the second removes rows implied by the others with at most `max_lp_checks` linear programs.
+    As with `simplify`, guarantees are pruned in the context of the assumptions.
+    With `max_lp_checks=0`, only the syntactic pass runs.
+
+    Args:
+        c: the contract
+        max_lp_checks: the maximum number of linear programs, one per remaining row by default
+
+    Returns:
+        The pruned contract and the report of the removed constraints.
+    """
+    ta = time.time()
+    columns: Dict[str, int] = {v.name: i for i, v in enumerate(c.vars)}
+    a_mat, a_vec = termlist_csr(c.a, columns)
+    g_mat, g_vec = termlist_csr(c.g, columns)
+
+    a_syntactic = syntactic_redundancies(a_mat, a_vec)
+    a_mat, a_vec = a_mat[~a_syntactic], a_vec[~a_syntactic]
+    g_syntactic = syntactic_redundancies(g_mat, g_vec, context=(a_mat, a_vec))
+    g_mat, g_vec = g_mat[~g_syntactic], g_vec[~g_syntactic]
+
+    a_lp, a_checks = lp_redundancies(a_mat, a_vec, max_checks=max_lp_checks)
+    remaining = None if max_lp_checks is None else max_lp_checks - a_checks
+    a_mat, a_vec = a_mat[~a_lp], a_vec[~a_lp]
+    g_lp, g_checks = lp_redundancies(g_mat, g_vec, context=(a_mat, a_vec), max_checks=remaining)
+
+    a_terms = [t for t, r in zip([t for t, s in zip(c.a.terms, a_syntactic) if not s], a_lp) if not r]
+    g_terms = [t for t, r in zip([t for t, s in zip(c.g.terms, g_syntactic) if not s], g_lp) if not r]
+    pruned = PolyhedralIoContract(
+        PolyhedralTermList([t.copy() for t in a_terms]),
+        PolyhedralTermList([t.copy() for t in g_terms]),
+        c.inputvars,
+        c.outputvars,
+        simplify=False,
+    )
+    report = PruneReport(
+        constraints=len(c.a.terms) + len(c.g.terms),
+        syntactic=int(a_syntactic.sum() + g_syntactic.sum()),
+        lp=int(a_lp.sum() + g_lp.sum()),
+        lp_checks=a_checks + g_checks,
+        prune_time=time.time() - ta,
+    )
+    return pruned, report
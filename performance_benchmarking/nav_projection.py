@@ -1,16 +1,32 @@
 from pacti.contracts import PolyhedralIoContract
 from typing import Optional, List, Tuple
 from utils import (
+    CompositionPlan,
+    compose_plan,
     contract_shift,
     contract_statistics,
-    get_numerical_bounds,
+    get_all_numerical_bounds,
     nochange_contract,
+    plan_balanced_composition,
     plot_steps,
     scenario_sequence,
     tuple2float,
 )
+from tactic_profile import TacticProfile, profiled_scenario_sequence
+from contract_pruning import prune_contract
+from dataclasses import asdict, dataclass
+import json
+import os
+import pathlib
+import shutil
 import time
 import pickle
+import sys
+
+# The contract store is shared with the space mission analyses.
+sys.path.append(str(pathlib.Path(__file__).parent.parent.resolve() / "space_mission"))
+
+from contract_store import ContractStore, save_contracts  # noqa: E402
 from matplotlib.figure import Figure
 
 from functools import partial
@@ -254,6 +270,166 @@ class NAVLoop:
         )
         self.steps1234.simplify()
 
+def reduce_contract(c: PolyhedralIoContract, prune: bool, max_lp_checks: Optional[int] = None) -> PolyhedralIoContract:
+    """Reduces the constraints of a composed contract between iterations.
+
+    Args:
+        c (PolyhedralIoContract): the composed contract.
+        prune (bool): whether to remove redundant constraints with `prune_contract` instead of simplifying the contract.
+        max_lp_checks (Optional[int]): the maximum number of LP redundancy checks when pruning.
+
+    Returns:
+        PolyhedralIoContract: the contract, simplified in place, or its pruned copy.
+    """
+    if not prune:
+        c.simplify()
+        return c
+    pruned, report = prune_contract(c, max_lp_checks=max_lp_checks)
+    print(report)
+    return pruned
+
+@dataclass(frozen=True)
+class IterationMetrics:
+    """Lightweight record of a scenario construction iteration."""
+
+    length: int
+    shift_time: float
+    compose_time: float
+    tactics: List[List[Tuple[int, float, int]]]
+    variables: int
+    constraints: int
+
+    @staticmethod
+    def from_contract(
+        length: int,
+        c: PolyhedralIoContract,
+        shift_time: float,
+        compose_time: float,
+        tactics: List[List[Tuple[int, float, int]]],
+    ) -> "IterationMetrics":
+        return IterationMetrics(length, shift_time, compose_time, tactics, len(c.vars), len(c.a.terms) + len(c.g.terms))
+
+    @staticmethod
+    def from_json(d: dict) -> "IterationMetrics":
+        return IterationMetrics(**{**d, "tactics": [[tuple(t) for t in ts] for ts in d["tactics"]]})
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Which of the contracts produced by successive iterations are kept in memory.
+
+    By default, all contracts are kept. Otherwise, only the last `keep_last` contracts
+    and every `keep_every`-th contract are kept; e.g., `RetentionPolicy(keep_last=0)` keeps
+    only the per-iteration metrics. Contracts that are not kept are saved in `spill_to`,
+    if provided, and reloaded on access.
+    """
+
+    keep_last: Optional[int] = None
+    keep_every: Optional[int] = None
+    spill_to: Optional[str] = None
+
+    def retains(self, i: int, n: int) -> bool:
+        if self.keep_last is None and self.keep_every is None:
+            return True
+        return (self.keep_last is not None and i >= n - self.keep_last) or (
+            self.keep_every is not None and i % self.keep_every == 0
+        )
+
+
+class ContractHistory:
+    """A list of contracts, or of tuples holding a contract, that retains its items according to a RetentionPolicy."""
+
+    def __init__(
+        self,
+        name: str,
+        policy: RetentionPolicy,
+        contract_position: Optional[int] = None,
+        contracts_from: Optional["ContractHistory"] = None,
+    ) -> None:
+        """
+        Args:
+            name (str): name of the history, used for naming spilled contracts.
+            policy (RetentionPolicy): which items are kept in memory.
+            contract_position (Optional[int]): position of the contract in tuple items; None if the items are contracts.
+            contracts_from (Optional[ContractHistory]): a history of contracts that also holds the contracts
+                of the items appended with their index in it; these contracts are reloaded from it, not spilled again.
+
+        Raises:
+            ValueError: the items of this history are spilled but not those of `contracts_from`.
+        """
+        if contracts_from is not None and policy.spill_to and not contracts_from.policy.spill_to:
+            raise ValueError(f"The contracts of {name} are only in {contracts_from.name}, which must spill them too")
+        self.name = name
+        self.policy = policy
+        self.contract_position = contract_position
+        self.contracts_from = contracts_from
+        self.items: dict = {}
+        self.spilled: dict = {}
+        # The index in `contracts_from` of the contract of each item appended with one.
+        self.sources: dict = {}
+        self.length: int = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, item, source: Optional[int] = None) -> None:
+        """
+        Args:
+            item: a contract, or a tuple holding one
+            source (Optional[int]): the index of the item's contract in `contracts_from`, if it holds it.
+        """
+        if source is not None:
+            self.sources[self.length] = source
+        self.items[self.length] = item
+        self.length += 1
+        for i in [i for i in self.items if not self.policy.retains(i, self.length)]:
+            if self.policy.spill_to:
+                self._spill(i)
+            del self.items[i]
+
+    def _spill_path(self, i: int) -> pathlib.Path:
+        return pathlib.Path(self.policy.spill_to) / f"{self.name}{i}.contracts"
+
+    def _spill(self, i: int) -> None:
+        item = self.items[i]
+        if i in self.sources:
+            # The contract is reloaded from `contracts_from`, which spills it if it does not keep it.
+            self.spilled[i] = None if self.contract_position is None else self._without_contract(item)
+        elif self.contract_position is None:
+            save_contracts(self._spill_path(i), [item])
+            self.spilled[i] = None
+        else:
+            save_contracts(self._spill_path(i), [item[self.contract_position]])
+            self.spilled[i] = self._without_contract(item)
+
+    def _without_contract(self, item: tuple) -> tuple:
+        return item[: self.contract_position] + (None,) + item[self.contract_position + 1 :]
+
+    def retained(self) -> List[int]:
+        """Returns the indices of the items kept in memory or spilled to disk."""
+        return sorted(list(self.items) + list(self.spilled))
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += self.length
+        if i in self.items:
+            return self.items[i]
+        if i in self.spilled:
+            if i in self.sources:
+                c = self.contracts_from[self.sources[i]]
+            else:
+                c = ContractStore(self._spill_path(i), mmap=False)[0]
+            if self.contract_position is None:
+                return c
+            item = self.spilled[i]
+            return item[: self.contract_position] + (c,) + item[self.contract_position + 1 :]
+        raise IndexError(f"{self.name}[{i}] is out of range or was not retained; retained: {self.retained()}")
+
+    def __iter__(self):
+        """Iterates over the retained items, reloading the spilled ones."""
+        return (self[i] for i in self.retained())
+
+
 class NAVScenarioLinear:
     def __init__(
         self,
@@ -265,6 +441,10 @@ class NAVScenarioLinear:
         variables: Optional[List[str]] = None,
         tactics_order: Optional[List[int]] = None,
         load_from_file: Optional[str] = None,
+        retention: RetentionPolicy = RetentionPolicy(),
+        tactic_profile: Optional[TacticProfile] = None,
+        prune: bool = False,
+        max_lp_checks: Optional[int] = None,
     ) -> None:
         if load_from_file:
             # Load existing state from disk
@@ -288,38 +468,99 @@ class NAVScenarioLinear:
         self.l2.steps1234.simplify()
         
         current, _ = scenario_sequence(c1=self.l1.steps1234, c2=self.l2.steps1234, variables=variables, c1index=4, tactics_order=tactics_order)
-        current.simplify()
-        self.contracts: List[Tuple[int, PolyhedralIoContract, float, float, List[List[Tuple[int, float, int]]]]] = []
-        self.currents: List[PolyhedralIoContract] = []
-        self.shifted: List[PolyhedralIoContract] = []
+        current = reduce_contract(current, prune, max_lp_checks)
+        # With a retention policy, only some of the contracts of each iteration are kept; see RetentionPolicy.
+        self.currents = ContractHistory("currents", retention)
+        # The contracts of the iterations are those of `currents`, which is the only history spilling them.
+        self.contracts = ContractHistory("contracts", retention, contract_position=1, contracts_from=self.currents)
+        self.shifted = ContractHistory("shifted", retention)
+        self.metrics: List[IterationMetrics] = []
         self.currents.append(current)
         length: int = 2
         for i in range(iterations):
-            self.currents.append(current)
             length = length+1
             ta = time.time()
             current_shift: PolyhedralIoContract = contract_shift(c=current, offset=4)
             tb = time.time()
-            current, tactics = scenario_sequence(c1=self.l1.steps1234, c2=current_shift, variables=variables, c1index=4, tactics_order=tactics_order)
-            current.simplify()
+            current, tactics = profiled_scenario_sequence(c1=self.l1.steps1234, c2=current_shift, variables=variables, c1index=4, tactics_order=tactics_order, profile=tactic_profile)
+            current = reduce_contract(current, prune, max_lp_checks)
             tc = time.time()
             
             self.shifted.append(current_shift)
+            self.currents.append(current)
             
             tuple: Tuple[int, PolyhedralIoContract, float, float, List[List[Tuple[int, float, int]]]] = (length, current, tb - ta, tc - tb, tactics)
-            self.contracts.append(tuple)
+            self.contracts.append(tuple, source=len(self.currents) - 1)
+            self.metrics.append(IterationMetrics.from_contract(*tuple))
             density, counts = contract_statistics(current)
             print(f"{i}: shift: {(tb-ta):.3f} compose: {(tc-tb):.3f} variable size input: {len(current_shift.vars)} vars, {len(current_shift.a.terms)+len(current_shift.g.terms)} constraints; result: {len(current.vars)} vars, {len(current.a.terms)+len(current.g.terms)} constraints; {density=:.4g}; size distribution: {counts}")
             print(tactics)
+        if tactic_profile:
+            tactic_profile.save()
 
     def save_state(self, filename: str) -> None:
         with open(filename, "wb") as f:
             pickle.dump(self, f)
 
+    def save_contracts(self, path: str) -> None:
+        """Saves the retained composed contracts in a contract store that can be read lazily with ContractStore."""
+        save_contracts(path, list(self.currents))
+
     def load_state(self, filename: str) -> None:
         with open(filename, "rb") as f:
             tmp_dict = pickle.load(f).__dict__
             self.__dict__.update(tmp_dict)
+        if "metrics" not in tmp_dict:
+            self.metrics = [IterationMetrics.from_contract(*t) for t in self.contracts]
+
+class NAVScenarioBalanced:
+    """The NAVScenarioLinear scenario over a number of NAV loops, composed as a balanced tree.
+
+    NAVScenarioLinear composes the first loop with the accumulated contract of all the following ones,
+    so every iteration involves the largest contract so far. Here, the loops are shifted copies of the first one
+    composed pairwise, then pairs of pairs, etc., following `plan_balanced_composition`;
+    the subtrees at `parallel_depth` are composed in parallel processes.
+    """
+
+    def __init__(
+        self,
+        loops: int,
+        mu: float,
+        gain: Tuple[float, float],
+        max_dv: float,
+        me: Tuple[float, float],
+        variables: List[str],
+        tactics_order: Optional[List[int]] = None,
+        parallel_depth: int = 0,
+    ) -> None:
+        if not (1 <= loops):
+            raise ValueError(f"loops must be at least one; got: {loops=}")
+        self.l1 = NAVLoop(step=1, mu=mu, gain=gain, max_dv=max_dv, me=me)
+        self.l1.steps1234.simplify()
+        ta = time.time()
+        self.loops: List[PolyhedralIoContract] = [self.l1.steps1234] + [
+            contract_shift(c=self.l1.steps1234, offset=4 * k) for k in range(1, loops)
+        ]
+        tb = time.time()
+        self.shift_time: float = tb - ta
+        self.plan: CompositionPlan = plan_balanced_composition(self.loops)
+        self.current, self.records = compose_plan(
+            self.plan,
+            self.loops,
+            ends=[4 * (k + 1) for k in range(loops)],
+            variables=variables,
+            tactics_order=tactics_order,
+            parallel_depth=parallel_depth,
+            subtree_map=p_map if parallel_depth > 0 else map,
+        )
+        self.compose_time: float = time.time() - tb
+        for r in self.records:
+            print(f"loops {r.first}-{r.last}: compose: {r.compose_time:.3f} result: {r.variables} vars, {r.constraints} constraints")
+        print(f"shift: {self.shift_time:.3f} compose: {self.compose_time:.3f} peak: {self.peak_constraints()} constraints")
+
+    def peak_constraints(self) -> int:
+        """The largest number of constraints of a composed contract."""
+        return max((r.constraints for r in self.records), default=0)
 
 class NAVScenarioGeometric:
     def __init__(
@@ -330,7 +571,10 @@ class NAVScenarioGeometric:
         max_dv: float,
         me: Tuple[float, float],
         variables: List[str],
-        tactics_order: Optional[List[int]] = None
+        tactics_order: Optional[List[int]] = None,
+        tactic_profile: Optional[TacticProfile] = None,
+        prune: bool = False,
+        max_lp_checks: Optional[int] = None,
     ) -> None:
         if not (0 <= iterations):
             raise ValueError(
@@ -341,7 +585,7 @@ class NAVScenarioGeometric:
         self.l2 = NAVLoop(step=5, mu=mu, gain=gain, max_dv=max_dv, me=me)
         self.l2.steps1234.simplify()
         current, _ = scenario_sequence(c1=self.l1.steps1234, c2=self.l2.steps1234, variables=variables, c1index=4, tactics_order=tactics_order)
-        current.simplify()
+        current = reduce_contract(current, prune, max_lp_checks)
         self.contracts: List[Tuple[int, PolyhedralIoContract, float, float, List[List[Tuple[int, float, int]]]]] = []
         self.currents: List[PolyhedralIoContract] = []
         self.shifted: List[PolyhedralIoContract] = []
@@ -352,8 +596,8 @@ class NAVScenarioGeometric:
             ta = time.time()
             current_shift: PolyhedralIoContract = contract_shift(c=current, offset=length)
             tb = time.time()
-            current, tactics = scenario_sequence(c1=current, c2=current_shift, variables=variables, c1index=length, tactics_order=tactics_order)
-            current.simplify()
+            current, tactics = profiled_scenario_sequence(c1=current, c2=current_shift, variables=variables, c1index=length, tactics_order=tactics_order, profile=tactic_profile)
+            current = reduce_contract(current, prune, max_lp_checks)
             tc = time.time()
             
             self.shifted.append(current_shift)
@@ -365,6 +609,8 @@ class NAVScenarioGeometric:
             density, counts = contract_statistics(current)
             print(f"{i}: shift: {(tb-ta):.3f} compose: {(tc-tb):.3f} each input: {len(current_shift.vars)} vars, {len(current_shift.a.terms)+len(current_shift.g.terms)} constraints; result: {len(current.vars)} vars, {len(current.a.terms)+len(current.g.terms)} constraints; {density=:.4g}; size distribution: {counts}")
             print(tactics)
+        if tactic_profile:
+            tactic_profile.save()
 
 class NAVScenarioGeometricGenerator:
     def __init__(
@@ -375,42 +621,127 @@ class NAVScenarioGeometricGenerator:
         me: Optional[Tuple[float, float]] = None,
         variables: Optional[List[str]] = None,
         tactics_order: Optional[List[int]] = None,
-        load_from_file: Optional[str] = None
+        load_from_file: Optional[str] = None,
+        load_from_checkpoint: Optional[str] = None,
+        tactic_profile: Optional[TacticProfile] = None,
+        prune: bool = False,
+        max_lp_checks: Optional[int] = None,
     ) -> None:
         if load_from_file:
             # Load existing state from disk
             self.load_state(load_from_file)
             return
 
+        if load_from_checkpoint:
+            # Resume from the last completed iteration, without constructing the NAV loops again
+            self.load_checkpoint(load_from_checkpoint)
+            return
+
         # Ensure that iterations and other parameters are provided when not loading from file
         if mu is None or gain is None or max_dv is None or me is None or variables is None:
             raise ValueError("Required parameters not provided!")
 
         self.tactics_order: Optional[List[int]] = tactics_order
+        self.tactic_profile: Optional[TacticProfile] = tactic_profile
+        self.prune: bool = prune
+        self.max_lp_checks: Optional[int] = max_lp_checks
         self.variables: List[str] = variables
         self.l1 = NAVLoop(step=1, mu=mu, gain=gain, max_dv=max_dv, me=me)
         self.l1.steps1234.simplify()
         self.l2 = NAVLoop(step=5, mu=mu, gain=gain, max_dv=max_dv, me=me)
         self.l2.steps1234.simplify()
         current, _ = scenario_sequence(c1=self.l1.steps1234, c2=self.l2.steps1234, variables=self.variables, c1index=4, tactics_order=self.tactics_order)
-        current.simplify()
+        current = reduce_contract(current, self.prune, self.max_lp_checks)
         self.contracts: List[Tuple[int, PolyhedralIoContract, float, float, List[List[Tuple[int, float, int]]]]] = []
         self.currents: List[PolyhedralIoContract] = []
         self.shifted: List[PolyhedralIoContract] = []
         self.currents.append(current)
+        self.metrics: List[IterationMetrics] = []
         self.length: int = 8
         
         # Initializing the iteration number
         self.iteration_number: int = 0
 
     def save_state(self, filename: str) -> None:
+        if self.tactic_profile:
+            self.tactic_profile.save()
         with open(filename, "wb") as f:
             pickle.dump(self, f)
 
+    def save_contracts(self, path: str) -> None:
+        """Saves the composed contract of each iteration in a contract store that can be read lazily with ContractStore."""
+        save_contracts(path, self.currents)
+
     def load_state(self, filename: str) -> None:
         with open(filename, "rb") as f:
             tmp_dict = pickle.load(f).__dict__
             self.__dict__.update(tmp_dict)
+        if "metrics" not in tmp_dict:
+            self.metrics = [IterationMetrics.from_contract(*t) for t in self.contracts]
+        if "tactic_profile" not in tmp_dict:
+            self.tactic_profile = None
+        if "prune" not in tmp_dict:
+            self.prune, self.max_lp_checks = False, None
+
+    def save_checkpoint(self, path: str) -> None:
+        """Saves the latest composed contract and the metrics of each iteration, and the tactic profile if any.
+
+        Unlike `save_state`, the size of a checkpoint does not grow with the history of composed contracts.
+        The checkpoint directory holds `checkpoint.json` and the contract store it refers to;
+        the store of the previous checkpoint is removed only once the new one is complete.
+
+        Args:
+            path (str): the checkpoint directory.
+        """
+        directory = pathlib.Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        if self.tactic_profile:
+            self.tactic_profile.save()
+        store = f"iteration{self.iteration_number}.contracts"
+        save_contracts(directory / store, [self.currents[-1]])
+        state = {
+            "store": store,
+            "iteration_number": self.iteration_number,
+            "length": self.length,
+            "variables": self.variables,
+            "tactics_order": self.tactics_order,
+            "prune": self.prune,
+            "max_lp_checks": self.max_lp_checks,
+            "tactic_profile": str(self.tactic_profile.path) if self.tactic_profile and self.tactic_profile.path else None,
+            "metrics": [asdict(m) for m in self.metrics],
+        }
+        with open(directory / "checkpoint.json.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(directory / "checkpoint.json.tmp", directory / "checkpoint.json")
+        for previous in directory.glob("iteration*.contracts"):
+            if previous.name != store:
+                shutil.rmtree(previous)
+
+    def load_checkpoint(self, path: str) -> None:
+        """Loads a checkpoint saved with `save_checkpoint`.
+
+        The composed contracts of the previous iterations and the NAV loops are not part of the checkpoint:
+        `currents` only holds the latest one, `contracts` and `shifted` are empty and `l1`, `l2` are not set.
+
+        Args:
+            path (str): the checkpoint directory.
+        """
+        directory = pathlib.Path(path)
+        with open(directory / "checkpoint.json", "r") as f:
+            state = json.load(f)
+        store = ContractStore(directory / state["store"], mmap=False)
+        self.iteration_number = state["iteration_number"]
+        self.length = state["length"]
+        self.variables = state["variables"]
+        self.tactics_order = state["tactics_order"]
+        self.prune = state.get("prune", False)
+        self.max_lp_checks = state.get("max_lp_checks")
+        profile = state.get("tactic_profile")
+        self.tactic_profile = TacticProfile(profile, default=self.tactics_order) if profile else None
+        self.metrics = [IterationMetrics.from_json(m) for m in state["metrics"]]
+        self.currents = [store[0]]
+        self.contracts = []
+        self.shifted = []
 
     def run_iteration(self) -> None:
 
@@ -419,8 +750,8 @@ class NAVScenarioGeometricGenerator:
         ta = time.time()
         current_shift: PolyhedralIoContract = contract_shift(c=current, offset=self.length)
         tb = time.time()
-        current, tactics = scenario_sequence(c1=current, c2=current_shift, variables=self.variables, c1index=self.length, tactics_order=self.tactics_order)
-        current.simplify()
+        current, tactics = profiled_scenario_sequence(c1=current, c2=current_shift, variables=self.variables, c1index=self.length, tactics_order=self.tactics_order, profile=self.tactic_profile)
+        current = reduce_contract(current, self.prune, self.max_lp_checks)
         tc = time.time()
         
         self.shifted.append(current_shift)
@@ -428,26 +759,21 @@ class NAVScenarioGeometricGenerator:
         
         tuple: Tuple[int, PolyhedralIoContract, float, float, List[List[Tuple[int, float, int]]]] = (self.length, current, tb - ta, tc - tb, tactics)
         self.contracts.append(tuple)
+        self.metrics.append(IterationMetrics.from_contract(*tuple))
         self.length = 2 * self.length
         density, counts = contract_statistics(current)
         print(f"{self.iteration_number}: shift: {(tb-ta):.3f} compose: {(tc-tb):.3f} each input: {len(current_shift.vars)} vars, {len(current_shift.a.terms)+len(current_shift.g.terms)} constraints; result: {len(current.vars)} vars, {len(current.a.terms)+len(current.g.terms)} constraints; {density=:.4g}; size distribution: {counts}")
         print(tactics)
 
-def show_bounds(n: int, c: PolyhedralIoContract, var: str, title: str, text: str, nth_tick: int) -> Figure:
+def show_bounds(n: int, c: PolyhedralIoContract, var: str, title: str, text: str, nth_tick: int, mode: str = "lp") -> Figure:
     sn = ["initial"]
     for i in range( n // 4):
         sn = sn + [f"meas{i}", f"od{i}", f"mdnav{i}", f"tcm{i}"]
 
-    def compute_bounds(i: int) -> tuple2float:
-        return get_numerical_bounds(c=c, var=f"output_{var}{i}")
-
-    last_bounds: tuple2float = get_numerical_bounds(c=c, var=f"{var}{2*n}_exit")
-    middle: List[tuple2float] = p_map(compute_bounds, list(range(1, n)))
-    sb: List[tuple2float] = (
-        [get_numerical_bounds(c=c, var=f"{var}1_entry")]
-        + middle
-        + [last_bounds]
-    )
+    # All the bounds are computed from a single constraint matrix, in this process.
+    variables: List[str] = [f"{var}1_entry"] + [f"output_{var}{i}" for i in range(1, n)] + [f"{var}{2*n}_exit"]
+    sb: List[tuple2float] = get_all_numerical_bounds(c=c, variables=variables, mode=mode)
+    last_bounds: tuple2float = sb[-1]
     density, counts = contract_statistics(c)
     text = text + f"\n{len(c.inputvars)} input variables\n{len(c.outputvars)} output variables\n{len(c.a.terms)} assumptions\n{len(c.g.terms)} constraints\n{density=:.4g}\nsize distribution:"
     for count in counts:
@@ -0,0 +1,244 @@
+"""Scaling of scenario composition and schedulability analysis with the number of steps.
+
+Run from this directory, e.g.:
+
+    python scaling_study.py --steps 20 40 80 160 --output scaling.json
+    python scaling_study.py --steps 5 10 15 --scenarios 2 --time-budget 600
+
+Each horizon is measured in a child process with a time budget. Once two horizons are measured, the growth of
+the composition and schedulability times and of the scenario size is fitted, and a horizon whose predicted time
+exceeds the budget is reported as a breakdown without being run.
+"""
+import argparse
+import json
+import math
+import pathlib
+import time
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from multiprocess import Pool, TimeoutError
+
+# Also puts ../space_mission on the module path.
+from benchmarks import constraint_count, requirements, scenario_ranges
+
+from contract_utils import Schedule
+from generators import make_nstep_scenario_from_ranges
+from run_metrics import RunReport, measure_task
+from schedulability import make_op_requirement_constraints_n, schedulability_analysis_batch
+
+scaling_format = 1
+
+# The quantities whose growth with the number of steps is fitted.
+quantities = ("compose_time", "schedulability_time", "constraints", "variables")
+
+
+@dataclass
+class ScalingPoint:
+    """
+    The measurements of a horizon, averaged over its scenarios.
+
+    `status` is "ok" when measured, "timeout" when the run exceeded the time budget,
+    and "predicted" when it was not run because the fitted growth predicts it would exceed the budget.
+    """
+
+    steps: int
+    status: str = "ok"
+    compose_time: float = math.nan
+    schedulability_time: float = math.nan
+    constraints: float = math.nan
+    variables: float = math.nan
+    admissible: float = math.nan
+    phases: Dict[str, float] = field(default_factory=dict)
+    wall_time: float = math.nan
+
+
+@dataclass(frozen=True)
+class GrowthFit:
+    """A fitted growth curve, `a * n^b` for the power model or `a * exp(b n)` for the exponential one."""
+
+    quantity: str
+    model: str
+    a: float
+    b: float
+    r2: float
+
+    def predict(self, steps: int) -> float:
+        if self.model == "power":
+            return self.a * steps**self.b
+        return self.a * math.exp(self.b * steps)
+
+    def __str__(self) -> str:
+        curve = f"{self.a:.3g} * n^{self.b:.2f}" if self.model == "power" else f"{self.a:.3g} * exp({self.b:.3g} n)"
+        return f"{self.quantity} ~ {curve} (R^2={self.r2:.3f})"
+
+
+def fit_growth(quantity: str, steps: Sequence[int], values: Sequence[float]) -> Optional[GrowthFit]:
+    """
+    Fits power and exponential growth curves by least squares on the logarithm of the values.
+
+    Args:
+        quantity: the name of the quantity
+        steps: the horizons
+        values: the positive values of the quantity at each horizon
+
+    Returns:
+        The curve with the best coefficient of determination, or None with fewer than 2 distinct horizons.
+    """
+    points = [(n, v) for n, v in zip(steps, values) if v > 0 and math.isfinite(v)]
+    if len({n for n, _ in points}) < 2:
+        return None
+    n = np.array([p[0] for p in points], dtype=float)
+    y = np.log([p[1] for p in points])
+    fits = []
+    for model, x in (("power", np.log(n)), ("exponential", n)):
+        b, log_a = np.polyfit(x, y, 1)
+        residual = float(np.sum((y - (log_a + b * x)) ** 2))
+        total = float(np.sum((y - y.mean()) ** 2))
+        r2 = 1.0 - residual / total if total else 1.0
+        fits.append(GrowthFit(quantity, model, float(math.exp(log_a)), float(b), r2))
+    # With 2 horizons both curves fit exactly; prefer the power model, which predicts the slower growth.
+    return max(fits, key=lambda f: (round(f.r2, 6), f.model == "power"))
+
+
+def fit_all(points: Sequence[ScalingPoint]) -> Dict[str, GrowthFit]:
+    """
+    Args:
+        points: the measured horizons
+
+    Returns:
+        The growth curve of each quantity that could be fitted.
+    """
+    measured = [p for p in points if p.status == "ok"]
+    fits = {q: fit_growth(q, [p.steps for p in measured], [getattr(p, q) for p in measured]) for q in quantities}
+    return {q: f for q, f in fits.items() if f is not None}
+
+
+def measure_steps(steps: int, scenarios: int, reqs: int, seed: int) -> ScalingPoint:
+    """
+    Composes scenarios of a horizon and analyzes them against requirement samples.
+
+    Args:
+        steps: the number of steps, a multiple of 5
+        scenarios: the number of scenario samples
+        reqs: the number of requirement samples analyzed against each scenario
+        seed: the seed of the samples, as in benchmarks.py
+
+    Returns:
+        The mean composition time per scenario, schedulability time per requirement sample,
+        scenario constraint and variable counts, share of admissible requirement samples,
+        and time per phase of the composition.
+    """
+    ta = time.perf_counter()
+    report = RunReport(f"scaling{steps}")
+    ops = requirements(reqs, seed)
+    make_op_reqs = partial(make_op_requirement_constraints_n, steps=steps)
+    compose, analyze, constraints, variables, admissible = [], [], [], [], []
+    for i, ranges in enumerate(scenario_ranges(scenarios, seed)):
+        with measure_task(i) as metrics:
+            c = make_nstep_scenario_from_ranges(ranges, steps)
+        report.add(metrics)
+        compose.append(metrics.wall_time)
+        constraints.append(constraint_count(c))
+        variables.append(len(c.vars))
+        tb = time.perf_counter()
+        _, results = schedulability_analysis_batch((ranges, c), ops, make_op_reqs)
+        analyze.append((time.perf_counter() - tb) / max(reqs, 1))
+        admissible.append(sum(isinstance(r, Schedule) for r in results) / max(reqs, 1))
+    return ScalingPoint(
+        steps=steps,
+        compose_time=float(np.mean(compose)),
+        schedulability_time=float(np.mean(analyze)),
+        constraints=float(np.mean(constraints)),
+        variables=float(np.mean(variables)),
+        admissible=float(np.mean(admissible)),
+        phases={p: s["mean"] for p, s in report.phase_summary().items()},
+        wall_time=time.perf_counter() - ta,
+    )
+
+
+def scaling_study(
+    steps: Sequence[int], scenarios: int, reqs: int, seed: int, time_budget: float
+) -> Iterator[ScalingPoint]:
+    """
+    Measures horizons in increasing order until one exceeds the time budget.
+
+    Args:
+        steps: the horizons, multiples of 5
+        scenarios: the number of scenario samples per horizon
+        reqs: the number of requirement samples per scenario
+        seed: the seed of the samples
+        time_budget: the maximum time of a horizon, in seconds
+
+    Yields:
+        The measurements of each horizon, ending with the first horizon that timed out or is predicted to,
+        if any.
+
+    Raises:
+        ValueError: a horizon is not a positive multiple of 5.
+    """
+    for n in steps:
+        if n <= 0 or n % 5:
+            raise ValueError(f"The number of steps must be a positive multiple of 5; got: {n}")
+    points: List[ScalingPoint] = []
+    for n in sorted(set(steps)):
+        fits = fit_all(points)
+        if "compose_time" in fits and "schedulability_time" in fits:
+            predicted = scenarios * (fits["compose_time"].predict(n) + reqs * fits["schedulability_time"].predict(n))
+            if predicted > time_budget:
+                point = ScalingPoint(steps=n, status="predicted", wall_time=predicted)
+                for q, f in fits.items():
+                    setattr(point, q, f.predict(n))
+                yield point
+                return
+        # A child process, so that a horizon exceeding the budget can be stopped.
+        pool = Pool(1)
+        try:
+            point = pool.apply_async(measure_steps, (n, scenarios, reqs, seed)).get(timeout=time_budget)
+        except TimeoutError:
+            yield ScalingPoint(steps=n, status="timeout", wall_time=time_budget)
+            return
+        finally:
+            pool.terminate()
+        points.append(point)
+        yield point
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how scenario composition and analysis scale with steps.")
+    parser.add_argument("--steps", nargs="+", type=int, default=[20, 40, 80, 160], help="horizons, multiples of 5")
+    parser.add_argument("--scenarios", type=int, default=1, help="number of scenario samples per horizon")
+    parser.add_argument("--requirements", type=int, default=20, help="number of requirement samples per scenario")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the Latin hypercube samplers")
+    parser.add_argument("--time-budget", type=float, default=3600.0, help="maximum seconds per horizon")
+    parser.add_argument("--output", type=pathlib.Path, help="JSON file of the measurements and fits")
+    args = parser.parse_args()
+
+    points = []
+    for p in scaling_study(args.steps, args.scenarios, args.requirements, args.seed, args.time_budget):
+        points.append(p)
+        print(
+            f"{p.steps:>4} steps [{p.status}]: compose {p.compose_time:.2f}s, "
+            f"schedulability {p.schedulability_time:.4f}s per requirement, "
+            f"{p.constraints:.0f} constraints, {p.variables:.0f} variables, {p.wall_time:.1f}s"
+        )
+    fits = fit_all(points)
+    for f in fits.values():
+        print(f)
+    if points and points[-1].status != "ok":
+        last = points[-1]
+        print(f"Breakdown at {last.steps} steps: exceeds the {args.time_budget:.0f}s budget ({last.status})")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "format": scaling_format,
+                    "args": {k: str(v) if isinstance(v, pathlib.Path) else v for k, v in vars(args).items()},
+                    "points": [asdict(p) for p in points],
+                    "fits": {q: asdict(f) for q, f in fits.items()},
+                },
+                f,
+                indent=1,
+            )
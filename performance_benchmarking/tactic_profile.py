@@ -0,0 +1,268 @@
+"""Selection of composition tactics orders from the tactics traces of previous compositions."""
+import json
+import math
+import os
+import pathlib
+import re
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from pacti.contracts import PolyhedralIoContract
+from pacti.terms.polyhedra.polyhedra import TACTICS_ORDER
+
+from utils import contract_statistics, scenario_sequence
+
+profile_format = 1
+
+tactics_t = List[List[Tuple[int, float, int]]]
+
+
+def composition_shape(c1: PolyhedralIoContract, c2: PolyhedralIoContract) -> str:
+    """Buckets the composition of two contracts by the size and density of its operands.
+
+    Compositions with the same shape have a number of variables and of constraints within a factor of two,
+    and a density within a factor of sqrt(2), so that their tactics traces are comparable.
+
+    Args:
+        c1: the first contract
+        c2: the second contract
+
+    Returns:
+        The shape key, e.g., `v6-c7-d-6`.
+    """
+    variables = len(c1.vars) + len(c2.vars)
+    constraints = len(c1.a.terms) + len(c1.g.terms) + len(c2.a.terms) + len(c2.g.terms)
+    if constraints == 0:
+        return f"v{round(math.log2(max(variables, 1)))}-c0-d0"
+    # The density of the composition operands, weighted by their number of constraints.
+    density = sum(
+        contract_statistics(c)[0] * (len(c.a.terms) + len(c.g.terms)) for c in (c1, c2) if c.a.terms or c.g.terms
+    ) / constraints
+    return f"v{round(math.log2(max(variables, 1)))}-c{round(math.log2(constraints))}-d{round(2 * math.log2(density))}"
+
+
+def _order_key(tactics_order: List[int]) -> str:
+    return ",".join(str(t) for t in tactics_order)
+
+
+def _shape_coordinates(shape: str) -> Optional[Tuple[int, int, int]]:
+    match = re.fullmatch(r"v(-?\d+)-c(-?\d+)-d(-?\d+)", shape)
+    return (int(match[1]), int(match[2]), int(match[3])) if match else None
+
+
+class TacticProfile:
+    """
+    A persistent record of composition times and tactics traces per composition shape.
+
+    For each shape (see `composition_shape`), the profile records the total time of the compositions
+    made with each tactics order and, from their traces, how many terms each tactic transformed and in how long.
+    `choose` picks the fastest recorded order on average for the shape, or for the nearest recorded shape
+    if the shape has no records. With exploration, it first tries each candidate order once per shape.
+    The candidates are the default order, its reverse, and the order ranking the tactics by their
+    mean time per transformed term divided by their share of the transformed terms, so that tactics
+    that often succeed quickly are tried first.
+
+    The file is written by `save` and every `checkpoint_every` recorded compositions, not after each one.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, pathlib.Path]] = None,
+        default: Optional[List[int]] = None,
+        explore: bool = False,
+        exploration_budget: Optional[float] = None,
+        checkpoint_every: Optional[int] = 100,
+    ):
+        """
+        Opens a profile, loading its records if the file exists.
+
+        Args:
+            path: the JSON file of the profile; the profile is kept in memory only if not provided
+            default: the default tactics order, pacti's by default
+            explore: whether to try the candidate orders not yet recorded for a shape
+            exploration_budget: the total time, in seconds, of the compositions made with untried orders,
+                after which the profile stops exploring; unlimited if not provided
+            checkpoint_every: the number of recorded compositions after which the profile is saved;
+                saved only by `save` if not provided
+
+        Raises:
+            ValueError: The file holds a profile of an unsupported format.
+        """
+        self.path = pathlib.Path(path) if path else None
+        self.default: List[int] = list(default) if default else list(TACTICS_ORDER)
+        self.explore = explore
+        self.exploration_budget = exploration_budget
+        self.exploration_time = 0.0
+        self.checkpoint_every = checkpoint_every
+        self.shapes: Dict[str, dict] = {}
+        # The shape and order of the last exploring choice, and the compositions recorded since the last save.
+        self._exploring: Optional[Tuple[str, str]] = None
+        self._unsaved = 0
+        if self.path and self.path.exists():
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            if state["format"] != profile_format:
+                raise ValueError(f"Unsupported tactic profile format {state['format']} in {self.path}")
+            self.shapes = state["shapes"]
+
+    def _shape(self, shape: str) -> dict:
+        return self.shapes.setdefault(shape, {"orders": {}, "tactics": {}})
+
+    def ranked_order(self, shape: str) -> List[int]:
+        """
+        Ranks the tactics from the traces recorded for a shape.
+
+        Args:
+            shape: a composition shape
+
+        Returns:
+            The tactics that transformed terms, in increasing order of mean time over share of the transformed terms,
+            followed by the other tactics of the default order.
+        """
+        tactics = self.shapes.get(shape, {}).get("tactics", {})
+        total = sum(t["terms"] for t in tactics.values())
+        observed = [int(k) for k, t in tactics.items() if t["terms"] > 0 and int(k) in self.default]
+        observed.sort(key=lambda k: tactics[str(k)]["time"] * total / tactics[str(k)]["terms"] ** 2)
+        return observed + [t for t in self.default if t not in observed]
+
+    def candidates(self, shape: str) -> List[List[int]]:
+        """
+        Args:
+            shape: a composition shape
+
+        Returns:
+            The distinct candidate tactics orders for the shape.
+        """
+        orders: List[List[int]] = []
+        for order in (self.default, self.ranked_order(shape), self.default[::-1]):
+            if order not in orders:
+                orders.append(order)
+        return orders
+
+    def nearest_shape(self, shape: str) -> Optional[str]:
+        """
+        Args:
+            shape: a composition shape
+
+        Returns:
+            The recorded shape with the least total difference of log-sizes and log-density from the shape,
+            preferring the one with the most compositions, or None if no composition is recorded.
+        """
+        target = _shape_coordinates(shape)
+        recorded = [k for k, r in self.shapes.items() if r["orders"] and _shape_coordinates(k)]
+        if target is None or not recorded:
+            return None
+
+        def key(k: str) -> Tuple[int, int]:
+            distance = sum(abs(a - b) for a, b in zip(_shape_coordinates(k), target))  # type: ignore
+            return distance, -sum(o["runs"] for o in self.shapes[k]["orders"].values())
+
+        return min(recorded, key=key)
+
+    def best_order(self, shape: str) -> Optional[List[int]]:
+        """
+        Args:
+            shape: a composition shape
+
+        Returns:
+            The recorded order of the shape with the least mean composition time, or None if none is recorded.
+        """
+        orders = self.shapes.get(shape, {}).get("orders", {})
+        if not orders:
+            return None
+        best = min(orders, key=lambda k: orders[k]["time"] / orders[k]["runs"])
+        return [int(t) for t in best.split(",")]
+
+    def choose(self, shape: str) -> List[int]:
+        """
+        Chooses a tactics order for a composition.
+
+        Args:
+            shape: the composition shape
+
+        Returns:
+            When exploring within the budget, the first candidate order not yet recorded for the shape;
+            otherwise, the best order of the shape, or else of the nearest recorded shape, or else the default order.
+        """
+        self._exploring = None
+        if self.explore and (self.exploration_budget is None or self.exploration_time < self.exploration_budget):
+            orders = self.shapes.get(shape, {}).get("orders", {})
+            for order in self.candidates(shape):
+                if _order_key(order) not in orders:
+                    self._exploring = (shape, _order_key(order))
+                    return order
+        best = self.best_order(shape)
+        if best is None:
+            nearest = self.nearest_shape(shape)
+            best = self.best_order(nearest) if nearest else None
+        return best if best is not None else list(self.default)
+
+    def record(self, shape: str, tactics_order: List[int], compose_time: float, tactics: tactics_t) -> None:
+        """
+        Records a composition, saving the profile every `checkpoint_every` compositions.
+
+        Args:
+            shape: the composition shape
+            tactics_order: the tactics order of the composition
+            compose_time: the time of the composition
+            tactics: the tactics traces of the composition, as `(tactic, time, count)` per transformed term
+        """
+        if self._exploring == (shape, _order_key(tactics_order)):
+            self.exploration_time += compose_time
+        self._exploring = None
+        record = self._shape(shape)
+        order = record["orders"].setdefault(_order_key(tactics_order), {"runs": 0, "time": 0.0})
+        order["runs"] += 1
+        order["time"] += compose_time
+        for trace in tactics:
+            for tactic, tactic_time, count in trace:
+                # 0 and -1 stand for terms that no tactic transformed.
+                stats = record["tactics"].setdefault(str(tactic), {"terms": 0, "time": 0.0, "count": 0})
+                stats["terms"] += 1 if tactic > 0 else 0
+                stats["time"] += tactic_time
+                stats["count"] += count
+        self._unsaved += 1
+        if self.checkpoint_every and self._unsaved >= self.checkpoint_every:
+            self.save()
+
+    def save(self) -> None:
+        """Writes the profile to its file, if it has one."""
+        self._unsaved = 0
+        if not self.path:
+            return
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"format": profile_format, "shapes": self.shapes}, f)
+        os.replace(tmp, self.path)
+
+
+def profiled_scenario_sequence(
+    c1: PolyhedralIoContract,
+    c2: PolyhedralIoContract,
+    variables: List[str],
+    c1index: int,
+    tactics_order: Optional[List[int]] = None,
+    profile: Optional[TacticProfile] = None,
+) -> Tuple[PolyhedralIoContract, tactics_t]:
+    """
+    `scenario_sequence` with the tactics order chosen and recorded by a profile.
+
+    Args:
+        c1: preceding step in the scenario sequence
+        c2: next step in the scenario sequence
+        variables: list of entry/exit variable names for renaming
+        c1index: the step number for c1's variable names
+        tactics_order: the tactics order used without a profile
+        profile: if provided, chooses the tactics order and records the composition
+
+    Returns:
+        The composed contract and the tactics used, as `scenario_sequence`.
+    """
+    if profile is None:
+        return scenario_sequence(c1=c1, c2=c2, variables=variables, c1index=c1index, tactics_order=tactics_order)
+    shape = composition_shape(c1, c2)
+    order = profile.choose(shape)
+    ta = time.time()
+    c12, tactics = scenario_sequence(c1=c1, c2=c2, variables=variables, c1index=c1index, tactics_order=order)
+    profile.record(shape, order, time.time() - ta, tactics)
+    return c12, tactics
@@ -0,0 +1,220 @@
+"""Compact, memory-mappable storage of polyhedral contracts."""
+import functools
+import json
+import pathlib
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pacti.contracts import PolyhedralIoContract
+
+from run_metrics import timed
+from var_table import contract_from_rows
+
+tuple2float = Tuple[float, float]
+
+store_format = 1
+
+
+def save_contracts(
+    path: Union[str, pathlib.Path], contracts: Sequence[PolyhedralIoContract], ranges: Optional[np.ndarray] = None
+) -> None:
+    """
+    Saves contracts as a directory of arrays that `ContractStore` reads lazily.
+
+    Each contract is stored as indices into a table of variable names, inputs first, and
+    the rows of its assumptions followed by its guarantees as a sparse (CSR) float64 matrix
+    over these variables with a float64 vector of constants.
+
+    Args:
+        path: the store directory
+        contracts: the contracts to save
+        ranges: optional (len(contracts) x k x 2) array of the range bounds of each contract's scenario
+    """
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    names: Dict[str, int] = {}
+    layout = np.zeros((len(contracts), 6), dtype=np.int64)
+    variables: List[int] = []
+    indptr: List[int] = [0]
+    indices: List[int] = []
+    data: List[float] = []
+    constants: List[float] = []
+    for i, c in enumerate(contracts):
+        local: Dict[str, int] = {}
+        for v in c.inputvars + c.outputvars:
+            local[v.name] = len(local)
+            variables.append(names.setdefault(v.name, len(names)))
+        var_offset = len(variables) - len(local)
+        layout[i] = [var_offset, len(c.inputvars), len(c.outputvars), len(constants), len(c.a.terms), len(c.g.terms)]
+        for t in c.a.terms + c.g.terms:
+            for v, coeff in t.variables.items():
+                indices.append(local[v.name])
+                data.append(coeff)
+            indptr.append(len(indices))
+            constants.append(t.constant)
+
+    with open(path / "names.json", "w") as f:
+        json.dump({"format": store_format, "names": list(names)}, f)
+    np.save(path / "layout.npy", layout)
+    np.save(path / "variables.npy", np.array(variables, dtype=np.int32))
+    np.save(path / "indptr.npy", np.array(indptr, dtype=np.int64))
+    np.save(path / "indices.npy", np.array(indices, dtype=np.int32))
+    np.save(path / "data.npy", np.array(data, dtype=np.float64))
+    np.save(path / "constants.npy", np.array(constants, dtype=np.float64))
+    if ranges is not None:
+        np.save(path / "ranges.npy", np.asarray(ranges, dtype=np.float64))
+
+
+def save_scenarios(
+    path: Union[str, pathlib.Path], scenarios: Sequence[Tuple[List[tuple2float], PolyhedralIoContract]]
+) -> None:
+    """
+    Saves (ranges, contract) scenarios as a contract store.
+
+    Args:
+        path: the store directory
+        scenarios: the range bounds and contract of each scenario
+    """
+    save_contracts(path, [s[1] for s in scenarios], ranges=np.array([s[0] for s in scenarios], dtype=np.float64))
+
+
+class ContractStore:
+    """
+    Read-only access to the contracts saved with `save_contracts`.
+
+    The arrays are memory-mapped: opening a store reads only the variable name table,
+    and each contract is deserialized on access from the pages holding its own rows.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path], mmap: bool = True):
+        """
+        Opens a contract store.
+
+        Args:
+            path: the store directory
+            mmap: whether to memory-map the arrays instead of reading them
+
+        Raises:
+            ValueError: The directory holds a store of an unsupported format.
+        """
+        self.path = pathlib.Path(path)
+        with open(self.path / "names.json", "r") as f:
+            header = json.load(f)
+        if header["format"] != store_format:
+            raise ValueError(f"Unsupported contract store format {header['format']} in {self.path}")
+        self.names: List[str] = header["names"]
+        mode = "r" if mmap else None
+        self.layout: np.ndarray = np.load(self.path / "layout.npy", mmap_mode=mode)
+        self.variables: np.ndarray = np.load(self.path / "variables.npy", mmap_mode=mode)
+        self.indptr: np.ndarray = np.load(self.path / "indptr.npy", mmap_mode=mode)
+        self.indices: np.ndarray = np.load(self.path / "indices.npy", mmap_mode=mode)
+        self.data: np.ndarray = np.load(self.path / "data.npy", mmap_mode=mode)
+        self.constants: np.ndarray = np.load(self.path / "constants.npy", mmap_mode=mode)
+        ranges_path = self.path / "ranges.npy"
+        self.ranges: Optional[np.ndarray] = np.load(ranges_path, mmap_mode=mode) if ranges_path.exists() else None
+
+    def __len__(self) -> int:
+        return len(self.layout)
+
+    def __getitem__(self, i: int) -> PolyhedralIoContract:
+        return self.contract(i)
+
+    def constraint_count(self, i: int) -> int:
+        """
+        Args:
+            i: the contract index
+
+        Returns:
+            The number of assumption and guarantee terms of the contract, without deserializing it.
+        """
+        return int(self.layout[i, 4] + self.layout[i, 5])
+
+    def variable_names(self, i: int) -> Tuple[List[str], List[str]]:
+        """
+        Args:
+            i: the contract index
+
+        Returns:
+            The names of the input and output variables of the contract.
+        """
+        var_offset, n_inputs, n_outputs = (int(x) for x in self.layout[i, :3])
+        names = [self.names[k] for k in self.variables[var_offset : var_offset + n_inputs + n_outputs]]
+        return names[:n_inputs], names[n_inputs:]
+
+    def rows(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        Returns the CSR arrays of a contract's constraints without building terms.
+
+        Args:
+            i: the contract index
+
+        Returns:
+            The row pointers (starting at 0), column indices in the contract's variable order,
+            coefficients and constants of the assumption rows followed by the guarantee rows,
+            and the number of assumption rows.
+        """
+        row_offset, n_assumptions, n_guarantees = (int(x) for x in self.layout[i, 3:])
+        indptr = np.asarray(self.indptr[row_offset : row_offset + n_assumptions + n_guarantees + 1])
+        start, end = int(indptr[0]), int(indptr[-1])
+        return (
+            indptr - start,
+            np.asarray(self.indices[start:end]),
+            np.asarray(self.data[start:end]),
+            np.asarray(self.constants[row_offset : row_offset + n_assumptions + n_guarantees]),
+            n_assumptions,
+        )
+
+    @timed("parse")
+    def contract(self, i: int) -> PolyhedralIoContract:
+        """
+        Deserializes a contract.
+
+        Args:
+            i: the contract index
+
+        Returns:
+            The contract, with its variables and terms in the order they were saved and the interned variables
+            of this process, shared by all the contracts read from the stores.
+        """
+        input_names, output_names = self.variable_names(i)
+        return contract_from_rows(input_names, output_names, *self.rows(i))
+
+    def scenario(self, i: int) -> Tuple[List[tuple2float], PolyhedralIoContract]:
+        """
+        Deserializes a scenario saved with `save_scenarios`.
+
+        Args:
+            i: the scenario index
+
+        Returns:
+            The range bounds and contract of the scenario.
+
+        Raises:
+            ValueError: The store has no range bounds.
+        """
+        if self.ranges is None:
+            raise ValueError(f"The contract store {self.path} has no scenario ranges")
+        return [(float(lo), float(hi)) for lo, hi in self.ranges[i]], self.contract(i)
+
+    def scenarios(self) -> List[Tuple[List[tuple2float], PolyhedralIoContract]]:
+        """
+        Returns:
+            All the scenarios of the store.
+        """
+        return [self.scenario(i) for i in range(len(self))]
+
+
+@functools.lru_cache(maxsize=None)
+def open_contract_store(path: str) -> ContractStore:
+    """
+    Opens a contract store once per process.
+
+    Worker processes use this to share the memory-mapped arrays of a store across their tasks.
+
+    Args:
+        path: the store directory
+
+    Returns:
+        The contract store.
+    """
+    return ContractStore(path)
@@ -4,11 +4,16 @@ from pacti.contracts import PolyhedralIoContract
 
 from pacti import write_contracts_to_file
 from pacti.iocontract import Var
-from typing import Optional, List, Tuple, Union
+from pacti.utils.lists import list_union
+from typing import Callable, Dict, Iterable, Optional, List, Tuple, Union
 from dataclasses import dataclass
 import numpy as np
+from scipy.optimize import linprog
 import pathlib
-import operator
+import string
+from run_metrics import phase, record_contract, timed
+from var_table import interned_var
+from utils import all_variable_bounds as _all_variable_bounds
 
 from cpuinfo import get_cpu_info
 cpu_info = get_cpu_info()
@@ -53,6 +58,10 @@ def check_tuple(t: tuple2) -> tuple2float:
     return (a, b)
 
 
+# The bound LPs of the analysis tasks are timed as their "bounds" phase.
+all_variable_bounds = timed("bounds")(_all_variable_bounds)
+
+
 def bound(c: PolyhedralIoContract, var: str) -> Tuple[str, str]:
     try:
         b = c.get_variable_bounds(var)
@@ -69,16 +78,214 @@ def bound(c: PolyhedralIoContract, var: str) -> Tuple[str, str]:
         return "unknown", "unknown"
 
 def bounds(c: PolyhedralIoContract) -> List[str]:
-    bounds=[]
-    for v in sorted(c.inputvars, key=operator.attrgetter('name')):
-        low, high = bound(c, v.name)
-        bounds.append(f" input {v.name} in [{low},{high}]")
+    inputs = sorted(v.name for v in c.inputvars)
+    outputs = sorted(v.name for v in c.outputvars)
+    try:
+        values = [
+            ["None" if np.isnan(b) else f"{b:.2f}" for b in row] for row in all_variable_bounds(c, inputs + outputs)
+        ]
+    except ValueError:
+        values = [["unknown", "unknown"]] * (len(inputs) + len(outputs))
+    kinds = [" input"] * len(inputs) + ["output"] * len(outputs)
+    return [f"{kind} {v} in [{low},{high}]" for kind, v, (low, high) in zip(kinds, inputs + outputs, values)]
+
+
+@dataclass(frozen=True)
+class AffineTermList:
+    """
+    The matrix form of a polyhedral term list whose coefficients are affine in a parameter vector p.
 
-    for v in sorted(c.outputvars, key=operator.attrgetter('name')):
-        low, high = bound(c, v.name)
-        bounds.append(f"output {v.name} in [{low},{high}]")
+    Row i is the term sum_j (a0[i, j] + a1[i, j, :] @ p) * x_j <= b0[i] + b1[i, :] @ p.
+    """
+
+    a0: np.ndarray
+    a1: np.ndarray
+    b0: np.ndarray
+    b1: np.ndarray
+
+    def evaluate(self, p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the numerical matrix-vector pair of the term list for a parameter vector.
+
+        Args:
+            p: parameter vector
 
-    return bounds
+        Returns:
+            The matrix and vector of the term list.
+        """
+        return self.a0 + self.a1 @ p, self.b0 + self.b1 @ p
+
+
+def termlist_matrix(ptl: PolyhedralTermList, columns: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts a term list into a matrix-vector pair for a fixed variable-to-column assignment.
+
+    Args:
+        ptl: a term list whose variables all have a column
+        columns: the column index of each variable name
+
+    Returns:
+        The matrix and vector of the term list.
+    """
+    a = np.zeros((len(ptl.terms), len(columns)))
+    b = np.zeros(len(ptl.terms))
+    for i, t in enumerate(ptl.terms):
+        for v, coeff in t.variables.items():
+            a[i, columns[v.name]] = coeff
+        b[i] = t.constant
+    return a, b
+
+
+def fit_affine_termlist(
+    ptls: List[PolyhedralTermList], columns: Dict[str, int], base: np.ndarray, steps: np.ndarray
+) -> AffineTermList:
+    """
+    Recovers the affine dependency of a term list on a parameter vector from probe instances.
+
+    Args:
+        ptls: the term list at the parameter vector base, followed by the term list
+            at base + steps[k] * e_k for each parameter k
+        columns: the column index of each variable name
+        base: the base parameter vector
+        steps: the perturbation of each parameter
+
+    Returns:
+        The affine term list.
+
+    Raises:
+        ValueError: the probe instances do not have the same number of terms.
+    """
+    if any(len(ptl.terms) != len(ptls[0].terms) for ptl in ptls):
+        raise ValueError(f"The probes have different numbers of terms: {[len(ptl.terms) for ptl in ptls]}")
+    a_base, b_base = termlist_matrix(ptls[0], columns)
+    a1 = np.zeros(a_base.shape + (len(base),))
+    b1 = np.zeros(b_base.shape + (len(base),))
+    for k, ptl in enumerate(ptls[1:]):
+        a_k, b_k = termlist_matrix(ptl, columns)
+        a1[:, :, k] = (a_k - a_base) / steps[k]
+        b1[:, k] = (b_k - b_base) / steps[k]
+    return AffineTermList(a0=a_base - a1 @ base, a1=a1, b0=b_base - b1 @ base, b1=b1)
+
+
+class ContractTemplate:
+    """
+    A polyhedral contract shape parsed once and instantiated by filling numeric arrays.
+
+    The variables and constraints are format strings. The fields of the variable names
+    (e.g., the step index `s`) are name fields; the other fields are numeric parameters.
+    Each numeric parameter is either a scalar (1 component) or a tuple (e.g., a (min, max) rate).
+
+    Example:
+        ```
+        t = ContractTemplate(
+            input_vars=["d{s}_entry", "duration_dsn{s}"],
+            output_vars=["d{s}_exit"],
+            assumptions=["duration_dsn{s} >= 0"],
+            guarantees=["{speed[0]}*duration_dsn{s} <= d{s}_entry - d{s}_exit <= {speed[1]}*duration_dsn{s}"],
+            params={"speed": 2},
+        )
+        c = t.instantiate(s=3, speed=(0.3, 0.7))
+        ```
+    """
+
+    def __init__(
+        self,
+        input_vars: List[str],
+        output_vars: List[str],
+        assumptions: List[str],
+        guarantees: List[str],
+        params: Dict[str, int],
+    ):
+        """
+        Parses the constraints at probe values of the parameters to recover their matrix form.
+
+        Args:
+            input_vars: input variable name patterns
+            output_vars: output variable name patterns
+            assumptions: assumption patterns
+            guarantees: guarantee patterns
+            params: the number of components of each numeric parameter
+        """
+        self.input_vars = input_vars
+        self.output_vars = output_vars
+        self.params = params
+        name_fields = {f for v in input_vars + output_vars for _, f, _, _ in string.Formatter().parse(v) if f}
+        probe_names = {f: f for f in name_fields}
+        self.columns: Dict[str, int] = {
+            v.format(**probe_names): i for i, v in enumerate(input_vars + output_vars)
+        }
+
+        # Probing with small integers recovers the affine coefficients exactly.
+        size = sum(params.values())
+        base = np.ones(size)
+        steps = np.ones(size)
+        probes = [base] + [base + steps[k] * np.eye(size)[k] for k in range(size)]
+        contracts = [
+            PolyhedralIoContract.from_strings(
+                input_vars=[v.format(**probe_names) for v in input_vars],
+                output_vars=[v.format(**probe_names) for v in output_vars],
+                assumptions=[a.format(**probe_names, **self._unflatten(p)) for a in assumptions],
+                guarantees=[g.format(**probe_names, **self._unflatten(p)) for g in guarantees],
+                simplify=False,
+            )
+            for p in probes
+        ]
+        self.a = fit_affine_termlist([c.a for c in contracts], self.columns, base, steps)
+        self.g = fit_affine_termlist([c.g for c in contracts], self.columns, base, steps)
+
+    def _unflatten(self, p: np.ndarray) -> Dict[str, Union[float, Tuple[float, ...]]]:
+        values: Dict[str, Union[float, Tuple[float, ...]]] = {}
+        i = 0
+        for name, size in self.params.items():
+            values[name] = float(p[i]) if size == 1 else tuple(float(x) for x in p[i : i + size])
+            i += size
+        return values
+
+    @timed("parse")
+    def instantiate(self, **kwargs: Union[str, int, float, Tuple[float, ...]]) -> PolyhedralIoContract:
+        """
+        Constructs the contract for values of the name fields and of the numeric parameters.
+
+        Args:
+            kwargs: the value of each name field and numeric parameter
+
+        Returns:
+            The contract, with guarantees simplified w.r.t. the assumptions as in `PolyhedralIoContract.from_strings`.
+        """
+        p = np.concatenate(
+            [np.zeros(0)] + [np.atleast_1d(np.asarray(kwargs[name], dtype=float)) for name in self.params]
+        )
+        names = {k: v for k, v in kwargs.items() if k not in self.params}
+        inputs = [interned_var(v.format(**names)) for v in self.input_vars]
+        outputs = [interned_var(v.format(**names)) for v in self.output_vars]
+        a_mat, a_vec = self.a.evaluate(p)
+        g_mat, g_vec = self.g.evaluate(p)
+        c = PolyhedralIoContract(
+            assumptions=PolyhedralTermList.polytope_to_termlist(a_mat, a_vec, inputs + outputs),
+            guarantees=PolyhedralTermList.polytope_to_termlist(g_mat, g_vec, inputs + outputs),
+            input_vars=inputs,
+            output_vars=outputs,
+            simplify=False,
+        )
+        # As the constructor does with simplify=True, timed separately from the construction.
+        with phase("simplify"):
+            c.g = c.g.simplify(c.a)
+        return c
+
+
+nochange_template = ContractTemplate(
+    input_vars=["{name}{s}_entry"],
+    output_vars=["{name}{s}_exit"],
+    assumptions=[
+        "0 <= {name}{s}_entry",
+    ],
+    guarantees=[
+        "{name}{s}_exit = {name}{s}_entry",
+        # This poses problems w/ simplifications.
+        # "| {name}{s}_exit - {name}{s}_entry | <= 0.0001",
+    ],
+    params={},
+)
 
 
 def nochange_contract(s: int, name: str) -> PolyhedralIoContract:
@@ -92,20 +299,47 @@ def nochange_contract(s: int, name: str) -> PolyhedralIoContract:
     Returns:
         A no-change contract.
     """
-    return PolyhedralIoContract.from_strings(
-        input_vars=[f"{name}{s}_entry"],
-        output_vars=[f"{name}{s}_exit"],
-        assumptions=[
-            f"0 <= {name}{s}_entry",
-        ],
-        guarantees=[
-            f"{name}{s}_exit = {name}{s}_entry",
-            # This poses problems w/ simplifications.
-            # f"| {name}{s}_exit - {name}{s}_entry | <= 0.0001",
-        ],
+    return nochange_template.instantiate(s=s, name=name)
+
+
+bound_t = Tuple[Optional[float], Optional[float]]
+
+
+@timed("parse")
+def box_contract(input_bounds: Dict[str, bound_t], output_bounds: Dict[str, bound_t]) -> PolyhedralIoContract:
+    """
+    Constructs a contract whose assumptions and guarantees are bounds on individual variables.
+
+    This is equivalent to merging the single-variable contracts parsed from
+    `v >= lo`, `v <= hi` or `v = lo` constraints, without parsing nor simplification.
+
+    Args:
+        input_bounds: the (lower, upper) bounds assumed on each input variable; None for no bound
+        output_bounds: the (lower, upper) bounds guaranteed on each output variable; None for no bound
+
+    Returns:
+        The box contract.
+    """
+
+    def terms(var_bounds: Dict[str, bound_t]) -> PolyhedralTermList:
+        ts: List[PolyhedralTerm] = []
+        for name, (lo, hi) in var_bounds.items():
+            if hi is not None:
+                ts.append(PolyhedralTerm({interned_var(name): 1.0}, hi))
+            if lo is not None:
+                ts.append(PolyhedralTerm({interned_var(name): -1.0}, -lo))
+        return PolyhedralTermList(ts)
+
+    return PolyhedralIoContract(
+        assumptions=terms(input_bounds),
+        guarantees=terms(output_bounds),
+        input_vars=[interned_var(name) for name in input_bounds],
+        output_vars=[interned_var(name) for name in output_bounds],
+        simplify=False,
     )
 
 
+@timed("compose")
 def scenario_sequence(
     c1: PolyhedralIoContract,
     c2: PolyhedralIoContract,
@@ -150,6 +384,225 @@ def scenario_sequence(
     return c12
 
 
+@timed("compose")
+def compose_sequence(
+    steps: List[PolyhedralIoContract], variables: List[str], starts: List[int], right_to_left: bool = True
+) -> PolyhedralIoContract:
+    """
+    Composes a chain of steps, connecting the entry variables of each step to the exit variables of the preceding one.
+
+    The steps are composed in the same order as nesting `scenario_sequence` over consecutive steps, but the entry
+    variables of all steps are renamed upfront and the connecting exit variables are kept through all compositions
+    and renamed to outputs once at the end. Composition is not associative: the order changes the assumptions
+    of the result, so it is fixed rather than chosen by cost.
+
+    Args:
+        steps: the contracts of the steps in the sequence order
+        variables: list of entry/exit variable names for renaming
+        starts: the step number of the first step of each contract; the exit variables connected to
+            the contract starting at step j are those of step j-1
+        right_to_left: whether each step is composed with the composition of the following ones,
+            or the composition of the preceding steps with each step
+
+    Returns:
+        The composition of the steps with the exit variables of each connection renamed to fresh outputs.
+
+    Raises:
+        ValueError: steps and starts have different lengths.
+    """
+    if len(steps) != len(starts):
+        raise ValueError(f"Got {len(steps)} steps but {len(starts)} start indices.")
+    exits = [j - 1 for j in starts[1:]]
+    blocks = [steps[0]] + [
+        c.rename_variables([(f"{v}{j + 1}_entry", f"{v}{j}_exit") for v in variables])
+        for c, j in zip(steps[1:], exits)
+    ]
+    # blocks[k] and blocks[k + 1] are connected by the exit variables of step connections[k].
+    connections = list(exits)
+    while len(blocks) > 1:
+        k = len(connections) - 1 if right_to_left else 0
+        keep = [f"{v}{connections[k]}_exit" for v in variables]
+        blocks[k : k + 2] = [blocks[k].compose(blocks[k + 1], vars_to_keep=keep)]
+        del connections[k]
+        record_contract(blocks[k])
+
+    return blocks[0].rename_variables([(f"{v}{j}_exit", f"output_{v}{j}") for j in exits for v in variables])
+
+
+def range_signs(ranges: List[tuple2float]) -> Tuple[int, ...]:
+    """
+    The sign pattern of the bounds of a list of (min, max) ranges.
+
+    Args:
+        ranges: list of (min, max) ranges
+
+    Returns:
+        The sign of each range bound.
+    """
+    return tuple(int(x) for x in np.sign(np.array(ranges, dtype=float).flatten()))
+
+
+class ScenarioPlan:
+    """
+    A scenario composition performed once and replayed numerically for other (min, max) rate ranges.
+
+    The rate ranges only appear as coefficients of the step contracts whose entry/exit variables
+    have unit coefficients. For ranges with the same sign pattern, the composition therefore eliminates
+    the same variables with the same terms and the composed contract is an affine function of the range bounds.
+    The plan recovers this function from the compositions at the reference ranges and at a perturbation
+    of each range bound; it is checked against the composition at ranges 10% wider than the reference.
+
+    Each replayed contract is also checked with a feasibility LP, and a sample of them against the composition
+    at their ranges: a replay failing a check is replaced by the composition, and after a mismatch,
+    the plan composes the scenario for all ranges.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[List[tuple2float]], PolyhedralIoContract],
+        reference: List[tuple2float],
+        probe_map: Callable[..., Iterable[PolyhedralIoContract]] = map,
+        rel_step: float = 1e-3,
+        tolerance: float = 1e-6,
+        check_every: Optional[int] = 20,
+    ):
+        """
+        Compiles the plan of a scenario generator around reference ranges.
+
+        Args:
+            generate: composes the scenario contract for a list of (min, max) rate ranges
+            reference: the reference ranges
+            probe_map: the map function used to compose the probes, e.g., p_tqdm.p_map to compose them in parallel
+            rel_step: the relative perturbation of each range bound
+            tolerance: the absolute tolerance on the coefficients at the validation ranges
+            check_every: the first replay and every `check_every`-th one are compared with the composition;
+                None to only check their feasibility
+
+        Raises:
+            ValueError: the composition is not affine in the range bounds around the reference ranges.
+        """
+        self.generate = generate
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.replays = 0
+        # False once a replay differed from the composition.
+        self.valid = True
+        self.signs = range_signs(reference)
+        base = np.array(reference, dtype=float).flatten()
+
+        # Widen each range so that the probes preserve min <= max and the sign of each bound.
+        widen = np.tile([-1.0, 1.0], len(reference))
+        steps = rel_step * np.maximum(np.abs(base), rel_step) * widen
+        probes = [base] + [base + steps[k] * np.eye(len(base))[k] for k in range(len(base))]
+        contracts = list(probe_map(generate, [self._ranges(p) for p in probes]))
+
+        self.input_vars: List[Var] = contracts[0].inputvars
+        self.output_vars: List[Var] = contracts[0].outputvars
+        self.columns: Dict[str, int] = {v.name: i for i, v in enumerate(self.input_vars + self.output_vars)}
+        for c in contracts[1:]:
+            if c.inputvars != self.input_vars or c.outputvars != self.output_vars:
+                raise ValueError("The probe compositions have different input/output variables.")
+        self.a = fit_affine_termlist([c.a for c in contracts], self.columns, base, steps)
+        self.g = fit_affine_termlist([c.g for c in contracts], self.columns, base, steps)
+
+        validation = base + 0.1 * np.abs(base) * widen
+        if not self._fits(generate(self._ranges(validation)), validation):
+            raise ValueError("The composition is not affine in the range bounds around the reference ranges.")
+
+    def _fits(self, expected: PolyhedralIoContract, p: np.ndarray) -> bool:
+        # Whether the plan evaluated at the range bounds p has the coefficients of the composition.
+        if expected.inputvars != self.input_vars or expected.outputvars != self.output_vars:
+            return False
+        for tl, affine in ((expected.a, self.a), (expected.g, self.g)):
+            mat, vec = affine.evaluate(p)
+            exp_mat, exp_vec = termlist_matrix(tl, self.columns)
+            if exp_vec.shape != vec.shape or not (
+                np.allclose(mat, exp_mat, atol=self.tolerance) and np.allclose(vec, exp_vec, atol=self.tolerance)
+            ):
+                return False
+        return True
+
+    @staticmethod
+    def _ranges(p: np.ndarray) -> List[tuple2float]:
+        return [(float(p[i]), float(p[i + 1])) for i in range(0, len(p), 2)]
+
+    def matches(self, ranges: List[tuple2float]) -> bool:
+        """
+        Whether the plan applies to the ranges.
+
+        Args:
+            ranges: list of (min, max) ranges
+
+        Returns:
+            True if the range bounds have the same signs as those of the reference ranges.
+        """
+        return range_signs(ranges) == self.signs
+
+    @timed("parse")
+    def replay(self, ranges: List[tuple2float]) -> Tuple[Optional[PolyhedralIoContract], bool]:
+        """
+        Replays the plan for the ranges, without composing the scenario.
+
+        Args:
+            ranges: list of (min, max) ranges
+
+        Returns:
+            The replayed contract, or None if the plan does not apply or the replayed contract is infeasible,
+            and whether the replay is one of those sampled to `confirm` with the composition.
+        """
+        if not self.valid or not self.matches(ranges):
+            return None, False
+        p = np.array(ranges, dtype=float).flatten()
+        variables = self.input_vars + self.output_vars
+        a_mat, a_vec = self.a.evaluate(p)
+        g_mat, g_vec = self.g.evaluate(p)
+        c = PolyhedralIoContract(
+            assumptions=PolyhedralTermList.polytope_to_termlist(a_mat, a_vec, variables),
+            guarantees=PolyhedralTermList.polytope_to_termlist(g_mat, g_vec, variables),
+            input_vars=self.input_vars,
+            output_vars=self.output_vars,
+            simplify=False,
+        )
+        self.replays += 1
+        if ConstraintSystem.from_contract(c).is_feasible() is not True:
+            return None, False
+        return c, bool(self.check_every) and (self.replays - 1) % self.check_every == 0
+
+    def confirm(self, ranges: List[tuple2float], expected: PolyhedralIoContract) -> bool:
+        """
+        Compares the plan with the composition of the scenario, and stops replaying it if they differ.
+
+        Args:
+            ranges: list of (min, max) ranges
+            expected: the composed scenario contract for the ranges
+
+        Returns:
+            Whether the plan replays the composition for the ranges.
+        """
+        self.valid = self.valid and self._fits(expected, np.array(ranges, dtype=float).flatten())
+        return self.valid
+
+    def instantiate(self, ranges: List[tuple2float]) -> PolyhedralIoContract:
+        """
+        Replays the plan for the ranges, or composes the scenario if the plan does not apply
+        or the replay fails its checks.
+
+        Args:
+            ranges: list of (min, max) ranges
+
+        Returns:
+            The scenario contract for the ranges.
+        """
+        c, sampled = self.replay(ranges)
+        if c is None:
+            return self.generate(ranges)
+        if sampled:
+            expected = self.generate(ranges)
+            self.confirm(ranges, expected)
+            return expected
+        return c
+
+
 named_contract_t = Tuple[str, PolyhedralIoContract]
 
 named_contracts_t = List[named_contract_t]
@@ -172,7 +625,68 @@ schedule_result_t = Union[FailedMerges, Schedule]
 schedule_results_t = Tuple[List[FailedMerges], List[Schedule]]
 
 
-def perform_merges_seq(c: PolyhedralIoContract, c_seq: named_contracts_t) -> merge_result_t:
+@timed("merge")
+def perform_merges_seq(
+    c: PolyhedralIoContract,
+    c_seq: named_contracts_t,
+    system: Optional["ConstraintSystem"] = None,
+    point: Union[np.ndarray, None, "Undecided"] = None,
+) -> merge_result_t:
+    """
+    Merges a sequence of named contracts into a contract, stopping at the first merge that fails.
+
+    The merge chain is checked incrementally: each named contract only adds its rows to the
+    accumulated constraint system, and the LP is skipped whenever the feasible point found for the
+    previous merges also satisfies the new rows. The guarantees are simplified once at the end.
+    If an LP is undecided or pacti rejects a merge the LPs found feasible, the contracts are merged
+    with `perform_merges_seq_naive` instead.
+
+    Args:
+        c: a contract
+        c_seq: the named contracts to merge, in order
+        system: the constraint system of c, if already built, e.g., shared by the analyses of a scenario
+        point: the result of `system.feasible_point()`, if system is given
+
+    Returns:
+        The merged contract, or a `FailedMerges` with the contract merged so far,
+        the names of the merged contracts and the contract that could not be merged.
+    """
+    if system is None:
+        system = ConstraintSystem.from_contract(c)
+        point = system.feasible_point()
+    if point is None or point is undecided:
+        return perform_merges_seq_naive(c, c_seq)
+    merged: named_contracts_t = []
+    for cn, cc in c_seq:
+        system = system.extended(cc)
+        point = system.feasible_point(point)
+        if point is undecided:
+            return perform_merges_seq_naive(c, c_seq)
+        if point is None:
+            try:
+                return FailedMerges(merge_all(c, [mc for _, mc in merged]), [mn for mn, _ in merged], cn, cc)
+            except ValueError:
+                return perform_merges_seq_naive(c, c_seq)
+        merged.append((cn, cc))
+    try:
+        return merge_all(c, [mc for _, mc in merged])
+    except ValueError:
+        return perform_merges_seq_naive(c, c_seq)
+
+
+@timed("merge")
+def perform_merges_seq_naive(c: PolyhedralIoContract, c_seq: named_contracts_t) -> merge_result_t:
+    """
+    Merges a sequence of named contracts into a contract one at a time, stopping at the first merge that fails.
+
+    Args:
+        c: a contract
+        c_seq: the named contracts to merge, in order
+
+    Returns:
+        The merged contract, or a `FailedMerges` with the contract merged so far,
+        the names of the merged contracts and the contract that could not be merged.
+    """
     names: contract_names_t = []
     current: PolyhedralIoContract = c
     for cn, cc in c_seq:
@@ -184,6 +698,215 @@ def perform_merges_seq(c: PolyhedralIoContract, c_seq: named_contracts_t) -> mer
     return current
 
 
+@timed("merge")
+def merge_all(c: PolyhedralIoContract, cs: List[PolyhedralIoContract]) -> PolyhedralIoContract:
+    """
+    Merges contracts into a contract, simplifying the guarantees only once.
+
+    Args:
+        c: a contract
+        cs: the contracts to merge with c
+
+    Returns:
+        A contract with the same constraints as merging c with each contract of cs in turn.
+
+    Raises:
+        ValueError: The merged constraints are unsatisfiable.
+    """
+    if not cs:
+        return c
+    merged = c
+    for cc in cs:
+        merged = merge_unsimplified(merged, cc)
+    record_contract(merged)
+    with phase("simplify"):
+        return PolyhedralIoContract(
+            assumptions=merged.a,
+            guarantees=merged.g,
+            input_vars=merged.inputvars,
+            output_vars=merged.outputvars,
+        )
+
+
+@timed("merge")
+def merge_unsimplified(c1: PolyhedralIoContract, c2: PolyhedralIoContract) -> PolyhedralIoContract:
+    """
+    Merges two contracts without simplifying the guarantees w.r.t. the assumptions.
+
+    Args:
+        c1: a contract
+        c2: another contract
+
+    Returns:
+        A contract with the same constraints as c1.merge(c2), without any feasibility check.
+    """
+    return PolyhedralIoContract(
+        assumptions=c1.a | c2.a,
+        guarantees=c1.g | c2.g,
+        input_vars=list_union(c1.inputvars, c2.inputvars),
+        output_vars=list_union(c1.outputvars, c2.outputvars),
+        simplify=False,
+    )
+
+
+class Undecided:
+    """The outcome of a feasibility LP that the solver neither solved nor proved infeasible."""
+
+    def __repr__(self) -> str:
+        return "undecided"
+
+
+# Returned by `ConstraintSystem.feasible_point`, e.g., when the solver reached its iteration limit.
+undecided = Undecided()
+
+
+class ConstraintSystem:
+    """
+    The assumptions and guarantees of a contract as variable bounds and a matrix-vector pair,
+    extensible with the constraints of other contracts for checking the feasibility of merges.
+
+    Single-variable terms are stored as bounds so that constraint systems differing only by
+    such terms share the same matrix.
+    """
+
+    def __init__(
+        self, columns: Dict[str, int], a: np.ndarray, b: np.ndarray, lb: np.ndarray, ub: np.ndarray
+    ):
+        """
+        Constructs a constraint system a @ x <= b, lb <= x <= ub.
+
+        Args:
+            columns: the column index of each variable name
+            a: constraint matrix
+            b: constraint vector
+            lb: variable lower bounds
+            ub: variable upper bounds
+        """
+        self.columns = columns
+        self.a = a
+        self.b = b
+        self.lb = lb
+        self.ub = ub
+
+    @staticmethod
+    def from_contract(c: PolyhedralIoContract) -> "ConstraintSystem":
+        """
+        Constructs the constraint system of the assumptions and guarantees of a contract.
+
+        Args:
+            c: a contract
+
+        Returns:
+            The constraint system.
+        """
+        empty = ConstraintSystem({}, np.zeros((0, 0)), np.zeros(0), np.zeros(0), np.zeros(0))
+        return empty.extended(c)
+
+    def extended(self, c: PolyhedralIoContract) -> "ConstraintSystem":
+        """
+        Adds the constraints of a contract, as for merging it.
+
+        Args:
+            c: a contract
+
+        Returns:
+            A new constraint system; the matrix is shared with self if c only has single-variable terms.
+        """
+        columns = self.columns
+        new_vars = [v.name for v in c.vars if v.name not in columns]
+        if new_vars:
+            columns = dict(columns)
+            for name in new_vars:
+                columns[name] = len(columns)
+        n = len(columns)
+        lb = np.concatenate([self.lb, np.full(n - len(self.lb), -np.inf)])
+        ub = np.concatenate([self.ub, np.full(n - len(self.ub), np.inf)])
+        rows: List[PolyhedralTerm] = []
+        for t in c.a.terms + c.g.terms:
+            if len(t.variables) == 1:
+                ((v, coeff),) = t.variables.items()
+                if coeff > 0:
+                    ub[columns[v.name]] = min(ub[columns[v.name]], t.constant / coeff)
+                else:
+                    lb[columns[v.name]] = max(lb[columns[v.name]], t.constant / coeff)
+            else:
+                rows.append(t)
+        a = self.a
+        if new_vars:
+            a = np.hstack([a, np.zeros((a.shape[0], n - a.shape[1]))])
+        b = self.b
+        if rows:
+            a_rows, b_rows = termlist_matrix(PolyhedralTermList(rows), columns)
+            a = np.vstack([a, a_rows])
+            b = np.concatenate([b, b_rows])
+        return ConstraintSystem(columns, a, b, lb, ub)
+
+    def satisfies(self, x: np.ndarray, tolerance: float = 1e-9) -> bool:
+        """
+        Checks whether a point satisfies the constraint system.
+
+        Args:
+            x: a point, possibly missing the coordinates of the last variables added
+            tolerance: the allowed constraint violation
+
+        Returns:
+            True if x, padded with zeros clipped to the variable bounds, satisfies all constraints.
+        """
+        x = self._padded(x)
+        return bool(
+            np.all(x >= self.lb - tolerance)
+            and np.all(x <= self.ub + tolerance)
+            and np.all(self.a @ x <= self.b + tolerance)
+        )
+
+    def _padded(self, x: np.ndarray) -> np.ndarray:
+        n = len(self.columns) - len(x)
+        if n == 0:
+            return x
+        return np.concatenate([x, np.clip(np.zeros(n), self.lb[len(x) :], self.ub[len(x) :])])
+
+    @timed("merge")
+    def feasible_point(self, x0: Optional[np.ndarray] = None) -> Union[np.ndarray, None, Undecided]:
+        """
+        Finds a point satisfying the constraint system, reusing a candidate point if it is feasible.
+
+        Args:
+            x0: a candidate point, typically a feasible point of a constraint system this one extends
+
+        Returns:
+            A feasible point, None if the constraints are infeasible, or `undecided` if the LP solver
+            neither found a point nor proved infeasibility.
+        """
+        if np.any(self.lb > self.ub):
+            return None
+        if x0 is not None and self.satisfies(x0):
+            return self._padded(x0)
+        if len(self.b) == 0:
+            return self._padded(np.zeros(0))
+        res = linprog(
+            c=np.zeros(len(self.columns)),
+            A_ub=self.a,
+            b_ub=self.b,
+            bounds=np.column_stack([self.lb, self.ub]),
+        )
+        # Linprog's status 0: optimal, 2: infeasible; the others, e.g., an iteration limit, decide nothing.
+        if res.status == 0:
+            return res.x
+        if res.status == 2:
+            return None
+        return undecided
+
+    def is_feasible(self) -> Optional[bool]:
+        """
+        Checks the feasibility of the constraint system with a linear program.
+
+        Returns:
+            Whether the constraints are feasible, or None if the LP is undecided.
+        """
+        point = self.feasible_point()
+        return None if point is undecided else point is not None
+
+
 def aggregate_schedule_results(srs: List[schedule_result_t]) -> schedule_results_t:
     f: List[FailedMerges] = sorted([r for r in srs if isinstance(r, FailedMerges)], key=lambda fm: -len(fm.merged))
     s: List[Schedule] = [r for r in srs if isinstance(r, Schedule)]
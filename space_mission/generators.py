@@ -2,68 +2,89 @@ from pacti.contracts import PolyhedralIoContract
 from pacti_instrumentation.pacti_counters import PactiInstrumentationData
 import numpy as np
 from contract_utils import *
+import functools
+from run_metrics import Measured, RunReport, count_operations, measure_task, phase, record_contract
+from typing import Any, Callable, Dict, Iterable, Optional
 
 
-compose_right_to_left = True
-
-nb_contracts = 0
-nb_merge = 0
-nb_compose = 0
-
 # epsilon = 1e-6
 epsilon = 0
 
 
-def reset_nb_counts() -> None:
-    global nb_contracts
-    nb_contracts = 0
-    global nb_merge
-    nb_merge = 0
-    global nb_compose
-    nb_compose = 0
-
-
-def print_counts() -> None:
-    print(f"{nb_contracts} contracts; {nb_compose} compositions; {nb_merge} merges.")
-
-
 # Power viewpoint
 
 
+# The contract templates below are parsed once at import time;
+# the step generators instantiate them without parsing any constraint string.
+
 # Parameters:
 # - s: index of the timeline variables
 # - generation: (min, max) rate of battery charge during the task instance
+chrg_power_template = ContractTemplate(
+    input_vars=[
+        "soc{s}_entry",  # initial battery SOC
+        "duration_charging{s}",  # variable task duration
+    ],
+    output_vars=[
+        "soc{s}_exit",  # final battery SOC
+    ],
+    assumptions=[
+        # Task has a positive scheduled duration
+        "0 <= duration_charging{s}",
+        # Lower and upper bound on entry soc
+        "0 <= soc{s}_entry <= 100.0",
+        # Battery should not overcharge
+        "soc{s}_entry + {generation[1]}*duration_charging{s} <= 100",
+    ],
+    guarantees=[
+        # duration*generation(min) <= soc{exit} - soc{entry} <= duration*generation(max)
+        "{generation[0]}*duration_charging{s} <= soc{s}_exit - soc{s}_entry <= {generation[1]}*duration_charging{s}",
+        # Battery cannot exceed maximum SOC
+        "soc{s}_exit <= 100",
+        # Battery should not completely discharge
+        "0 <= soc{s}_exit",
+    ],
+    params={"generation": 2},
+)
+
+
 def CHRG_power(s: int, generation: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"soc{s}_entry",  # initial battery SOC
-            f"duration_charging{s}",  # variable task duration
-        ],
-        output_vars=[
-            f"soc{s}_exit",  # final battery SOC
-        ],
-        assumptions=[
-            # Task has a positive scheduled duration
-            f"0 <= duration_charging{s}",
-            # Lower and upper bound on entry soc
-            f"0 <= soc{s}_entry <= 100.0",
-            # Battery should not overcharge
-            f"soc{s}_entry + {generation[1]}*duration_charging{s} <= 100",
-        ],
-        guarantees=[
-            # duration*generation(min) <= soc{exit} - soc{entry} <= duration*generation(max)
-            f"{generation[0]}*duration_charging{s} <= soc{s}_exit - soc{s}_entry <= {generation[1]}*duration_charging{s}",
-            # Battery cannot exceed maximum SOC
-            f"soc{s}_exit <= 100",
-            # Battery should not completely discharge
-            f"0 <= soc{s}_exit",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return chrg_power_template.instantiate(s=s, generation=generation)
 
-    # Parameters:
+
+# Parameters:
+# - s: index of the timeline variables
+# - task: task name
+# - consumption: (min, max) rate of battery discharge during the task instance
+power_consumer_template = ContractTemplate(
+    input_vars=[
+        "soc{s}_entry",  # initial battery SOC
+        "duration_{task}{s}",  # variable task duration
+    ],
+    output_vars=[
+        "soc{s}_exit",  # final battery SOC
+    ],
+    assumptions=[
+        # Task has a positive scheduled duration
+        "0 <= duration_{task}{s}",
+        # Upper bound on entry soc
+        "soc{s}_entry <= 100.0",
+        # Lower bound on entry soc
+        "0 <= soc{s}_entry",
+        # Battery has enough energy for worst-case consumption throughout the task instance
+        "soc{s}_entry >= {consumption[1]}*duration_{task}{s}",
+    ],
+    guarantees=[
+        # The state of charge decrease, soc{entry} - soc{exit}, is bounded by the duration * min/max consumption rate
+        "{consumption[0]}*duration_{task}{s} <= soc{s}_entry - soc{s}_exit <= {consumption[1]}*duration_{task}{s}",
+        # Battery cannot exceed maximum SOC
+        "soc{s}_exit <= 100",
+        # Battery should not completely discharge
+        "0 <= soc{s}_exit",
+    ],
+    params={"consumption": 2},
+)
 
 
 def power_consumer(s: int, task: str, consumption: tuple[float, float]) -> PolyhedralIoContract:
@@ -77,35 +98,8 @@ def power_consumer(s: int, task: str, consumption: tuple[float, float]) -> Polyh
     Returns:
         PolyhedralIoContract: The discharge contract
     """
-    global nb_contracts
-    nb_contracts += 1
-    return PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"soc{s}_entry",  # initial battery SOC
-            f"duration_{task}{s}",  # variable task duration
-        ],
-        output_vars=[
-            f"soc{s}_exit",  # final battery SOC
-        ],
-        assumptions=[
-            # Task has a positive scheduled duration
-            f"0 <= duration_{task}{s}",
-            # Upper bound on entry soc
-            f"soc{s}_entry <= 100.0",
-            # Lower bound on entry soc
-            f"0 <= soc{s}_entry",
-            # Battery has enough energy for worst-case consumption throughout the task instance
-            f"soc{s}_entry >= {consumption[1]}*duration_{task}{s}",
-        ],
-        guarantees=[
-            # The state of charge decrease, soc{entry} - soc{exit}, is bounded by the duration * min/max consumption rate
-            f"{consumption[0]}*duration_{task}{s} <= soc{s}_entry - soc{s}_exit <= {consumption[1]}*duration_{task}{s}",
-            # Battery cannot exceed maximum SOC
-            f"soc{s}_exit <= 100",
-            # Battery should not completely discharge
-            f"0 <= soc{s}_exit",
-        ],
-    )
+    count_operations(contracts=1)
+    return power_consumer_template.instantiate(s=s, task=task, consumption=consumption)
 
 
 power_variables = ["soc"]
@@ -120,8 +114,7 @@ def generate_power_scenario(
     tcmdv_cons: tuple[float, float],
     rename_outputs: bool = False,
 ) -> PolyhedralIoContract:
-    global nb_compose
-    nb_compose += 4  # scenario_sequence
+    count_operations(compositions=4)
 
     s1 = power_consumer(s=s, task="dsn", consumption=dsn_cons)
     s2 = CHRG_power(s=s + 1, generation=chrg_gen)
@@ -129,16 +122,7 @@ def generate_power_scenario(
     s4 = power_consumer(s=s + 3, task="tcm_h", consumption=tcmh_cons)
     s5 = power_consumer(s=s + 4, task="tcm_dv", consumption=tcmdv_cons)
 
-    if compose_right_to_left:
-        steps2 = scenario_sequence(c1=s4, c2=s5, variables=power_variables, c1index=s + 3)
-        steps3 = scenario_sequence(c1=s3, c2=steps2, variables=power_variables, c1index=s + 2)
-        steps4 = scenario_sequence(c1=s2, c2=steps3, variables=power_variables, c1index=s + 1)
-        steps5 = scenario_sequence(c1=s1, c2=steps4, variables=power_variables, c1index=s)
-    else:
-        steps2 = scenario_sequence(c1=s1, c2=s2, variables=power_variables, c1index=s)
-        steps3 = scenario_sequence(c1=steps2, c2=s3, variables=power_variables, c1index=s + 1)
-        steps4 = scenario_sequence(c1=steps3, c2=s4, variables=power_variables, c1index=s + 2)
-        steps5 = scenario_sequence(c1=steps4, c2=s5, variables=power_variables, c1index=s + 3)
+    steps5 = compose_sequence([s1, s2, s3, s4, s5], variables=power_variables, starts=[s, s + 1, s + 2, s + 3, s + 4])
 
     if rename_outputs:
         return steps5.rename_variables([(f"soc{s+4}_exit", f"output_soc{s+4}")])
@@ -151,88 +135,94 @@ def generate_power_scenario(
 
 # - s: start index of the timeline variables
 # - speed: (min, max) downlink rate during the task instance
+dsn_data_template = ContractTemplate(
+    input_vars=[
+        "d{s}_entry",  # initial data volume
+        "duration_dsn{s}",  # variable task duration
+    ],
+    output_vars=[
+        "d{s}_exit",  # final data volume
+    ],
+    assumptions=[
+        # Task has a positive scheduled duration
+        "duration_dsn{s} >= 0",
+        # downlink data lower,upper bound
+        "0 <= d{s}_entry <= 100",
+    ],
+    guarantees=[
+        # duration*speed(min) <= d{entry} - d{exit} <= duration*speed(max)
+        "{speed[0]}*duration_dsn{s} <= d{s}_entry - d{s}_exit <= {speed[1]}*duration_dsn{s}",
+        # downlink transmits at most all the data.
+        "d{s}_exit >= 0",
+    ],
+    params={"speed": 2},
+)
+
+
 def DSN_data(s: int, speed: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"d{s}_entry",  # initial data volume
-            f"duration_dsn{s}",  # variable task duration
-        ],
-        output_vars=[
-            f"d{s}_exit",  # final data volume
-        ],
-        assumptions=[
-            # Task has a positive scheduled duration
-            f"duration_dsn{s} >= 0",
-            # downlink data lower,upper bound
-            f"0 <= d{s}_entry <= 100",
-        ],
-        guarantees=[
-            # duration*speed(min) <= d{entry} - d{exit} <= duration*speed(max)
-            f"{speed[0]}*duration_dsn{s} <= d{s}_entry - d{s}_exit <= {speed[1]}*duration_dsn{s}",
-            # downlink transmits at most all the data.
-            f"d{s}_exit >= 0",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return dsn_data_template.instantiate(s=s, speed=speed)
 
 
 # Parameters:
 # - s: start index of the timeline variables
 # - generation: (min, max) rate of small body observations during the task instance
+sbo_science_storage_template = ContractTemplate(
+    input_vars=[
+        "d{s}_entry",  # initial data storage volume
+        "duration_sbo{s}",  # knob variable for SBO duration
+    ],
+    output_vars=[
+        "d{s}_exit",  # final data storage volume
+    ],
+    assumptions=[
+        # Task has a positive scheduled duration
+        "duration_sbo{s} >= 0",
+        # There is enough data storage available
+        "d{s}_entry + {generation[1]}*duration_sbo{s} <= 100",
+        # downlink data lower bound
+        "0 <= d{s}_entry",
+    ],
+    guarantees=[
+        # The increase in data, d{exit} - d{entry}, has a lower/upper bound as the min/max generation rate * duration
+        "{generation[0]}*duration_sbo{s} <= d{s}_exit - d{s}_entry <= {generation[1]}*duration_sbo{s}",
+        # Data volume cannot exceed the available storage capacity
+        "d{s}_exit <= 100",
+    ],
+    params={"generation": 2},
+)
+
+
 def SBO_science_storage(s: int, generation: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"d{s}_entry",  # initial data storage volume
-            f"duration_sbo{s}",  # knob variable for SBO duration
-        ],
-        output_vars=[
-            f"d{s}_exit",  # final data storage volume
-        ],
-        assumptions=[
-            # Task has a positive scheduled duration
-            f"duration_sbo{s} >= 0",
-            # There is enough data storage available
-            f"d{s}_entry + {generation[1]}*duration_sbo{s} <= 100",
-            # downlink data lower bound
-            f"0 <= d{s}_entry",
-        ],
-        guarantees=[
-            # The increase in data, d{exit} - d{entry}, has a lower/upper bound as the min/max generation rate * duration
-            f"{generation[0]}*duration_sbo{s} <= d{s}_exit - d{s}_entry <= {generation[1]}*duration_sbo{s}",
-            # Data volume cannot exceed the available storage capacity
-            f"d{s}_exit <= 100",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return sbo_science_storage_template.instantiate(s=s, generation=generation)
+
+
+sbo_science_comulative_template = ContractTemplate(
+    input_vars=[
+        "c{s}_entry",  # initial cumulative data volume
+        "duration_sbo{s}",  # knob variable for SBO duration
+    ],
+    output_vars=[
+        "c{s}_exit",  # final cumulative data volume
+    ],
+    assumptions=[
+        # Task has a positive scheduled duration
+        "duration_sbo{s} >= 0",
+        # cumulative data lower bound
+        "c{s}_entry >= 0",
+    ],
+    guarantees=[
+        # The increase in cummulated data, c{exit} - c{entry}, has a lower/upper bound as the min/max generation rate * duration
+        "{generation[0]}*duration_sbo{s} <= c{s}_exit - c{s}_entry <= {generation[1]}*duration_sbo{s}",
+    ],
+    params={"generation": 2},
+)
 
 
 def SBO_science_comulative(s: int, generation: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"c{s}_entry",  # initial cumulative data volume
-            f"duration_sbo{s}",  # knob variable for SBO duration
-        ],
-        output_vars=[
-            f"c{s}_exit",  # final cumulative data volume
-        ],
-        assumptions=[
-            # Task has a positive scheduled duration
-            f"duration_sbo{s} >= 0",
-            # cumulative data lower bound
-            f"c{s}_entry >= 0",
-        ],
-        guarantees=[
-            # The increase in cummulated data, c{exit} - c{entry}, has a lower/upper bound as the min/max generation rate * duration
-            f"{generation[0]}*duration_sbo{s} <= c{s}_exit - c{s}_entry <= {generation[1]}*duration_sbo{s}",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return sbo_science_comulative_template.instantiate(s=s, generation=generation)
 
 
 science_variables = ["d", "c"]
@@ -241,12 +231,7 @@ science_variables = ["d", "c"]
 def generate_science_scenario(
     s: int, dsn_speed: tuple[float, float], sbo_gen: tuple[float, float], rename_outputs: bool = False
 ) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 7  # nochange_contract
-    global nb_merge
-    nb_merge += 5
-    global nb_compose
-    nb_compose += 4  # scenario_sequence
+    count_operations(contracts=7, merges=5, compositions=4)
 
     s1 = DSN_data(s=s, speed=dsn_speed).merge(nochange_contract(s=s, name="c"))
     s2 = nochange_contract(s=s + 1, name="d").merge(nochange_contract(s=s + 1, name="c"))
@@ -254,16 +239,7 @@ def generate_science_scenario(
     s4 = nochange_contract(s=s + 3, name="d").merge(nochange_contract(s=s + 3, name="c"))
     s5 = nochange_contract(s=s + 4, name="d").merge(nochange_contract(s=s + 4, name="c"))
 
-    if compose_right_to_left:
-        steps2 = scenario_sequence(c1=s4, c2=s5, variables=science_variables, c1index=s + 3)
-        steps3 = scenario_sequence(c1=s3, c2=steps2, variables=science_variables, c1index=s + 2)
-        steps4 = scenario_sequence(c1=s2, c2=steps3, variables=science_variables, c1index=s + 1)
-        steps5 = scenario_sequence(c1=s1, c2=steps4, variables=science_variables, c1index=s)
-    else:
-        steps2 = scenario_sequence(c1=s1, c2=s2, variables=science_variables, c1index=s)
-        steps3 = scenario_sequence(c1=steps2, c2=s3, variables=science_variables, c1index=s + 1)
-        steps4 = scenario_sequence(c1=steps3, c2=s4, variables=science_variables, c1index=s + 2)
-        steps5 = scenario_sequence(c1=steps4, c2=s5, variables=science_variables, c1index=s + 3)
+    steps5 = compose_sequence([s1, s2, s3, s4, s5], variables=science_variables, starts=[s, s + 1, s + 2, s + 3, s + 4])
 
     if rename_outputs:
         return steps5.rename_variables(
@@ -284,128 +260,136 @@ def generate_science_scenario(
 # Navigation viewpoint
 
 
+uncertainty_generating_nav_template = ContractTemplate(
+    input_vars=[
+        "u{s}_entry",  # initial trajectory estimation uncertainty
+        "r{s}_entry",  # initial relative trajectory distance
+    ],
+    output_vars=[
+        "u{s}_exit",  # final trajectory estimation uncertainty
+        "r{s}_exit",  # final relative trajectory distance
+    ],
+    assumptions=[
+        # 0 <= u{s}_entry <= 100
+        "0 <= u{s}_entry",
+        # " u{s}_entry <= 100",
+        # 0 <= r{s}_entry <= 100
+        "0 <= r{s}_entry",
+        # " r{s}_entry <= 100",
+    ],
+    guarantees=[
+        # The increase in uncertainty, u{exit} - u{entry}, has lower/upper bound in the min/max noise.
+        "{noise[0]} <= u{s}_exit - u{s}_entry <= {noise[1]}",
+        # no change to relative trajectory distance
+        # NFR
+        "| r{s}_exit - r{s}_entry | <= {epsilon}",
+        # Lower-bound on the trajectory estimation uncertainty
+        "0 <= u{s}_exit",
+    ],
+    params={"noise": 2, "epsilon": 1},
+)
+
+
 def uncertainty_generating_nav(s: int, noise: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"u{s}_entry",  # initial trajectory estimation uncertainty
-            f"r{s}_entry",  # initial relative trajectory distance
-        ],
-        output_vars=[
-            f"u{s}_exit",  # final trajectory estimation uncertainty
-            f"r{s}_exit",  # final relative trajectory distance
-        ],
-        assumptions=[
-            # 0 <= u{s}_entry <= 100
-            f"0 <= u{s}_entry",
-            # f" u{s}_entry <= 100",
-            # 0 <= r{s}_entry <= 100
-            f"0 <= r{s}_entry",
-            # f" r{s}_entry <= 100",
-        ],
-        guarantees=[
-            # The increase in uncertainty, u{exit} - u{entry}, has lower/upper bound in the min/max noise.
-            f"{noise[0]} <= u{s}_exit - u{s}_entry <= {noise[1]}",
-            # no change to relative trajectory distance
-            # NFR
-            f"| r{s}_exit - r{s}_entry | <= {epsilon}",
-            # Lower-bound on the trajectory estimation uncertainty
-            f"0 <= u{s}_exit",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return uncertainty_generating_nav_template.instantiate(s=s, noise=noise, epsilon=epsilon)
 
 
 # Parameters:
 # - s: start index of the timeline variables
 # - improvement: rate of trajectory estimation uncertainty improvement during the task instance
+sbo_nav_uncertainty_template = ContractTemplate(
+    input_vars=[
+        "u{s}_entry",  # initial trajectory uncertainty
+        "duration_sbo{s}",  # knob variable for SBO duration
+    ],
+    output_vars=[
+        "u{s}_exit",  # final trajectory uncertainty
+    ],
+    assumptions=[
+        # Task has a positive scheduled duration
+        "0 <= duration_sbo{s}",
+        "0 <= u{s}_entry",
+        # Upper-bound on the trajectory estimation uncertainty
+        # "u{s}_entry <= 100",
+    ],
+    guarantees=[
+        # upper bound u{s}_exit <= 100
+        # "u{s}_exit <= 100",
+        # duration*improvement(min) <= u{entry} - u{exit} <= duration*improvement(max)
+        "{improvement[0]}*duration_sbo{s} <= u{s}_entry - u{s}_exit <= {improvement[1]}*duration_sbo{s}",
+        # Lower-bound on the trajectory estimation uncertainty
+        "0 <= u{s}_exit",
+    ],
+    params={"improvement": 2},
+)
+
+
 def SBO_nav_uncertainty(s: int, improvement: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"u{s}_entry",  # initial trajectory uncertainty
-            f"duration_sbo{s}",  # knob variable for SBO duration
-        ],
-        output_vars=[
-            f"u{s}_exit",  # final trajectory uncertainty
-        ],
-        assumptions=[
-            # Task has a positive scheduled duration
-            f"0 <= duration_sbo{s}",
-            f"0 <= u{s}_entry",
-            # Upper-bound on the trajectory estimation uncertainty
-            # f"u{s}_entry <= 100",
-        ],
-        guarantees=[
-            # upper bound u{s}_exit <= 100
-            # f"u{s}_exit <= 100",
-            # duration*improvement(min) <= u{entry} - u{exit} <= duration*improvement(max)
-            f"{improvement[0]}*duration_sbo{s} <= u{s}_entry - u{s}_exit <= {improvement[1]}*duration_sbo{s}",
-            # Lower-bound on the trajectory estimation uncertainty
-            f"0 <= u{s}_exit",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return sbo_nav_uncertainty_template.instantiate(s=s, improvement=improvement)
+
+
+tcm_navigation_deltav_uncertainty_template = ContractTemplate(
+    input_vars=[
+        "u{s}_entry",  # initial trajectory estimation uncertainty
+        "duration_tcm_dv{s}",  # knob variable for TCM deltav duration
+    ],
+    output_vars=[
+        "u{s}_exit",  # final trajectory estimation uncertainty
+    ],
+    assumptions=[
+        # Task has a positive scheduled duration
+        "0 <= duration_tcm_dv{s}",
+        # 0 <= u{s}_entry <= 100
+        "0 <= u{s}_entry",
+        # " u{s}_entry <= 100",
+    ],
+    guarantees=[
+        # upper bound u{s}_exit <= 100
+        # "u{s}_exit <= 100",
+        # noise(min) <= u{exit} - u{entry} <= noise(max)
+        "{noise[0]} duration_tcm_dv{s} <= u{s}_exit - u{s}_entry <= {noise[1]} duration_tcm_dv{s}",
+        # Lower-bound on the trajectory estimation uncertainty
+        "0 <= u{s}_exit",
+    ],
+    params={"noise": 2},
+)
 
 
 def TCM_navigation_deltav_uncertainty(s: int, noise: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"u{s}_entry",  # initial trajectory estimation uncertainty
-            f"duration_tcm_dv{s}",  # knob variable for TCM deltav duration
-        ],
-        output_vars=[
-            f"u{s}_exit",  # final trajectory estimation uncertainty
-        ],
-        assumptions=[
-            # Task has a positive scheduled duration
-            f"0 <= duration_tcm_dv{s}",
-            # 0 <= u{s}_entry <= 100
-            f"0 <= u{s}_entry",
-            # f" u{s}_entry <= 100",
-        ],
-        guarantees=[
-            # upper bound u{s}_exit <= 100
-            # f"u{s}_exit <= 100",
-            # noise(min) <= u{exit} - u{entry} <= noise(max)
-            f"{noise[0]} duration_tcm_dv{s} <= u{s}_exit - u{s}_entry <= {noise[1]} duration_tcm_dv{s}",
-            # Lower-bound on the trajectory estimation uncertainty
-            f"0 <= u{s}_exit",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return tcm_navigation_deltav_uncertainty_template.instantiate(s=s, noise=noise)
+
+
+tcm_navigation_deltav_progress_template = ContractTemplate(
+    input_vars=[
+        "r{s}_entry",  # initial trajectory relative distance
+        "duration_tcm_dv{s}",  # knob variable for TCM deltav duration
+    ],
+    output_vars=[
+        "r{s}_exit",  # final trajectory relative distance
+    ],
+    assumptions=[
+        # upper bound on trajectory relative distance
+        "0 <= r{s}_entry",
+        # "r{s}_entry <= 100",
+    ],
+    guarantees=[
+        # upper bound r{s}_exit <= 100
+        # "r{s}_exit <= 100",
+        # duration*improvement(min) <= r{entry} - r{exit} <= duration*improvement(max)
+        "{progress[0]}*duration_tcm_dv{s} <= r{s}_entry - r{s}_exit <= {progress[1]}*duration_tcm_dv{s}",
+        # lower bound on trajectory relative distance
+        "0 <= r{s}_exit",
+    ],
+    params={"progress": 2},
+)
 
 
 def TCM_navigation_deltav_progress(s: int, progress: tuple[float, float]) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 1
-    spec = PolyhedralIoContract.from_strings(
-        input_vars=[
-            f"r{s}_entry",  # initial trajectory relative distance
-            f"duration_tcm_dv{s}",  # knob variable for TCM deltav duration
-        ],
-        output_vars=[
-            f"r{s}_exit",  # final trajectory relative distance
-        ],
-        assumptions=[
-            # upper bound on trajectory relative distance
-            f"0 <= r{s}_entry",
-            # f"r{s}_entry <= 100",
-        ],
-        guarantees=[
-            # upper bound r{s}_exit <= 100
-            # f"r{s}_exit <= 100",
-            # duration*improvement(min) <= r{entry} - r{exit} <= duration*improvement(max)
-            f"{progress[0]}*duration_tcm_dv{s} <= r{s}_entry - r{s}_exit <= {progress[1]}*duration_tcm_dv{s}",
-            # lower bound on trajectory relative distance
-            f"0 <= r{s}_exit",
-        ],
-    )
-    return spec
+    count_operations(contracts=1)
+    return tcm_navigation_deltav_progress_template.instantiate(s=s, progress=progress)
 
 
 navigation_variables = ["u", "r"]
@@ -420,12 +404,7 @@ def generate_navigation_scenario(
     tcm_dv_progress: tuple[float, float],
     rename_outputs: bool = False,
 ) -> PolyhedralIoContract:
-    global nb_contracts
-    nb_contracts += 3  # nochange_contract
-    global nb_merge
-    nb_merge += 3
-    global nb_compose
-    nb_compose += 4  # scenario_sequence
+    count_operations(contracts=3, merges=3, compositions=4)
     s1 = uncertainty_generating_nav(s=s, noise=dsn_noise)
     s2 = uncertainty_generating_nav(s=s + 1, noise=chrg_noise)
     s3 = SBO_nav_uncertainty(s=s + 2, improvement=sbo_imp).merge(nochange_contract(s=s + 2, name="r"))
@@ -434,16 +413,7 @@ def generate_navigation_scenario(
         TCM_navigation_deltav_progress(s=s + 4, progress=tcm_dv_progress)
     )
 
-    if compose_right_to_left:
-        steps2 = scenario_sequence(c1=s4, c2=s5, variables=navigation_variables, c1index=s + 3)
-        steps3 = scenario_sequence(c1=s3, c2=steps2, variables=navigation_variables, c1index=s + 2)
-        steps4 = scenario_sequence(c1=s2, c2=steps3, variables=navigation_variables, c1index=s + 1)
-        steps5 = scenario_sequence(c1=s1, c2=steps4, variables=navigation_variables, c1index=s)
-    else:
-        steps2 = scenario_sequence(c1=s1, c2=s2, variables=navigation_variables, c1index=s)
-        steps3 = scenario_sequence(c1=steps2, c2=s3, variables=navigation_variables, c1index=s + 1)
-        steps4 = scenario_sequence(c1=steps3, c2=s4, variables=navigation_variables, c1index=s + 2)
-        steps5 = scenario_sequence(c1=steps4, c2=s5, variables=navigation_variables, c1index=s + 3)
+    steps5 = compose_sequence([s1, s2, s3, s4, s5], variables=navigation_variables, starts=[s, s + 1, s + 2, s + 3, s + 4])
 
     if rename_outputs:
         return steps5.rename_variables(
@@ -463,13 +433,9 @@ def make_range(mean: float, dev: float) -> tuple2float:
     return (mean - delta, mean + delta)
 
 
-def make_scenario(
-    s: int, means: np.ndarray, devs: np.ndarray, rename_outputs: bool = False
-) -> Tuple[List[tuple2float], PolyhedralIoContract]:
-    global nb_merge
-    nb_merge += 2
+def make_scenario_from_ranges(s: int, ranges: List[tuple2float], rename_outputs: bool = False) -> PolyhedralIoContract:
+    count_operations(merges=2)
 
-    ranges = [make_range(m, d) for (m, d) in zip(means, devs)]
     scenario_pwr = generate_power_scenario(
         s,
         dsn_cons=ranges[0],
@@ -492,7 +458,21 @@ def make_scenario(
         rename_outputs=rename_outputs,
     )
 
-    return (ranges, scenario_pwr.merge(scenario_sci).merge(scenario_nav))
+    with phase("merge"):
+        scenario = scenario_pwr.merge(scenario_sci).merge(scenario_nav)
+    record_contract(scenario)
+    return scenario
+
+
+def make_scenario(
+    s: int, means: np.ndarray, devs: np.ndarray, rename_outputs: bool = False
+) -> Tuple[List[tuple2float], PolyhedralIoContract]:
+    ranges = [make_range(m, d) for (m, d) in zip(means, devs)]
+    return (ranges, make_scenario_from_ranges(s, ranges, rename_outputs))
+
+
+def make_5step_scenario_from_ranges(ranges: List[tuple2float]) -> PolyhedralIoContract:
+    return make_scenario_from_ranges(1, ranges, True)
 
 
 def generate_5step_scenario(
@@ -504,24 +484,116 @@ def generate_5step_scenario(
 all_variables = power_variables + science_variables + navigation_variables
 
 
+def make_nstep_scenario_from_ranges(ranges: List[tuple2float], steps: int) -> PolyhedralIoContract:
+    """Composes a scenario of consecutive 5-step scenarios with the same ranges.
+
+    Args:
+        ranges: list of (min, max) ranges
+        steps: the number of steps, a positive multiple of 5
+
+    Returns:
+        The scenario contract, with the exit variables of each step renamed to outputs as in the 20-step scenario.
+
+    Raises:
+        ValueError: steps is not a positive multiple of 5.
+    """
+    if steps <= 0 or steps % 5:
+        raise ValueError(f"The number of steps must be a positive multiple of 5; got: {steps=}")
+    starts = list(range(1, steps + 1, 5))
+    if len(starts) == 1:
+        return make_5step_scenario_from_ranges(ranges)
+    count_operations(compositions=len(starts) - 1)
+
+    loops = [make_scenario_from_ranges(s=s, ranges=ranges, rename_outputs=s == starts[-1]) for s in starts]
+    return compose_sequence(loops, variables=all_variables, starts=starts)
+
+
+def make_20step_scenario_from_ranges(ranges: List[tuple2float]) -> PolyhedralIoContract:
+    return make_nstep_scenario_from_ranges(ranges, 20)
+
+
+def generate_nstep_scenario(
+    mean_dev: Tuple[np.ndarray, np.ndarray], steps: int
+) -> Tuple[PactiInstrumentationData, List[tuple2float], PolyhedralIoContract]:
+    ranges = [make_range(m, d) for (m, d) in zip(mean_dev[0], mean_dev[1])]
+    c = make_nstep_scenario_from_ranges(ranges, steps)
+    return (PactiInstrumentationData().update_counts(), ranges, c)
+
+
 def generate_20step_scenario(
     mean_dev: Tuple[np.ndarray, np.ndarray]
 ) -> Tuple[PactiInstrumentationData, List[tuple2float], PolyhedralIoContract]:
-    global nb_compose
-    nb_compose += 3  # scenario_sequence
-
-    ranges, l1 = make_scenario(s=1, means=mean_dev[0], devs=mean_dev[1], rename_outputs=False)
-    _, l2 = make_scenario(s=6, means=mean_dev[0], devs=mean_dev[1], rename_outputs=False)
-    _, l3 = make_scenario(s=11, means=mean_dev[0], devs=mean_dev[1], rename_outputs=False)
-    _, l4 = make_scenario(s=16, means=mean_dev[0], devs=mean_dev[1], rename_outputs=True)
-
-    if compose_right_to_left:
-        l34 = scenario_sequence(c1=l3, c2=l4, variables=all_variables, c1index=15)
-        l234 = scenario_sequence(c1=l2, c2=l34, variables=all_variables, c1index=10)
-        l1234 = scenario_sequence(c1=l1, c2=l234, variables=all_variables, c1index=5)
-    else:
-        l12 = scenario_sequence(c1=l1, c2=l2, variables=all_variables, c1index=5)
-        l123 = scenario_sequence(c1=l12, c2=l3, variables=all_variables, c1index=10)
-        l1234 = scenario_sequence(c1=l123, c2=l4, variables=all_variables, c1index=15)
+    return generate_nstep_scenario(mean_dev, 20)
+
+
+def _compose_sample(
+    make_from_ranges: Callable[[List[tuple2float]], PolyhedralIoContract], sample: Tuple[int, List[tuple2float]]
+) -> PolyhedralIoContract:
+    return make_from_ranges(sample[1])
+
 
-    return (PactiInstrumentationData().update_counts(), ranges, l1234)
+def _sample_index(sample: Tuple[int, List[tuple2float]]) -> int:
+    return sample[0]
+
+
+def generate_scenarios_with_plans(
+    make_from_ranges: Callable[[List[tuple2float]], PolyhedralIoContract],
+    mean_devs: List[Tuple[np.ndarray, np.ndarray]],
+    probe_map: Callable[..., Iterable[Any]] = map,
+    report: Optional[RunReport] = None,
+) -> List[Tuple[PactiInstrumentationData, List[tuple2float], PolyhedralIoContract]]:
+    """Generates scenario variations by replaying one composition plan per sign pattern of the rate ranges.
+
+    The plans are compiled and replayed in this process. The probes of each plan, and the scenarios that are
+    composed rather than replayed, are composed with `probe_map`: those of the samples without a plan or whose
+    replay is infeasible, those whose replay is sampled to confirm the plan, and, once a plan is found wrong,
+    those it replayed.
+
+    Args:
+        make_from_ranges: the scenario generator, e.g., make_5step_scenario_from_ranges
+        mean_devs: the (means, devs) hyperparameter samples
+        probe_map: the ordered map function of the compositions, e.g., p_tqdm.p_map
+        report: if provided, records the metrics of the replay of each sample and of each composition of a sample;
+            the compositions of the plan probes are only counted in the wall time of the sample compiling the plan
+
+    Returns:
+        The same results as mapping generate_5step_scenario or generate_20step_scenario over the samples.
+    """
+    samples = [[make_range(m, d) for (m, d) in zip(means, devs)] for means, devs in mean_devs]
+    compose = Measured(functools.partial(_compose_sample, make_from_ranges), label=_sample_index)
+    plans: Dict[Tuple[int, ...], Optional[ScenarioPlan]] = {}
+    sample_plans: List[Optional[ScenarioPlan]] = []
+    contracts: List[Optional[PolyhedralIoContract]] = []
+    sampled: List[int] = []
+    for i, ranges in enumerate(samples):
+        with measure_task(i) as metrics:
+            signs = range_signs(ranges)
+            if signs not in plans:
+                try:
+                    plans[signs] = ScenarioPlan(make_from_ranges, ranges, probe_map=probe_map)
+                except ValueError:
+                    plans[signs] = None
+            plan = plans[signs]
+            c, confirm = plan.replay(ranges) if plan else (None, False)
+            if c is not None:
+                record_contract(c)
+        if report is not None:
+            report.add(metrics)
+        sample_plans.append(plan)
+        contracts.append(c)
+        if confirm:
+            sampled.append(i)
+
+    pending = sorted(set(sampled) | {i for i, c in enumerate(contracts) if c is None})
+    composed = set()
+    while pending:
+        for i, (metrics, c) in zip(pending, probe_map(compose, [(i, samples[i]) for i in pending])):
+            if report is not None:
+                report.add(metrics)
+            if i in sampled:
+                sample_plans[i].confirm(samples[i], c)  # type: ignore
+            contracts[i] = c
+        composed.update(pending)
+        # The replays of a plan that differed from a composition are composed too.
+        pending = [i for i, plan in enumerate(sample_plans) if i not in composed and plan and not plan.valid]
+    return [(PactiInstrumentationData().update_counts(), ranges, c) for ranges, c in zip(samples, contracts)]
@@ -5,11 +5,16 @@ from pacti_instrumentation.pacti_counters import summarize_instrumentation_data
 import numpy as np
 from contract_utils import *
 from generators import *
-from typing import List, Tuple
+from typing import Any, Callable, List, Tuple
 from schedulability import *
 
+import pathlib
 import pickle
-from p_tqdm import p_umap
+from functools import partial
+from task_scheduler import WorkerUtilization, adaptive_imap
+from result_sink import ScheduleResultSink
+from contract_store import ContractStore
+from run_metrics import Measured, RunReport
 
 run5 = True
 run20 = True
@@ -40,95 +45,109 @@ op_sampler: qmc.LatinHypercube = qmc.LatinHypercube(d=len(op_l_bounds))
 m = 100
 #m = 20
 
-K = 5  # Replace 5 with the desired group size
+# Analyze each scenario against all requirement samples in a single task.
+batch = True
+
+# Tasks are grouped into chunks of adaptive size taking about this many seconds (see task_scheduler.py).
+target_chunk_seconds = 2.0
+
+# Results are streamed to space_mission/results5 and space_mission/results20 in chunks of this many results.
+# Rerunning the script resumes from the last completed chunk, provided batch, chunk_size and the scenarios are
+# unchanged; delete these directories to start a new run.
+chunk_size = 1000
+
+# Also save all results in a single results5.data/results20.data pickle. Off by default: the results are loaded
+# into memory at once to write it; the analysis notebooks read the result directories with load_results.
+write_aggregate_pickle = False
 
 op_sample: np.ndarray = op_sampler.random(n=m)
 
 scaled_op_sample: np.ndarray = qmc.scale(sample=op_sample, l_bounds=op_l_bounds, u_bounds=op_u_bounds)
 
 
-if run5:
-    s5 = open("space_mission/scenarios5.data", "rb")
-    scenarios5: list[tuple[List[tuple2float], PolyhedralIoContract]] = pickle.load(s5)
-    s5.close()
 
-    for i, scenario in enumerate(scenarios5):
-        c: PolyhedralIoContract = scenario[1]
+def task_results(result: Any) -> Tuple[List[PactiInstrumentationData], List[schedule_result_t]]:
+    # Batch analyses return (data, results) and single analyses (data, result).
+    data, results = result
+    return [data], results if isinstance(results, list) else [results]
+
+
+def analyze_scenarios(
+    scenarios_path: str,
+    name: str,
+    analyze_batch: Callable,
+    analyze_single: Callable,
+) -> None:
+    store = ContractStore(scenarios_path)
+    for i in range(len(store)):
+        c: PolyhedralIoContract = store[i]
         g: PolyhedralTermList = c.g
         for t in g.terms:
             if len(t.vars) == 1 and t.vars[0] in c.inputvars:
                 print(f"scenario[{i}] has a guarantee involving a single input variable: {t}")
 
-
-
-    srs = [(scenario, req) for scenario in scenarios5 for req in scaled_op_sample]
-
-    if K > 1:
-        grouped_srs = [tuple(srs[i:i + K]) for i in range(0, len(srs), K)]
-        ta = time.time()
-        results_5g: List[List[Tuple[PactiInstrumentationData, schedule_result_t]]] = p_umap(schedulability_analysis5_grouped, grouped_srs)
-        tb = time.time()
-        flat_results = [result for group in results_5g for result in group]
-        stats = summarize_instrumentation_data([result[0] for result in flat_results])
-        all_results5 = [result[1] for result in flat_results if result[1]]
-    else:
+    # Task indices are scenario indices in batch mode and (scenario, requirement) pair indices otherwise.
+    parameters = {"batch": batch, "scenarios": scenarios_path, "scenario_count": len(store)}
+    with ScheduleResultSink(pathlib.Path(f"space_mission/{name}"), chunk_size, parameters) as sink:
+        # The requirement sample is saved with the results so that a resumed run analyzes the same sample.
+        reqs: np.ndarray = sink.persistent_array("reqs", lambda: scaled_op_sample)
+        reqs_path = str(sink.array_path("reqs"))
+
+        # Workers read the scenarios and requirements from memory-mapped files; tasks only carry indices.
+        if batch:
+            tasks: List[Any] = list(range(len(store)))
+            analyze = partial(schedulability_analysis_stored_batch, scenarios_path, reqs_path, analyze_batch)
+            cost = store.constraint_count
+        else:
+            tasks = [(i, j) for i in range(len(store)) for j in range(len(reqs))]
+            analyze = partial(schedulability_analysis_stored, scenarios_path, reqs_path, analyze_single)
+
+            def cost(task: Tuple[int, int]) -> float:
+                return store.constraint_count(task[0])
+
+        pending = [(i, task) for i, task in enumerate(tasks) if not sink.is_completed(i)]
+        print(f"{name}: {len(tasks) - len(pending)} of {len(tasks)} tasks already completed.")
+
+        data: List[PactiInstrumentationData] = []
+        utilization = WorkerUtilization()
+        # The phase times and contract sizes of the tasks run by the workers, gathered with their results.
+        report = RunReport(name)
         ta = time.time()
-        results_5ng: List[Tuple[PactiInstrumentationData, schedule_result_t]] = p_umap(schedulability_analysis5, srs)
+        for i, (metrics, result) in adaptive_imap(
+            Measured(analyze), pending, cost=cost, target_chunk_seconds=target_chunk_seconds, utilization=utilization
+        ):
+            task_data, results = task_results(result)
+            data.extend(task_data)
+            report.add(metrics)
+            sink.append(i, results)
         tb = time.time()
-        stats = summarize_instrumentation_data([result[0] for result in results_5ng])
-        all_results5 = [result[1] for result in results_5ng if result[1]]
+        report.wall_time = tb - ta
 
-    results5: schedule_results_t = aggregate_schedule_results(all_results5)
     print(
-        f"Found {len(results5[1])} admissible and {len(results5[0])} non-admissible schedules out of {len(scaled_op_sample)*len(scenarios5)} combinations"
-        f" generated from {len(scaled_op_sample)} variations of operational requirements for each of the {len(scenarios5)} scenarios.\n"
-        f"Total time {tb-ta} seconds running on {cpu_info_message}\n"
-        f"{stats.stats()}"
+        f"Found {len(sink.admissible())} admissible and {len(sink.sorted_failures())} non-admissible schedules out of {len(reqs)*len(store)} combinations"
+        f" generated from {len(reqs)} variations of operational requirements for each of the {len(store)} scenarios.\n"
+        f"Total time {tb-ta} seconds for {len(pending)} tasks running on {cpu_info_message}"
     )
+    if data:
+        print(summarize_instrumentation_data(data).stats())
+        print(utilization.stats())
+        print(report.stats())
+        report.write(f"space_mission/{name}.metrics")
 
-    f = open("space_mission/results5.data", "wb")
-    pickle.dump(results5, f)
-    f.close()
-
-
-if run20:
-    s20 = open("space_mission/scenarios20.data", "rb")
-    scenarios20 = pickle.load(s20)
-    s20.close()
-
+    if write_aggregate_pickle:
+        results: schedule_results_t = sink.aggregate()
+        f = open(f"space_mission/{name}.data", "wb")
+        pickle.dump(results, f)
+        f.close()
 
-    for i, scenario in enumerate(scenarios20):
-        c: PolyhedralIoContract = scenario[1]
-        g: PolyhedralTermList = c.g
-        for t in g.terms:
-            if len(t.vars) == 1 and t.vars[0] in c.inputvars:
-                print(f"scenario[{i}] has a guarantee involving a single input variable: {t}")
 
-    srs = [(scenario, req) for scenario in scenarios20 for req in scaled_op_sample]
+if run5:
+    analyze_scenarios(
+        "space_mission/scenarios5.contracts", "results5", schedulability_analysis5_batch, schedulability_analysis5
+    )
 
-    if K > 1:
-        grouped_srs = [tuple(srs[i:i + K]) for i in range(0, len(srs), K)]
-        ta = time.time()
-        results_20g: List[List[Tuple[PactiInstrumentationData, schedule_result_t]]] = p_umap(schedulability_analysis5_grouped, grouped_srs)
-        tb = time.time()
-        flat_results = [result for group in results_20g for result in group]
-        stats = summarize_instrumentation_data([result[0] for result in flat_results])
-        all_results20 = [result[1] for result in flat_results if result[1]]
-    else:
-        ta = time.time()
-        results_20ng: List[Tuple[PactiInstrumentationData, schedule_result_t]] = p_umap(schedulability_analysis20, srs)
-        tb = time.time()
-        stats = summarize_instrumentation_data([result[0] for result in results_20ng])
-        all_results20 = [result[1] for result in results_20ng if result[1]]
 
-    results20: schedule_results_t = aggregate_schedule_results(all_results20)
-    print(
-        f"Found {len(results20[1])} admissible and {len(results20[0])} non-admissible schedules out of {len(scaled_op_sample)*len(scenarios20)} combinations"
-        f" generated from {len(scaled_op_sample)} variations of operational requirements for each of the {len(scenarios20)} scenarios.\n"
-        f"Total time {tb-ta} seconds running on {cpu_info_message}\n"
-        f"{stats.stats()}"
+if run20:
+    analyze_scenarios(
+        "space_mission/scenarios20.contracts", "results20", schedulability_analysis20_batch, schedulability_analysis20
     )
-
-    f = open("space_mission/results20.data", "wb")
-    pickle.dump(results20, f)
-    f.close()
@@ -5,17 +5,23 @@ import numpy as np
 from contract_utils import *
 from generators import *
 
-from typing import Tuple
+from typing import Callable, List, Tuple
 
-from p_tqdm import p_umap
+from p_tqdm import p_map, p_umap
 
 from scipy.stats import qmc
 
-import pickle
+from contract_store import save_scenarios
+from run_metrics import Measured, RunReport
 
 run5 = True
 run20 = True
 
+# Compose each scenario once per sign pattern of the rate ranges and replay the composition for the other samples.
+# Off by default: each sign pattern costs about 26 probe compositions, and the nav sbo_imp range crosses zero,
+# so with the default ranges, e.g., 40 5-step scenarios took 258s with plans instead of 190s without.
+use_plans = False
+
 # Hyperparameter ranges
 l_bounds = [
     2.0,  # power: min dns cons
@@ -46,6 +52,29 @@ u_bounds = [
     0.8,  # nav: max tcm_dv progress
 ]
 
+
+
+def sample_label(mean_dev: Tuple[np.ndarray, np.ndarray]) -> str:
+    return ",".join(f"{m:.4g}" for m in mean_dev[0])
+
+
+def generate_measured(
+    name: str, make_from_ranges: Callable, generate: Callable, mean_devs: List[Tuple[np.ndarray, np.ndarray]]
+) -> Tuple[List[Tuple[PactiInstrumentationData, List[tuple2float], PolyhedralIoContract]], RunReport]:
+    # Per-sample phase times and contract sizes are written to space_mission/<name>.metrics.json/.csv.
+    report = RunReport(name)
+    ta = time.time()
+    if use_plans:
+        results = generate_scenarios_with_plans(make_from_ranges, mean_devs, probe_map=p_map, report=report)
+    else:
+        measured = p_umap(Measured(generate, label=sample_label), mean_devs)
+        report.tasks = [metrics for metrics, _ in measured]
+        results = [result for _, result in measured]
+    report.wall_time = time.time() - ta
+    report.write(f"space_mission/{name}.metrics")
+    return results, report
+
+
 mean_sampler = qmc.LatinHypercube(d=len(l_bounds))
 dev_sampler = qmc.LatinHypercube(d=len(l_bounds))
 
@@ -56,7 +85,9 @@ if run5:
     dev_sample5: np.ndarray = dev_sampler.random(n=n5)
 
     ta = time.time()
-    results: List[Tuple[PactiInstrumentationData, List[tuple2float], PolyhedralIoContract]] = p_umap(generate_5step_scenario, list(zip(scaled_mean_sample5, dev_sample5)))
+    results, report = generate_measured(
+        "scenarios5", make_5step_scenario_from_ranges, generate_5step_scenario, list(zip(scaled_mean_sample5, dev_sample5))
+    )
     tb = time.time()
 
     stats = summarize_instrumentation_data([result[0] for result in results])
@@ -64,11 +95,10 @@ if run5:
     print(
         f"Generated {len(scenarios5)} hyperparameter variations of the 5-step scenario in {tb-ta} seconds.\n"
         f"Running on {cpu_info_message}\n"
-        f"{stats.stats()}"
+        f"{stats.stats()}\n"
+        f"{report.stats()}"
     )
-    s = open("space_mission/scenarios5.data", "wb")
-    pickle.dump(scenarios5, s)
-    s.close()
+    save_scenarios("space_mission/scenarios5.contracts", scenarios5)
 
 if run20:
     n20 = 100
@@ -79,7 +109,9 @@ if run20:
     dev_sample20: np.ndarray = dev_sampler.random(n=n20)
 
     ta = time.time()
-    results: List[Tuple[PactiInstrumentationData, List[tuple2float], PolyhedralIoContract]] = p_umap(generate_20step_scenario, list(zip(scaled_mean_sample20, dev_sample20)))
+    results, report = generate_measured(
+        "scenarios20", make_20step_scenario_from_ranges, generate_20step_scenario, list(zip(scaled_mean_sample20, dev_sample20))
+    )
     tb = time.time()
 
     stats = summarize_instrumentation_data([result[0] for result in results])
@@ -87,8 +119,7 @@ if run20:
     print(
         f"Generated {len(scenarios20)} hyperparameter variations of the 20-step scenario in {tb-ta} seconds.\n"
         f"Running on {cpu_info_message}\n"
-        f"{stats.stats()}"
+        f"{stats.stats()}\n"
+        f"{report.stats()}"
     )
-    s = open("space_mission/scenarios20.data", "wb")
-    pickle.dump(scenarios20, s)
-    s.close()
+    save_scenarios("space_mission/scenarios20.contracts", scenarios20)
@@ -1,3 +1,4 @@
+import math
 from matplotlib.backend_bases import Event
 from matplotlib.figure import Figure
 from matplotlib.axes import Axes
@@ -5,9 +6,10 @@ import matplotlib.pyplot as plt
 from pacti.iocontract import Var
 from pacti.contracts import PolyhedralIoContract
 from pacti.terms.polyhedra import PolyhedralTermList
-from pacti.utils.plots import plot_guarantees
-from typing import Dict, List, Tuple, Union
-from contract_utils import bound
+from pacti.utils.plots import plot_guarantees, _gen_boundary_constraints
+from scipy.spatial import QhullError
+from typing import Dict, List, Optional, Tuple, Union
+from utils import PolygonSlice
 
 numeric = Union[int, float]
 
@@ -98,16 +100,48 @@ def get_bounds(ptl: PolyhedralTermList, var: str) -> tuple[str, str]:
 def calculate_output_bounds_for_input_value(ptl: PolyhedralTermList, inputs: Dict[Var, float], output: Var) -> tuple[str,str]:
     return get_bounds(ptl.evaluate(inputs).simplify(), output.name)
 
+def guarantees_polygon(
+    constraints: PolyhedralTermList,
+    x_var: Var,
+    y_var: Var,
+    var_values: Dict[Var, numeric],
+    x_lims: Tuple[numeric, numeric],
+    y_lims: Tuple[numeric, numeric],
+) -> Optional[PolygonSlice]:
+    """
+    Computes the polygon of constraints in the plane of two variables once, for hover queries.
+
+    Args:
+        constraints: the constraints
+        x_var: the horizontal axis variable
+        y_var: the vertical axis variable
+        var_values: the values of the other variables
+        x_lims: the range of the horizontal axis, bounding the polygon if the constraints do not
+        y_lims: the range of the vertical axis, bounding the polygon if the constraints do not
+
+    Returns:
+        The polygon, or None if it is empty. The y bounds of a polygon clipped by the axis ranges are infinite
+        where they are the range limits.
+    """
+    plane = constraints.evaluate(var_values).simplify()
+    try:
+        return PolygonSlice(plane, x_var, y_var)
+    except (IndexError, QhullError, ValueError):
+        pass
+    try:
+        clipped = plane | _gen_boundary_constraints(x_var, y_var, x_lims, y_lims)
+        return PolygonSlice(clipped, x_var, y_var, y_clip=(float(y_lims[0]), float(y_lims[1])))
+    except (IndexError, QhullError, ValueError):
+        return None
+
 # Add a callback function for the mouse click event
-def on_hover(ptl: PolyhedralTermList, x_var: Var, y_var: Var, fig: Figure, ax: Axes, event: Event) -> None:
+def on_hover(polygon: Optional[PolygonSlice], x_var: Var, y_var: Var, fig: Figure, ax: Axes, event: Event) -> None:
     if event.inaxes == ax:
         x_coord = event.xdata
-        try:
-            y_min, y_max = calculate_output_bounds_for_input_value(ptl, {x_var: x_coord}, y_var)
-            ax.set_title(f"@ {x_var.name}={x_coord:.2f}\n{y_min} <= {y_var.name} <= {y_max}")
-        except ValueError as e:
-            print(f"Contract guarantee hover ValueError:\n{e}")
-            ax.set_title(f"@ {x_var.name}={x_coord:.2f}\nValueError (see message below)")
+        bounds = (polygon.bounds_at(x_coord) if polygon else None) or (math.inf, math.inf)
+        # Infinite bounds are those of a clipped polygon at the plot limits, not of the constraints.
+        y_min, y_max = (f"{b:.2f}" if math.isfinite(b) else "unknown" for b in bounds)
+        ax.set_title(f"@ {x_var.name}={x_coord:.2f}\n{y_min} <= {y_var.name} <= {y_max}")
         fig.canvas.draw_idle()
 
 def plot_guarantees_with_bounds_hover(
@@ -119,6 +153,7 @@ def plot_guarantees_with_bounds_hover(
     y_lims: Tuple[numeric, numeric],
 ) -> Figure:
     fig: Figure = plot_guarantees(contract=contract, x_var=x_var, y_var=y_var, var_values=var_values, x_lims=x_lims, y_lims=y_lims)
-    constraints: PolyhedralTermList = contract.a | contract.g
-    fig.canvas.mpl_connect('button_press_event', lambda event: on_hover(constraints.evaluate(var_values).simplify(), x_var, y_var, fig, fig.axes[0], event))
+    # The polygon is computed once; each click only intersects its edges with the vertical line at the click.
+    polygon = guarantees_polygon(contract.a | contract.g, x_var, y_var, var_values, x_lims, y_lims)
+    fig.canvas.mpl_connect('button_press_event', lambda event: on_hover(polygon, x_var, y_var, fig, fig.axes[0], event))
     return fig
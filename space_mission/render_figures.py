@@ -0,0 +1,246 @@
+"""Batch rendering of the per-scenario step figures of schedulability analysis results."""
+import argparse
+import os
+import pathlib
+import pickle
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
+
+from contract_utils import Schedule, all_variable_bounds, tuple2float
+from plot_utils import plot_steps
+from result_sink import ScheduleResultSink
+from task_scheduler import adaptive_imap
+
+
+@dataclass(frozen=True)
+class ScenarioBounds:
+    """The bounds of a schedule contract needed by its figures, computed once per contract."""
+
+    scenario: List[tuple2float]
+    reqs: np.ndarray
+    steps: int
+    average_soc: tuple2float
+    u: tuple2float
+    r: tuple2float
+    c: tuple2float
+    variables: Dict[str, List[tuple2float]]
+
+
+def schedule_steps(schedule: Schedule) -> int:
+    """
+    Args:
+        schedule: an admissible schedule
+
+    Returns:
+        The number of steps of the schedule's scenario, from its output soc variables.
+    """
+    return max(int(m.group(1)) for v in schedule.contract.vars if (m := re.fullmatch(r"output_soc(\d+)", v.name)))
+
+
+def _bound(row: np.ndarray) -> tuple2float:
+    # As check_tuple, unbounded sides are reported as -1.
+    return (-1.0 if np.isnan(row[0]) else float(row[0]), -1.0 if np.isnan(row[1]) else float(row[1]))
+
+
+def scenario_bounds(schedule: Schedule, variables: Sequence[str] = ("soc",)) -> ScenarioBounds:
+    """
+    Computes the bounds shown in the figures of a schedule with one batch of LPs over its constraint matrix.
+
+    Args:
+        schedule: an admissible schedule
+        variables: the variables whose values over the sequence are plotted, e.g., "soc"
+
+    Returns:
+        The bounds of the final u, r and c, of the average soc, and of each variable at the entry and each step exit.
+    """
+    c = schedule.contract
+    n = schedule_steps(schedule)
+    names = [f"output_u{n}", f"output_r{n}", f"output_c{n}"]
+    for var in variables:
+        names += [f"{var}1_entry"] + [f"output_{var}{i}" for i in range(1, n + 1)]
+    rows = [_bound(row) for row in all_variable_bounds(c, names)]
+
+    fsoc = " + ".join([f"{1 / n} output_soc{i}" for i in range(1, n + 1)])
+    min_soc = c.optimize(fsoc, maximize=False)
+    max_soc = c.optimize(fsoc, maximize=True)
+    return ScenarioBounds(
+        scenario=schedule.scenario,
+        reqs=schedule.reqs,
+        steps=n,
+        average_soc=(-1 if min_soc is None else min_soc, -1 if max_soc is None else max_soc),
+        u=rows[0],
+        r=rows[1],
+        c=rows[2],
+        variables={var: rows[3 + k * (n + 1) : 3 + (k + 1) * (n + 1)] for k, var in enumerate(variables)},
+    )
+
+
+def show_range(name: str, range: tuple2float) -> str:
+    return f"{name}=[{range[0]:.3g},{range[1]:.3g}]\n"
+
+
+def scenario_text(b: ScenarioBounds) -> str:
+    """
+    Args:
+        b: the bounds of a schedule
+
+    Returns:
+        The description of the scenario uncertainties, requirements and bounds shown next to its step figures.
+    """
+    ranges = b.scenario
+    op_reqs = b.reqs
+    return (
+        "* Power uncertainties\n"
+        + show_range("        chrg_gen", ranges[1])
+        + show_range("        dsn_cons", ranges[0])
+        + show_range("        sbo_cons", ranges[2])
+        + show_range("       tcmh_cons", ranges[3])
+        + show_range("      tcmdv_cons", ranges[4])
+        + "* Science uncertainties\n"
+        + show_range("         sbo_gen", ranges[6])
+        + show_range("       dsn_speed", ranges[5])
+        + "* Navigation uncertainties\n"
+        + show_range("         sbo_imp", ranges[9])
+        + show_range("       dsn_noise", ranges[7])
+        + show_range("      chrg_noise", ranges[8])
+        + show_range("    tcm_dv_noise", ranges[10])
+        + show_range(" tcm_dv_progress", ranges[11])
+        + "* Initial conditions\n"
+        + f"     battery soc={op_reqs[0]:.3g}\n"
+        + f"    science data={op_reqs[3]:.3g}\n"
+        + f"   traj. est. u.={op_reqs[4]:.3g}\n"
+        + "* Constraints @ each step\n"
+        + f"    min soc exit={op_reqs[1]:.3g}\n"
+        + f"  min time alloc={op_reqs[2]:.3g}\n"
+        + "* Optimization bounds\n"
+        + f"     average soc=[{b.average_soc[0]:.3g},{b.average_soc[1]:.3g}]\n"
+        + show_range("   traj. est. u.", b.u)
+        + show_range("   rel. progress", b.r)
+        + show_range("   total science", b.c)
+    )
+
+
+def plot_scenario(b: ScenarioBounds, var: str) -> Figure:
+    """
+    Plots the values of a variable over the sequence of a schedule, as in the analysis notebooks.
+
+    Args:
+        b: the bounds of the schedule
+        var: one of the variables of the bounds
+
+    Returns:
+        The figure.
+    """
+    labels = ["initial"] + [f"{i}" for i in range(1, b.steps)] + ["final"]
+    return plot_steps(
+        b.variables[var],
+        labels,
+        ylabel=var,
+        title=f"Possible values of {var} over the sequence",
+        text=scenario_text(b),
+        nth_tick=max(1, b.steps // 10),
+    )
+
+
+def figure_path(figures: pathlib.Path, steps: int, index: int, var: str) -> pathlib.Path:
+    return figures / f"results{steps}-{index}-{var}.pdf"
+
+
+def _render_task(task: Tuple[int, Schedule, str, Tuple[str, ...], bool]) -> List[str]:
+    index, schedule, figures, variables, overwrite = task
+    # Workers only write files: use the non-interactive backend whatever the backend of the parent process.
+    plt.switch_backend("agg")
+    steps = schedule_steps(schedule)
+    todo = [var for var in variables if overwrite or not figure_path(pathlib.Path(figures), steps, index, var).exists()]
+    if not todo:
+        return []
+    b = scenario_bounds(schedule, todo)
+    written = []
+    for var in todo:
+        path = figure_path(pathlib.Path(figures), steps, index, var)
+        fig = plot_scenario(b, var)
+        # Write then rename so that an interrupted run leaves no truncated figure to be skipped when resuming.
+        tmp = path.with_suffix(".tmp")
+        fig.savefig(tmp, format="pdf")
+        plt.close(fig)
+        os.replace(tmp, path)
+        written.append(str(path))
+    return written
+
+
+def load_schedules(results: pathlib.Path) -> List[Schedule]:
+    """
+    Loads the admissible schedules of a results file.
+
+    Args:
+        results: a pickle of `(failures, schedules)`, as written by the analysis notebooks,
+            or a `ScheduleResultSink` directory
+
+    Returns:
+        The schedules, in the order of the results.
+    """
+    results = pathlib.Path(results)
+    if results.is_dir():
+        sink = ScheduleResultSink(results, read_only=True)
+        return sink.load_all(sink.admissible())  # type: ignore
+    with open(results, "rb") as f:
+        return pickle.load(f)[1]
+
+
+def render_figures(
+    results: pathlib.Path,
+    figures: pathlib.Path,
+    variables: Sequence[str] = ("soc",),
+    max_figures: Optional[int] = None,
+    overwrite: bool = False,
+    num_cpus: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Renders the step figures of the admissible schedules of a results file in a process pool.
+
+    Each worker computes the bounds of a schedule contract once for all its figures and writes them
+    as `results<steps>-<index>-<var>.pdf`; figures are written as their schedules complete, and
+    existing figures are skipped unless `overwrite` is set, so that an interrupted run can be resumed.
+
+    Args:
+        results: the results file or result sink directory, see `load_schedules`
+        figures: the directory of the figures
+        variables: the variables plotted over the sequence, one figure per variable
+        max_figures: the number of schedules rendered, all by default
+        overwrite: whether to render existing figures again
+        num_cpus: the number of worker processes, os.cpu_count() by default
+
+    Yields:
+        The paths of the figures, as they are written.
+    """
+    figures = pathlib.Path(figures)
+    figures.mkdir(parents=True, exist_ok=True)
+    schedules = load_schedules(results)[:max_figures]
+    tasks = [(i, (i, s, str(figures), tuple(variables), overwrite)) for i, s in enumerate(schedules)]
+    for _, written in adaptive_imap(
+        _render_task,
+        tasks,
+        cost=lambda t: len(t[1].contract.a.terms) + len(t[1].contract.g.terms),
+        num_cpus=num_cpus,
+    ):
+        yield from written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the step figures of schedulability analysis results.")
+    parser.add_argument("results", type=pathlib.Path, help="results pickle, e.g. results20.data, or result sink directory")
+    parser.add_argument("--figures", type=pathlib.Path, default=pathlib.Path("figures"), help="output directory")
+    parser.add_argument("--variables", nargs="+", default=["soc"], help="variables plotted over the sequence")
+    parser.add_argument("--max-figures", type=int, default=None, help="number of schedules rendered")
+    parser.add_argument("--overwrite", action="store_true", help="render existing figures again")
+    parser.add_argument("--cpus", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+    count = 0
+    for _ in render_figures(args.results, args.figures, args.variables, args.max_figures, args.overwrite, args.cpus):
+        count += 1
+    print(f"Rendered {count} figures in {args.figures}")
@@ -0,0 +1,295 @@
+"""Append-only, chunked storage of schedulability analysis results."""
+import json
+import os
+import pathlib
+import pickle
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from contract_utils import FailedMerges, Schedule, schedule_result_t, schedule_results_t
+from var_table import dump_compact
+
+
+@dataclass(frozen=True)
+class ResultIndexEntry:
+    """Summary of a stored result, enough to select and sort results without loading their contracts."""
+
+    chunk: int
+    position: int
+    task: int
+    admissible: bool
+    merged: int
+    failed_name: Optional[str]
+
+
+class ScheduleResultSink:
+    """
+    Writes schedulability results to a directory as they are produced.
+
+    Results are buffered and written in append-only chunks (`chunk<k>.data` pickles). After each chunk
+    is written, a line summarizing its results is appended to `index.jsonl`; a chunk that is not in
+    the index is incomplete and is ignored, so that an interrupted run can resume from the last
+    completed chunk by skipping the tasks already recorded in the index.
+
+    The parameters of the run that created the directory are saved in `run.json`; a run with different
+    parameters, whose task indices may not mean the same tasks, cannot resume from it.
+    """
+
+    index_file = "index.jsonl"
+    run_file = "run.json"
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        chunk_size: int = 1000,
+        parameters: Optional[Dict[str, Any]] = None,
+        read_only: bool = False,
+    ):
+        """
+        Opens a result sink, creating its directory if needed.
+
+        Args:
+            directory: the directory holding the chunks and the index
+            chunk_size: the number of results buffered before a chunk is written
+            parameters: the JSON-serializable parameters of the run that determine its tasks, e.g.,
+                whether tasks are batched and the scenario store they read, saved or checked with the chunk size;
+                None to read the results of a run without checking its parameters
+            read_only: whether the sink is only opened to read the results of a run, e.g., while it is running;
+                otherwise, the index is truncated to its completed lines to resume writing
+
+        Raises:
+            ValueError: the directory holds the results of a run with different parameters.
+        """
+        self.directory = pathlib.Path(directory)
+        self.read_only = read_only
+        if not read_only:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        if parameters is not None:
+            self._check_run({"chunk_size": chunk_size, **parameters})
+        self.entries: List[ResultIndexEntry] = []
+        self.tasks: Set[int] = set()
+        self.chunks = 0
+        self._read_index()
+        self._buffer: List[Tuple[int, schedule_result_t]] = []
+        self._buffered_tasks: List[int] = []
+        self._loaded: Tuple[int, List[schedule_result_t]] = (-1, [])
+
+    def __enter__(self) -> "ScheduleResultSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
+
+    def _chunk_path(self, chunk: int) -> pathlib.Path:
+        return self.directory / f"chunk{chunk:05d}.data"
+
+    def _check_run(self, parameters: Dict[str, Any]) -> None:
+        path = self.directory / self.run_file
+        # Compared as read back from JSON, e.g., with tuples as lists.
+        parameters = json.loads(json.dumps(parameters))
+        if path.exists():
+            with open(path) as f:
+                saved = json.load(f)
+            changed = sorted(k for k in saved.keys() | parameters.keys() if saved.get(k) != parameters.get(k))
+            if changed:
+                raise ValueError(
+                    f"Cannot resume the run in {self.directory} with different parameters: "
+                    + ", ".join(f"{k}={parameters.get(k)!r} (was {saved.get(k)!r})" for k in changed)
+                )
+            return
+        with open(path, "w") as f:
+            json.dump(parameters, f, indent=1)
+
+    def _read_index(self) -> None:
+        path = self.directory / self.index_file
+        if not path.exists():
+            return
+        completed = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                self._record(record["chunk"], record["tasks"], record["results"])
+                completed += len(line)
+        # A partially written last line belongs to a chunk that did not complete.
+        if not self.read_only:
+            os.truncate(path, completed)
+
+    def _record(self, chunk: int, tasks: List[int], summaries: List[Tuple[int, bool, int, Optional[str]]]) -> None:
+        self.entries.extend(ResultIndexEntry(chunk, p, *s) for p, s in enumerate(summaries))
+        self.tasks.update(tasks)
+        self.chunks = chunk + 1
+
+    def persistent_array(self, name: str, make: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Loads an array saved in the sink directory, or makes and saves it.
+
+        This keeps the inputs of a run, e.g. the sampled requirements, stable across resumed runs.
+
+        Args:
+            name: the name of the array
+            make: makes the array if it has not been saved yet
+
+        Returns:
+            The array.
+        """
+        path = self.array_path(name)
+        if path.exists():
+            return np.load(path)
+        array = make()
+        np.save(path, array)
+        return array
+
+    def array_path(self, name: str) -> pathlib.Path:
+        """
+        Args:
+            name: the name of an array saved with `persistent_array`
+
+        Returns:
+            The path of the array file.
+        """
+        return self.directory / f"{name}.npy"
+
+    def is_completed(self, task: int) -> bool:
+        """
+        Checks whether the results of a task have been written.
+
+        Args:
+            task: a task index
+
+        Returns:
+            True if the task results are in a completed chunk.
+        """
+        return task in self.tasks
+
+    def append(self, task: int, results: Iterable[schedule_result_t]) -> None:
+        """
+        Adds the results of a task, writing a chunk when enough results are buffered.
+
+        Args:
+            task: the task index
+            results: the results of the task
+
+        Raises:
+            ValueError: the sink is read-only.
+        """
+        if self.read_only:
+            raise ValueError(f"Cannot append results to the read-only sink {self.directory}")
+        self._buffer.extend((task, r) for r in results)
+        self._buffered_tasks.append(task)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered results as a new chunk and records it in the index."""
+        if not self._buffered_tasks:
+            return
+        chunk = self.chunks
+        tmp = self._chunk_path(chunk).with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            # The contracts of the results as compact arrays; see var_table.py.
+            dump_compact([r for _, r in self._buffer], f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._chunk_path(chunk))
+
+        summaries = [
+            (task, True, 0, None) if isinstance(r, Schedule) else (task, False, len(r.merged), r.failed_name)
+            for task, r in self._buffer
+        ]
+        with open(self.directory / self.index_file, "a") as f:
+            f.write(json.dumps({"chunk": chunk, "tasks": self._buffered_tasks, "results": summaries}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._record(chunk, self._buffered_tasks, summaries)
+        self._buffer = []
+        self._buffered_tasks = []
+
+    def index(self) -> List[ResultIndexEntry]:
+        """
+        Returns:
+            The index entries of the written results.
+        """
+        return self.entries
+
+    def sorted_failures(self) -> List[ResultIndexEntry]:
+        """
+        Returns:
+            The index entries of the non-admissible results, sorted by decreasing number of merged contracts.
+        """
+        return sorted([e for e in self.index() if not e.admissible], key=lambda e: -e.merged)
+
+    def admissible(self) -> List[ResultIndexEntry]:
+        """
+        Returns:
+            The index entries of the admissible results.
+        """
+        return [e for e in self.index() if e.admissible]
+
+    def load(self, entry: ResultIndexEntry) -> schedule_result_t:
+        """
+        Loads a single result, reading only its chunk.
+
+        Args:
+            entry: the index entry of the result
+
+        Returns:
+            The result.
+        """
+        if self._loaded[0] != entry.chunk:
+            with open(self._chunk_path(entry.chunk), "rb") as f:
+                self._loaded = (entry.chunk, pickle.load(f))
+        return self._loaded[1][entry.position]
+
+    def load_all(self, entries: List[ResultIndexEntry]) -> List[schedule_result_t]:
+        """
+        Loads results in the order of their entries, reading each chunk once.
+
+        Args:
+            entries: index entries
+
+        Returns:
+            The results.
+        """
+        by_chunk: Dict[int, List[schedule_result_t]] = {}
+        for chunk in {e.chunk for e in entries}:
+            with open(self._chunk_path(chunk), "rb") as f:
+                by_chunk[chunk] = pickle.load(f)
+        return [by_chunk[e.chunk][e.position] for e in entries]
+
+    def aggregate(self) -> schedule_results_t:
+        """
+        Loads all results, as `aggregate_schedule_results` would return them.
+
+        Returns:
+            The failed merges sorted by decreasing number of merged contracts, and the schedules.
+        """
+        failed: List[FailedMerges] = self.load_all(self.sorted_failures())  # type: ignore
+        schedules: List[Schedule] = self.load_all(self.admissible())  # type: ignore
+        return failed, schedules
+
+
+def load_results(path: Union[str, pathlib.Path]) -> schedule_results_t:
+    """
+    Loads all the results of a run, e.g., in the analysis notebooks.
+
+    Args:
+        path: a `ScheduleResultSink` directory, or a pickle of `(failures, schedules)` as written by
+            hyper_requirements.py with `write_aggregate_pickle` or the schedulability analysis notebooks;
+            the pickle with the `.data` suffix if there is no such directory, e.g., `results5.data` for `results5`
+
+    Returns:
+        The failed merges sorted by decreasing number of merged contracts, and the schedules.
+    """
+    path = pathlib.Path(path)
+    if not path.exists() and path.with_suffix(".data").exists():
+        path = path.with_suffix(".data")
+    if path.is_dir():
+        return ScheduleResultSink(path, read_only=True).aggregate()
+    with open(path, "rb") as f:
+        return pickle.load(f)
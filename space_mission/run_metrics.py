@@ -0,0 +1,274 @@
+"""Per-task phase timing and contract size metrics, aggregated across worker processes."""
+import csv
+import functools
+import json
+import os
+import pathlib
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from pacti.contracts import PolyhedralIoContract
+
+report_format = 1
+
+# The phases of a task; time spent in a phase nested in another one is only counted for the inner phase.
+phases = ("parse", "compose", "merge", "simplify", "bounds")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def _zeros() -> Dict[str, float]:
+    return {p: 0.0 for p in phases}
+
+
+def _no_calls() -> Dict[str, int]:
+    return {p: 0 for p in phases}
+
+
+@dataclass
+class TaskMetrics:
+    """
+    The metrics of a task, recorded in the process running it.
+
+    The phase times exclude the time of nested phases, so that they add up to at most the wall time.
+    The constraint and variable counts are those of the largest contract recorded during the task.
+    """
+
+    task: str
+    pid: int = field(default_factory=os.getpid)
+    wall_time: float = 0.0
+    times: Dict[str, float] = field(default_factory=_zeros)
+    calls: Dict[str, int] = field(default_factory=_no_calls)
+    contracts: int = 0
+    compositions: int = 0
+    merges: int = 0
+    constraints: int = 0
+    variables: int = 0
+
+    def row(self) -> Dict[str, Union[str, int, float]]:
+        """
+        Returns:
+            The metrics as a flat record, e.g., a CSV row.
+        """
+        row: Dict[str, Union[str, int, float]] = {"task": self.task, "pid": self.pid, "wall_time": self.wall_time}
+        row.update({f"{p}_time": self.times[p] for p in phases})
+        row.update({f"{p}_calls": self.calls[p] for p in phases})
+        row.update(
+            contracts=self.contracts,
+            compositions=self.compositions,
+            merges=self.merges,
+            constraints=self.constraints,
+            variables=self.variables,
+        )
+        return row
+
+
+# The metrics of the task running in this process, if any; each worker process has its own.
+_active: Optional[TaskMetrics] = None
+# The phases being timed: [phase, start time, time of the nested phases].
+_phase_stack: List[list] = []
+
+
+@contextmanager
+def measure_task(task: Any) -> Iterator[TaskMetrics]:
+    """
+    Records the metrics of a task in this process while the context is active.
+
+    Args:
+        task: the task identifier
+
+    Yields:
+        The metrics of the task, complete when the context exits.
+    """
+    global _active
+    previous, stack = _active, _phase_stack[:]
+    metrics = TaskMetrics(task=str(task))
+    _active = metrics
+    _phase_stack.clear()
+    ta = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.wall_time = time.perf_counter() - ta
+        _active = previous
+        _phase_stack[:] = stack
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Times a phase of the active task; does nothing outside of `measure_task`.
+
+    Args:
+        name: one of `phases`
+    """
+    if _active is None:
+        yield
+        return
+    frame = [name, time.perf_counter(), 0.0]
+    _phase_stack.append(frame)
+    try:
+        yield
+    finally:
+        _phase_stack.pop()
+        elapsed = time.perf_counter() - frame[1]
+        if _active is not None:
+            _active.times[name] += elapsed - frame[2]
+            _active.calls[name] += 1
+        if _phase_stack:
+            _phase_stack[-1][2] += elapsed
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """
+    Times each call of a function as a phase of the active task.
+
+    Args:
+        name: one of `phases`
+
+    Returns:
+        The function decorator.
+    """
+
+    def decorator(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def count_operations(contracts: int = 0, compositions: int = 0, merges: int = 0) -> None:
+    """Counts the contracts constructed, composed and merged by the active task, if any."""
+    if _active is not None:
+        _active.contracts += contracts
+        _active.compositions += compositions
+        _active.merges += merges
+
+
+def record_contract(c: PolyhedralIoContract) -> None:
+    """Records the size of a contract of the active task, if any."""
+    if _active is not None:
+        _active.constraints = max(_active.constraints, len(c.a.terms) + len(c.g.terms))
+        _active.variables = max(_active.variables, len(c.inputvars) + len(c.outputvars))
+
+
+class Measured:
+    """
+    A task function returning the metrics of each call with its result.
+
+    Unlike a closure, it can be pickled for a process pool when the wrapped function can.
+    """
+
+    def __init__(self, function: Callable[[Any], Any], label: Optional[Callable[[Any], Any]] = None):
+        """
+        Args:
+            function: the task function
+            label: identifies a task in the metrics, the task itself by default
+        """
+        self.function = function
+        self.label = label
+
+    def __call__(self, task: Any) -> Tuple[TaskMetrics, Any]:
+        with measure_task(self.label(task) if self.label else task) as metrics:
+            result = self.function(task)
+        return metrics, result
+
+
+@dataclass
+class RunReport:
+    """The metrics of the tasks of a run, gathered from all the worker processes."""
+
+    name: str
+    tasks: List[TaskMetrics] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    def add(self, metrics: TaskMetrics) -> None:
+        self.tasks.append(metrics)
+
+    def phase_summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            For each phase, the total, mean and maximum time per task, the number of calls,
+            and the share of the total task time.
+        """
+        total = sum(t.wall_time for t in self.tasks)
+        summary = {}
+        for p in phases:
+            times = [t.times[p] for t in self.tasks]
+            summary[p] = {
+                "total": sum(times),
+                "mean": sum(times) / len(times) if times else 0.0,
+                "max": max(times, default=0.0),
+                "calls": sum(t.calls[p] for t in self.tasks),
+                "share": sum(times) / total if total > 0 else 0.0,
+            }
+        return summary
+
+    def worker_summary(self) -> Dict[int, Dict[str, float]]:
+        """
+        Returns:
+            For each worker process, the number of tasks and their total time.
+        """
+        workers: Dict[int, Dict[str, float]] = {}
+        for t in self.tasks:
+            w = workers.setdefault(t.pid, {"tasks": 0, "time": 0.0})
+            w["tasks"] += 1
+            w["time"] += t.wall_time
+        return workers
+
+    def stats(self) -> str:
+        """
+        Returns:
+            A summary of the time of each phase and of the contract sizes.
+        """
+        lines = [f"{self.name}: {len(self.tasks)} tasks in {len(self.worker_summary())} processes"]
+        for p, s in self.phase_summary().items():
+            lines.append(
+                f"  {p:>8}: {s['total']:.3f}s ({100 * s['share']:.1f}%) in {s['calls']} calls, "
+                f"mean {s['mean']:.4f}s, max {s['max']:.4f}s per task"
+            )
+        if self.tasks:
+            lines.append(
+                f"  largest contract: {max(t.constraints for t in self.tasks)} constraints, "
+                f"{max(t.variables for t in self.tasks)} variables; "
+                f"{sum(t.contracts for t in self.tasks)} contracts, {sum(t.compositions for t in self.tasks)} compositions, "
+                f"{sum(t.merges for t in self.tasks)} merges"
+            )
+        return "\n".join(lines)
+
+    def write_json(self, path: Union[str, pathlib.Path]) -> None:
+        """Writes the summaries and the metrics of each task as JSON."""
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "format": report_format,
+                    "name": self.name,
+                    "wall_time": self.wall_time,
+                    "phases": self.phase_summary(),
+                    "workers": {str(pid): w for pid, w in self.worker_summary().items()},
+                    "tasks": [asdict(t) for t in self.tasks],
+                },
+                f,
+                indent=1,
+            )
+
+    def write_csv(self, path: Union[str, pathlib.Path]) -> None:
+        """Writes the metrics of each task as a CSV row."""
+        rows = [t.row() for t in self.tasks]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(TaskMetrics(task="").row()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def write(self, prefix: Union[str, pathlib.Path]) -> None:
+        """Writes the report as `<prefix>.json` and `<prefix>.csv`."""
+        self.write_json(f"{prefix}.json")
+        self.write_csv(f"{prefix}.csv")
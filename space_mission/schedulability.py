@@ -4,68 +4,52 @@ import functools
 import numpy as np
 from contract_utils import *
 from generators import *
-from typing import Tuple
+from contract_store import open_contract_store
+from typing import Callable, Tuple
+
+
+# Maximum number of distinct requirement vectors whose contracts are cached per process.
+op_requirement_cache_size = 256
+
+duration_kinds = ["dsn", "charging", "sbo", "tcm_h", "tcm_dv"]
+
+
+@functools.lru_cache(maxsize=op_requirement_cache_size)
+def op_requirement_constraints(
+    reqs: Tuple[float, ...], steps: int, soc_groups: Tuple[Tuple[str, range], ...]
+) -> Tuple[Tuple[str, PolyhedralIoContract], ...]:
+    """Operational requirement contracts of a requirement vector, cached by value.
+
+    Args:
+        reqs: the 6 operational requirements (initial soc, exit soc, delta t, d, u, r)
+        steps: the number of steps of the scenario
+        soc_groups: the name and step indices of each group of exit soc requirements
+
+    Returns:
+        The named requirement contracts: durations, initial and one per soc group.
+    """
+    durations = {
+        f"duration_{duration_kinds[(i - 1) % len(duration_kinds)]}{i}": (reqs[2], None) for i in range(1, steps + 1)
+    }
+    initial = {
+        "soc1_entry": (reqs[0], reqs[0]),
+        "c1_entry": (0.0, 0.0),
+        "d1_entry": (reqs[3], reqs[3]),
+        "u1_entry": (reqs[4], reqs[4]),
+        "r1_entry": (reqs[5], reqs[5]),
+    }
+    return (
+        ("durations", box_contract(durations, {})),
+        ("initial", box_contract(initial, {})),
+        *(
+            (name, box_contract({}, {f"output_soc{i}": (reqs[1], None) for i in indices}))
+            for name, indices in soc_groups
+        ),
+    )
 
 
 def make_op_requirement_constraints5(reqs: np.ndarray) -> named_contracts_t:
-    cs1: named_contracts_t = [
-        (
-            "durations",
-            functools.reduce(
-                PolyhedralIoContract.merge,
-                [
-                    PolyhedralIoContract.from_strings(
-                        input_vars=[var],
-                        output_vars=[], 
-                        assumptions=[f"{var} >= {reqs[2]}"], 
-                        guarantees=[]
-                    )
-                    for var in [
-                        "duration_dsn1",
-                        "duration_charging2",
-                        "duration_sbo3",
-                        "duration_tcm_h4",
-                        "duration_tcm_dv5",
-                    ]
-                ],
-            ),
-        )
-    ]
-    cs2: named_contracts_t = [
-        (
-            "initial",
-            PolyhedralIoContract.from_strings(
-                input_vars=["soc1_entry", "c1_entry", "d1_entry", "u1_entry", "r1_entry"],
-                output_vars=[],
-                assumptions=[
-                    f"soc1_entry = {reqs[0]}",
-                    f"c1_entry = 0",
-                    f"d1_entry = {reqs[3]}",
-                    f"u1_entry = {reqs[4]}",
-                    f"r1_entry = {reqs[5]}",
-                ],
-                guarantees=[],
-            ),
-        )
-    ]
-    cs3: named_contracts_t = [
-        (
-            "output_soc",
-            functools.reduce(
-                PolyhedralIoContract.merge,
-                [
-                    PolyhedralIoContract.from_strings(
-                        input_vars=[],
-                        output_vars=[f"output_soc{i}"],
-                        assumptions=[],
-                        guarantees=[f"output_soc{i} >= {reqs[1]}"],
-                    )
-                    for i in range(1, 6)
-                ],
-            ),
-        )
-    ]
-    return cs1 + cs2 + cs3
+    return list(op_requirement_constraints(tuple(float(r) for r in reqs), 5, (("output_soc", range(1, 6)),)))
 
 
 def schedulability_analysis5(
@@ -79,134 +63,66 @@ def schedulability_analysis5(
         return PactiInstrumentationData().update_counts(), Schedule(scenario=scenario[0], reqs=reqs, contract=result)
     return PactiInstrumentationData().update_counts(), result
 
+def schedulability_analysis_batch(
+    scenario: Tuple[list[tuple2float], PolyhedralIoContract],
+    reqs: np.ndarray,
+    make_op_requirement_constraints: Callable[[np.ndarray], named_contracts_t],
+) -> Tuple[PactiInstrumentationData, List[schedule_result_t]]:
+    """Schedulability analysis of a scenario for each row of an array of operational requirements.
+
+    The scenario constraints are converted once into a constraint system, with a feasible point,
+    shared by the `perform_merges_seq` analyses of all the rows: each requirement row only adds
+    variable bounds to it, and its feasibility LPs start from the scenario's feasible point.
+
+    Args:
+        scenario: the scenario ranges and contract
+        reqs: an (m x 6) array of operational requirements, one per row
+        make_op_requirement_constraints: the requirement groups of a row,
+            e.g., make_op_requirement_constraints5 or make_op_requirement_constraints20
+
+    Returns:
+        The instrumentation data and, for each row, the same result as the sequential analysis.
+    """
+    system = ConstraintSystem.from_contract(scenario[1])
+    point = system.feasible_point()
+    results: List[schedule_result_t] = []
+    for row in reqs:
+        op_reqs: named_contracts_t = make_op_requirement_constraints(row)
+        result: merge_result_t = perform_merges_seq(scenario[1], op_reqs, system, point)
+        if isinstance(result, PolyhedralIoContract):
+            results.append(Schedule(scenario=scenario[0], reqs=row, contract=result))
+        else:
+            results.append(result)
+    return PactiInstrumentationData().update_counts(), results
+
+
+def schedulability_analysis5_batch(
+    scenario_reqs: Tuple[Tuple[list[tuple2float], PolyhedralIoContract], np.ndarray]
+) -> Tuple[PactiInstrumentationData, List[schedule_result_t]]:
+    return schedulability_analysis_batch(scenario_reqs[0], scenario_reqs[1], make_op_requirement_constraints5)
+
+
 def schedulability_analysis5_grouped(samples_group: Tuple[Tuple[Tuple[list[tuple2float], PolyhedralIoContract], np.ndarray], ...]) -> List[Tuple[PactiInstrumentationData, schedule_result_t]]:
     return [schedulability_analysis5(sample) for sample in samples_group]
 
+def soc_groups(steps: int) -> Tuple[Tuple[str, range], ...]:
+    """The exit soc requirement groups of a scenario, one per 5 steps, each one overlapping the previous one by a step.
+
+    Args:
+        steps: the number of steps of the scenario, a multiple of 5
+
+    Returns:
+        The name and step indices of each group.
+    """
+    return tuple((f"output_soc{k + 1}-{k + 5}", range(max(1, k), k + 6)) for k in range(0, steps, 5))
+
+
+def make_op_requirement_constraints_n(reqs: np.ndarray, steps: int) -> named_contracts_t:
+    return list(op_requirement_constraints(tuple(float(r) for r in reqs), steps, soc_groups(steps)))
+
+
 def make_op_requirement_constraints20(reqs: np.ndarray) -> named_contracts_t:
-    cs1: named_contracts_t = [
-        (
-            "durations",
-            functools.reduce(
-                PolyhedralIoContract.merge,
-                [
-                    PolyhedralIoContract.from_strings(
-                        input_vars=[var],
-                        output_vars=[], 
-                        assumptions=[f"{var} >= {reqs[2]}"], 
-                        guarantees=[]
-                    )
-                    for var in [
-                        "duration_dsn1",
-                        "duration_charging2",
-                        "duration_sbo3",
-                        "duration_tcm_h4",
-                        "duration_tcm_dv5",
-                        "duration_dsn6",
-                        "duration_charging7",
-                        "duration_sbo8",
-                        "duration_tcm_h9",
-                        "duration_tcm_dv10",
-                        "duration_dsn11",
-                        "duration_charging12",
-                        "duration_sbo13",
-                        "duration_tcm_h14",
-                        "duration_tcm_dv15",
-                        "duration_dsn16",
-                        "duration_charging17",
-                        "duration_sbo18",
-                        "duration_tcm_h19",
-                        "duration_tcm_dv20",
-                    ]
-                ],
-            ),
-        )
-    ]
-    cs2: named_contracts_t = [
-        (
-            "initial",
-            PolyhedralIoContract.from_strings(
-                input_vars=["soc1_entry", "c1_entry", "d1_entry", "u1_entry", "r1_entry"],
-                output_vars=[],
-                assumptions=[
-                    f"soc1_entry = {reqs[0]}",
-                    f"c1_entry = 0",
-                    f"d1_entry = {reqs[3]}",
-                    f"u1_entry = {reqs[4]}",
-                    f"r1_entry = {reqs[5]}",
-                ],
-                guarantees=[],
-            ),
-        )
-    ]
-    cs3: named_contracts_t = [
-        (
-            "output_soc1-5",
-            functools.reduce(
-                PolyhedralIoContract.merge,
-                [
-                    PolyhedralIoContract.from_strings(
-                        input_vars=[],
-                        output_vars=[f"output_soc{i}"],
-                        assumptions=[],
-                        guarantees=[f"output_soc{i} >= {reqs[1]}"],
-                    )
-                    for i in range(1, 6)
-                ],
-            ),
-        )
-    ]
-    cs4: named_contracts_t = [
-        (
-            "output_soc6-10",
-            functools.reduce(
-                PolyhedralIoContract.merge,
-                [
-                    PolyhedralIoContract.from_strings(
-                        input_vars=[],
-                        output_vars=[f"output_soc{i}"],
-                        assumptions=[],
-                        guarantees=[f"output_soc{i} >= {reqs[1]}"],
-                    )
-                    for i in range(5, 11)
-                ],
-            ),
-        )
-    ]
-    cs5: named_contracts_t = [
-        (
-            "output_soc11-15",
-            functools.reduce(
-                PolyhedralIoContract.merge,
-                [
-                    PolyhedralIoContract.from_strings(
-                        input_vars=[],
-                        output_vars=[f"output_soc{i}"],
-                        assumptions=[],
-                        guarantees=[f"output_soc{i} >= {reqs[1]}"],
-                    )
-                    for i in range(10, 16)
-                ],
-            ),
-        )
-    ]
-    cs6: named_contracts_t = [
-        (
-            "output_soc16-20",
-            functools.reduce(
-                PolyhedralIoContract.merge,
-                [
-                    PolyhedralIoContract.from_strings(
-                        input_vars=[],
-                        output_vars=[f"output_soc{i}"],
-                        assumptions=[],
-                        guarantees=[f"output_soc{i} >= {reqs[1]}"],
-                    )
-                    for i in range(15, 21)
-                ],
-            ),
-        )
-    ]
-    return cs1 + cs2 + cs3 + cs4 + cs5 + cs6
+    return make_op_requirement_constraints_n(reqs, 20)
 
 
 def schedulability_analysis20(
@@ -223,3 +139,71 @@ def schedulability_analysis20(
 
 def schedulability_analysis20_grouped(samples_group: Tuple[Tuple[Tuple[list[tuple2float], PolyhedralIoContract], np.ndarray], ...]) -> List[Tuple[PactiInstrumentationData, schedule_result_t]]:
     return [schedulability_analysis20(sample) for sample in samples_group]
+
+
+def schedulability_analysis20_batch(
+    scenario_reqs: Tuple[Tuple[list[tuple2float], PolyhedralIoContract], np.ndarray]
+) -> Tuple[PactiInstrumentationData, List[schedule_result_t]]:
+    return schedulability_analysis_batch(scenario_reqs[0], scenario_reqs[1], make_op_requirement_constraints20)
+
+
+# Maximum number of deserialized scenarios kept per worker process by `stored_scenario`.
+stored_scenario_cache_size = 8
+
+scenario_reqs_t = Tuple[Tuple[list[tuple2float], PolyhedralIoContract], np.ndarray]
+
+
+@functools.lru_cache(maxsize=stored_scenario_cache_size)
+def stored_scenario(scenarios_path: str, i: int) -> Tuple[list[tuple2float], PolyhedralIoContract]:
+    return open_contract_store(scenarios_path).scenario(i)
+
+
+@functools.lru_cache(maxsize=None)
+def stored_requirements(reqs_path: str) -> np.ndarray:
+    return np.load(reqs_path, mmap_mode="r")
+
+
+def schedulability_analysis_stored(
+    scenarios_path: str,
+    reqs_path: str,
+    analysis: Callable[[scenario_reqs_t], Tuple[PactiInstrumentationData, schedule_result_t]],
+    task: Tuple[int, int],
+) -> Tuple[PactiInstrumentationData, schedule_result_t]:
+    """Schedulability analysis of a stored scenario for a stored row of operational requirements.
+
+    The scenarios and requirements are read from memory-mapped files opened once per process,
+    so that a task only carries the indices of its scenario and requirement row.
+
+    Args:
+        scenarios_path: a contract store of scenarios, saved with `save_scenarios`
+        reqs_path: an .npy file of operational requirements, one per row
+        analysis: schedulability_analysis5 or schedulability_analysis20
+        task: the scenario index and the requirement row index
+
+    Returns:
+        The result of the analysis.
+    """
+    scenario = stored_scenario(scenarios_path, task[0])
+    reqs = np.array(stored_requirements(reqs_path)[task[1]])
+    return analysis((scenario, reqs))
+
+
+def schedulability_analysis_stored_batch(
+    scenarios_path: str,
+    reqs_path: str,
+    analysis_batch: Callable[[scenario_reqs_t], Tuple[PactiInstrumentationData, List[schedule_result_t]]],
+    task: int,
+) -> Tuple[PactiInstrumentationData, List[schedule_result_t]]:
+    """Schedulability analysis of a stored scenario for all the stored rows of operational requirements.
+
+    Args:
+        scenarios_path: a contract store of scenarios, saved with `save_scenarios`
+        reqs_path: an .npy file of operational requirements, one per row
+        analysis_batch: schedulability_analysis5_batch or schedulability_analysis20_batch
+        task: the scenario index
+
+    Returns:
+        The result of the analysis.
+    """
+    scenario = stored_scenario(scenarios_path, task)
+    return analysis_batch((scenario, np.array(stored_requirements(reqs_path))))
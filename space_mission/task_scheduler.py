@@ -0,0 +1,123 @@
+"""Adaptive scheduling of analysis tasks over a process pool."""
+import os
+import queue
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from multiprocess import Pool
+from tqdm import tqdm
+
+
+@dataclass
+class WorkerUtilization:
+    """Busy time and number of tasks of each worker process during a scheduled run."""
+
+    busy: Dict[int, float] = field(default_factory=dict)
+    tasks: Dict[int, int] = field(default_factory=dict)
+    chunks: Dict[int, int] = field(default_factory=dict)
+    wall_time: float = 0.0
+
+    def record(self, pid: int, busy: float, tasks: int) -> None:
+        self.busy[pid] = self.busy.get(pid, 0.0) + busy
+        self.tasks[pid] = self.tasks.get(pid, 0) + tasks
+        self.chunks[pid] = self.chunks.get(pid, 0) + 1
+
+    def utilization(self, pid: int) -> float:
+        """
+        Args:
+            pid: a worker process id
+
+        Returns:
+            The fraction of the wall time during which the worker ran tasks.
+        """
+        return self.busy[pid] / self.wall_time if self.wall_time > 0 else 0.0
+
+    def stats(self) -> str:
+        """
+        Returns:
+            A per-worker report of the tasks, chunks, busy time and utilization, and their mean utilization.
+        """
+        lines = [
+            f"worker {pid}: {self.tasks[pid]} tasks in {self.chunks[pid]} chunks, "
+            f"busy {self.busy[pid]:.3f}s ({100 * self.utilization(pid):.1f}%)"
+            for pid in sorted(self.busy)
+        ]
+        if self.busy:
+            mean = sum(self.utilization(pid) for pid in self.busy) / len(self.busy)
+            lines.append(f"{len(self.busy)} workers, wall time {self.wall_time:.3f}s, mean utilization {100 * mean:.1f}%")
+        return "\n".join(lines)
+
+
+def _run_chunk(function: Callable[[Any], Any], chunk: List[Tuple[int, Any]]) -> Tuple[int, float, List[Tuple[int, Any]]]:
+    ta = time.time()
+    results = [(i, function(task)) for i, task in chunk]
+    return os.getpid(), time.time() - ta, results
+
+
+def adaptive_imap(
+    function: Callable[[Any], Any],
+    tasks: Sequence[Tuple[int, Any]],
+    cost: Optional[Callable[[Any], float]] = None,
+    num_cpus: Optional[int] = None,
+    target_chunk_seconds: float = 2.0,
+    utilization: Optional[WorkerUtilization] = None,
+) -> Iterator[Tuple[int, Any]]:
+    """
+    Applies a function to indexed tasks in a process pool, yielding the results as they complete.
+
+    Tasks are started in decreasing order of estimated cost so that the most expensive ones do not
+    end up in the tail of the run. Each idle worker takes the next chunk of tasks, whose size is
+    adapted to the observed mean task latency so that a chunk takes about `target_chunk_seconds`,
+    but never more than the remaining tasks divided by twice the number of workers (guided
+    self-scheduling): chunks shrink towards the end of the run and the load stays balanced.
+
+    Args:
+        function: the function applied to each task, picklable with dill
+        tasks: the (index, task) pairs
+        cost: estimates the relative cost of a task; tasks are taken in order if not provided
+        num_cpus: the number of worker processes, os.cpu_count() by default
+        target_chunk_seconds: the target duration of a chunk of tasks
+        utilization: if provided, updated with the busy time of each worker
+
+    Yields:
+        The (index, result) pairs, in order of completion.
+    """
+    pending = sorted(tasks, key=lambda t: -cost(t[1])) if cost else list(tasks)
+    workers = num_cpus or os.cpu_count() or 1
+    completed: queue.Queue = queue.Queue()
+    elapsed = 0.0
+    done = 0
+    ta = time.time()
+    with Pool(workers) as pool, tqdm(total=len(pending)) as progress:
+
+        def submit() -> None:
+            nonlocal pending
+            if not pending:
+                return
+            # Until a task has completed, send single tasks to measure latency.
+            size = max(1, round(target_chunk_seconds * done / elapsed)) if elapsed > 0 else 1
+            size = max(1, min(size, len(pending) // (2 * workers)))
+            chunk, pending = pending[:size], pending[size:]
+            pool.apply_async(_run_chunk, (function, chunk), callback=completed.put, error_callback=completed.put)
+
+        in_flight = min(workers, len(pending))
+        for _ in range(in_flight):
+            submit()
+        while in_flight:
+            outcome = completed.get()
+            in_flight -= 1
+            if isinstance(outcome, BaseException):
+                raise outcome
+            pid, busy, results = outcome
+            elapsed += busy
+            done += len(results)
+            if utilization is not None:
+                utilization.record(pid, busy, len(results))
+            if pending:
+                submit()
+                in_flight += 1
+            progress.update(len(results))
+            yield from results
+    if utilization is not None:
+        utilization.wall_time = time.time() - ta
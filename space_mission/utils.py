@@ -1,7 +1,7 @@
 from pacti.terms.polyhedra import PolyhedralTerm, PolyhedralTermList
 from pacti.contracts import PolyhedralIoContract
 from pacti.iocontract import Var
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 from pacti import write_contracts_to_file
 import pacti.utils.plots as plh_plots
 import matplotlib.pyplot as plt
@@ -9,13 +9,17 @@ from matplotlib.figure import Figure as MplFigure
 from matplotlib.patches import Polygon as MplPatchPolygon
 from matplotlib.axes import Axes
 import numpy as np
-import operator
+import functools
 import sys
 import re
+import time
 from typing import Optional
 from collections import Counter
+from dataclasses import dataclass
 
     
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix
 from scipy.spatial import QhullError
 
 from cpuinfo import get_cpu_info
@@ -37,8 +41,205 @@ def check_tuple(t: tuple2) -> tuple2float:
         b = t[1]
     return (a, b)
 
-def get_numerical_bounds(c: PolyhedralIoContract, var: str) -> tuple2float:
-    return check_tuple(c.get_variable_bounds(var))
+bound_modes = ("lp", "interval", "tightened")
+
+
+def constraint_entries(
+    c: PolyhedralIoContract,
+) -> Tuple[Dict[str, int], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Lists the nonzero coefficients of the assumptions and guarantees of a contract, as `A x <= b`.
+
+    Args:
+        c: PolyhedralIoContract
+
+    Returns:
+        The column of each variable, the row, column and value of each nonzero coefficient, and the constants.
+    """
+    terms: List[PolyhedralTerm] = c.a.terms + c.g.terms
+    columns: Dict[str, int] = {v.name: i for i, v in enumerate(c.vars)}
+    rows = np.repeat(np.arange(len(terms)), [len(t.variables) for t in terms])
+    cols = np.array([columns[v.name] for t in terms for v in t.variables], dtype=np.int64)
+    data = np.array([coeff for t in terms for coeff in t.variables.values()], dtype=float)
+    return columns, rows, cols, data, np.array([t.constant for t in terms], dtype=float)
+
+
+# Constraint matrices with fewer entries are passed to the LPs as dense arrays: for small contracts,
+# the overhead of sparse LP inputs outweighs the savings.
+sparse_min_entries = 10_000
+
+
+def termlist_csr(ptl: PolyhedralTermList, columns: Dict[str, int]) -> Tuple[csr_matrix, np.ndarray]:
+    """
+    Converts a term list into a sparse matrix-vector pair, as `A x <= b`, for a fixed variable-to-column assignment.
+
+    Unlike `termlist_to_polytope`, only the nonzero coefficients are stored: the composed contracts have
+    hundreds of variables but only a few per constraint.
+
+    Args:
+        ptl: a term list whose variables all have a column
+        columns: the column index of each variable name
+
+    Returns:
+        The CSR matrix and the constant vector of the terms.
+    """
+    rows = np.repeat(np.arange(len(ptl.terms)), [len(t.variables) for t in ptl.terms])
+    cols = np.array([columns[v.name] for t in ptl.terms for v in t.variables], dtype=np.int64)
+    data = np.array([coeff for t in ptl.terms for coeff in t.variables.values()], dtype=float)
+    mat = csr_matrix((data, (rows, cols)), shape=(len(ptl.terms), len(columns)))
+    return mat, np.array([t.constant for t in ptl.terms], dtype=float)
+
+
+def _lp_bounds(mat: Union[np.ndarray, csr_matrix], vec: np.ndarray, columns: Dict[str, int], variables: List[str]) -> np.ndarray:
+    result = np.full((len(variables), 2), np.nan)
+    objective = np.zeros(len(columns))
+    for k, var in enumerate(variables):
+        if var not in columns:
+            continue
+        for side, polarity in ((0, 1.0), (1, -1.0)):
+            objective[columns[var]] = polarity
+            res = linprog(objective, A_ub=mat, b_ub=vec, bounds=(None, None), method="highs")
+            objective[columns[var]] = 0.0
+            if res.status == 0:
+                result[k, side] = polarity * res.fun
+            elif res.status != 3:
+                raise ValueError("Constraints are unfeasible")
+    return result
+
+
+def _propagate(
+    lo: np.ndarray,
+    hi: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    data: np.ndarray,
+    vec: np.ndarray,
+    tolerance: float,
+) -> bool:
+    # For each coefficient a_rj of a row sum_k a_rk x_k <= b_r, x_j is bounded by
+    # (b_r - the least value of the other terms) / a_rj, where the other terms are bounded below.
+    least = np.where(data > 0, data * lo[cols], data * hi[cols])
+    unbounded = np.isneginf(least)
+    finite = np.where(unbounded, 0.0, least)
+    n_unbounded = np.bincount(rows, weights=unbounded, minlength=len(vec))
+    total = np.bincount(rows, weights=finite, minlength=len(vec))
+    bounded = n_unbounded[rows] - unbounded == 0
+    bound = (vec[rows] - total[rows] + finite) / data
+    changed = False
+    for target, update, side in ((hi, np.minimum.at, data > 0), (lo, np.maximum.at, data < 0)):
+        selected = cols[side & bounded]
+        before = target[selected]
+        update(target, selected, bound[side & bounded])
+        after = target[selected]
+        with np.errstate(invalid="ignore"):
+            changed |= bool(np.any(np.abs(after - before) > tolerance * (1 + np.abs(after))))
+    return changed
+
+
+def interval_bounds(
+    c: PolyhedralIoContract, variables: List[str], max_passes: int = 8, tolerance: float = 1e-9
+) -> np.ndarray:
+    """
+    Computes outer bounds of variables in the context of a contract by interval propagation.
+
+    Each constraint bounds each of its variables given the intervals of the others. The constraints are
+    grouped by step, the largest step index in their variable names, and the propagation walks the step chain
+    forward then backward, updating the intervals of each step's variables at once, until no interval shrinks.
+    The bounds are sound, i.e., they contain the exact ones from `all_variable_bounds`, but may be looser.
+
+    Args:
+        c: PolyhedralIoContract
+        variables: the variable names
+        max_passes: the maximum number of passes over the step chain
+        tolerance: the relative change of a bound below which it is considered unchanged
+
+    Returns:
+        A (len(variables) x 2) array of the lower and upper bound of each variable, NaN where it is unbounded.
+
+    Raises:
+        ValueError: The constraints are unfeasible.
+    """
+    columns, rows, cols, data, vec = constraint_entries(c)
+    if np.any(vec[np.bincount(rows, minlength=len(vec)) == 0] < 0):
+        raise ValueError("Constraints are unfeasible")
+    column_steps = np.array([max(indexed_name(name).indices, default=0) for name in columns], dtype=np.int64)
+    row_steps = np.zeros(len(vec), dtype=np.int64)
+    np.maximum.at(row_steps, rows, column_steps[cols])
+    # The coefficients of the rows of each step, with the rows numbered within the step.
+    order = np.lexsort((rows, row_steps[rows]))
+    rows, cols, data = rows[order], cols[order], data[order]
+    _, starts = np.unique(row_steps[rows], return_index=True)
+    groups = []
+    for a, b in zip(starts, list(starts[1:]) + [len(rows)]):
+        group_rows, local_rows = np.unique(rows[a:b], return_inverse=True)
+        groups.append((local_rows.reshape(-1), cols[a:b], data[a:b], vec[group_rows]))
+
+    lo = np.full(len(columns), -np.inf)
+    hi = np.full(len(columns), np.inf)
+    for p in range(max_passes):
+        changed = False
+        for group in groups if p % 2 == 0 else groups[::-1]:
+            changed |= _propagate(lo, hi, *group, tolerance)
+        if not changed:
+            break
+    if np.any(lo > hi + tolerance * (1 + np.abs(hi))):
+        raise ValueError("Constraints are unfeasible")
+
+    result = np.full((len(variables), 2), np.nan)
+    for k, var in enumerate(variables):
+        if var in columns:
+            result[k] = lo[columns[var]], hi[columns[var]]
+    result[np.isinf(result)] = np.nan
+    return result
+
+
+def all_variable_bounds(
+    c: PolyhedralIoContract, variables: List[str], mode: str = "lp", width_tolerance: float = 1e-6
+) -> np.ndarray:
+    """
+    Computes the bounds of variables in the context of a contract, as `get_variable_bounds` does for each one.
+
+    The constraint matrix of the assumptions and guarantees is built once, as a sparse matrix for large contracts,
+    and shared by the minimization and maximization LPs of all the variables, instead of being rebuilt from the terms
+    for each LP.
+
+    Args:
+        c: PolyhedralIoContract
+        variables: the variable names
+        mode: "lp" for the exact bounds; "interval" for the outer bounds of `interval_bounds`;
+            "tightened" for the interval bounds, replaced by the exact ones where wider than `width_tolerance`
+        width_tolerance: the interval width above which the "tightened" mode solves the LPs of a variable
+
+    Returns:
+        A (len(variables) x 2) array of the minimum and maximum of each variable, NaN where it is unbounded.
+
+    Raises:
+        ValueError: The constraints are unfeasible, or the mode is unknown.
+    """
+    if mode not in bound_modes:
+        raise ValueError(f"Unknown bound mode {mode}; expected one of {bound_modes}")
+    if mode != "lp":
+        result = interval_bounds(c, variables)
+        if mode == "interval":
+            return result
+        with np.errstate(invalid="ignore"):
+            wide = ~(result[:, 1] - result[:, 0] <= width_tolerance)
+        variables = [v for v, w in zip(variables, wide) if w]
+    columns, rows, cols, data, vec = constraint_entries(c)
+    mat = csr_matrix((data, (rows, cols)), shape=(len(vec), len(columns)))
+    if mat.shape[0] * mat.shape[1] < sparse_min_entries:
+        mat = mat.toarray()
+    if mode == "lp":
+        return _lp_bounds(mat, vec, columns, variables)
+    result[wide] = _lp_bounds(mat, vec, columns, variables)
+    return result
+
+def get_all_numerical_bounds(c: PolyhedralIoContract, variables: List[str], mode: str = "lp") -> List[tuple2float]:
+    """The numerical bounds of variables, as `get_numerical_bounds` for each one, from `all_variable_bounds`."""
+    return [(float(lo), float(hi)) for lo, hi in np.nan_to_num(all_variable_bounds(c, variables, mode), nan=-1.0)]
+
+def get_numerical_bounds(c: PolyhedralIoContract, var: str, mode: str = "lp") -> tuple2float:
+    return get_all_numerical_bounds(c, [var], mode)[0]
 
 def nochange_contract(step: int, name: str) -> PolyhedralIoContract:
     """
@@ -138,7 +339,7 @@ def bound(c: PolyhedralIoContract, var: str) -> Tuple[str, str]:
         return "unknown", "unknown"
 
 
-def bounds(c: PolyhedralIoContract) -> List[str]:
+def bounds(c: PolyhedralIoContract, mode: str = "lp") -> List[str]:
     """
     Produces the list of input and output variable bounds for a contract.
 
@@ -146,19 +347,22 @@ def bounds(c: PolyhedralIoContract) -> List[str]:
         c: PolyhedralIoContract
             A Pacti contract
 
+        mode: str
+            The bound mode of `all_variable_bounds`.
+
     Returns:
         The list of bounds for all input variables followed by those for the output variables.
     """
-    bounds = []
-    for v in sorted(c.inputvars, key=operator.attrgetter("name")):
-        low, high = bound(c, v.name)
-        bounds.append(f" input {v.name} in [{low},{high}]")
-
-    for v in sorted(c.outputvars, key=operator.attrgetter("name")):
-        low, high = bound(c, v.name)
-        bounds.append(f"output {v.name} in [{low},{high}]")
-
-    return bounds
+    inputs = sorted(v.name for v in c.inputvars)
+    outputs = sorted(v.name for v in c.outputvars)
+    try:
+        values = [
+            ["None" if np.isnan(b) else f"{b:.2f}" for b in row] for row in all_variable_bounds(c, inputs + outputs, mode)
+        ]
+    except ValueError:
+        values = [["unknown", "unknown"]] * (len(inputs) + len(outputs))
+    kinds = [" input"] * len(inputs) + ["output"] * len(outputs)
+    return [f"{kind} {v} in [{low},{high}]" for kind, v, (low, high) in zip(kinds, inputs + outputs, values)]
 
 
 def polyhedral_term_key(t: PolyhedralTerm) -> str:
@@ -275,28 +479,97 @@ def calculate_output_bounds_for_input_value(
     return get_bounds(ptl.evaluate(inputs).simplify(), output.name)
 
 
+class PolygonSlice:
+    """
+    The vertical slices of the polygon of a polyhedral term list of two variables.
+
+    The polygon vertices are computed once; the bounds of the y variable at an x value are the extreme
+    intersections of the vertical line at x with the polygon edges, computed at once for all edges
+    and memoized for repeated x values. For a bounded polygon, these are the bounds that
+    `calculate_output_bounds_for_input_value` computes with LPs.
+
+    An unbounded polygon can be clipped by adding the constraints of a box to the term list: the bounds
+    of the y variable on the box's horizontal edges are then reported as infinite.
+    """
+
+    def __init__(
+        self,
+        ptl: PolyhedralTermList,
+        x_var: Var,
+        y_var: Var,
+        cache_size: int = 1024,
+        y_clip: Optional[Tuple[float, float]] = None,
+    ):
+        """
+        Computes the polygon vertices.
+
+        Args:
+            ptl: a polyhedral term list of the two variables
+            x_var: the horizontal axis variable
+            y_var: the vertical axis variable
+            cache_size: the number of x values whose bounds are memoized
+            y_clip: the lower and upper y limits of the box clipping the polygon, if the term list includes one
+
+        Raises:
+            ValueError: The polygon is empty or unbounded, or the term list does not involve exactly the two variables.
+        """
+        self.x_var = x_var
+        self.y_var = y_var
+        variables, a_mat, b, _, _ = PolyhedralTermList.termlist_to_polytope(ptl, PolyhedralTermList([]))
+        if set(variables) != {x_var, y_var}:
+            raise ValueError(f"The term list must involve only and both {x_var.name} and {y_var.name}")
+        a_mat = a_mat[:, [variables.index(x_var), variables.index(y_var)]]
+        x, y = plh_plots._get_bounding_vertices(a_mat, b)
+        self.x: np.ndarray = np.array(x, dtype=float)
+        self.y: np.ndarray = np.array(y, dtype=float)
+        if not (np.isfinite(self.x).all() and np.isfinite(self.y).all()):
+            raise ValueError(f"The polygon of {x_var.name} and {y_var.name} is unbounded")
+        # The edges from each vertex to the next one, the last one closing the polygon.
+        self._x1, self._y1 = np.roll(self.x, -1), np.roll(self.y, -1)
+        self._xmin, self._xmax = np.minimum(self.x, self._x1), np.maximum(self.x, self._x1)
+        self.y_clip = y_clip
+        self.bounds_at = functools.lru_cache(maxsize=cache_size)(self._bounds_at)
+
+    def _bounds_at(self, x: float) -> Optional[Tuple[float, float]]:
+        crossed = (self._xmin <= x) & (x <= self._xmax)
+        if not crossed.any():
+            return None
+        x0, y0, x1, y1 = self.x[crossed], self.y[crossed], self._x1[crossed], self._y1[crossed]
+        dx = x1 - x0
+        vertical = dx == 0
+        # A vertical edge contributes both of its ends.
+        t = np.divide(x - x0, dx, out=np.zeros_like(dx), where=~vertical)
+        ys = np.concatenate([y0 + t * (y1 - y0), y1[vertical]])
+        y_min, y_max = float(ys.min()), float(ys.max())
+        # A bound on an edge of the clipping box is not a bound of the term list.
+        if self.y_clip is not None:
+            if np.isclose(y_min, self.y_clip[0]):
+                y_min = -np.inf
+            if np.isclose(y_max, self.y_clip[1]):
+                y_max = np.inf
+        return y_min, y_max
+
+    def vertices(self) -> List[List[float]]:
+        """The polygon vertices, as the `xy` of a matplotlib `Polygon`."""
+        return np.column_stack([self.x, self.y]).tolist()
+
+
+def _slice_title(polygon: PolygonSlice, x_coord: float) -> str:
+    # Outside of the polygon, report the same values as get_bounds does for an infeasible LP.
+    y_min, y_max = polygon.bounds_at(x_coord) or (sys.float_info.min, sys.float_info.max)
+    return f"@ {polygon.x_var.name}={x_coord:.2f}\n{y_min:.2f} <= {polygon.y_var.name} <= {y_max:.2f}"
+
+
 # Add a callback function for the mouse click event
-def _on_hover(ptl: PolyhedralTermList, x_var: Var, y_var: Var, fig, ax: Axes, event):
+def _on_hover(polygon: PolygonSlice, fig, ax: Axes, event):
     if event.inaxes == ax:
-        x_coord, y_coord = event.xdata, event.ydata
-        y_min, y_max = calculate_output_bounds_for_input_value(
-            ptl, {x_var: x_coord}, y_var
-        )
-        ax.set_title(
-            f"@ {x_var.name}={x_coord:.2f}\n{y_min:.2f} <= {y_var.name} <= {y_max:.2f}"
-        )
+        ax.set_title(_slice_title(polygon, event.xdata))
         fig.canvas.draw_idle()
 
-def _on_hovers(ptls: List[PolyhedralTermList], x_var: Var, y_vars: List[Var], fig, axl: List[Axes], event):
+def _on_hovers(polygons: List[PolygonSlice], fig, axl: List[Axes], event):
     if event.inaxes in axl:
-        x_coord = event.xdata
-        for i, ax in enumerate(axl):
-            y_min, y_max = calculate_output_bounds_for_input_value(
-                ptls[i], {x_var: x_coord}, y_vars[i]
-            )
-            axl[i].set_title(
-                f"@ {x_var.name}={x_coord:.2f}\n{y_min:.2f} <= {y_vars[i].name} <= {y_max:.2f}"
-            )
+        for polygon, ax in zip(polygons, axl):
+            ax.set_title(_slice_title(polygon, event.xdata))
         fig.canvas.draw_idle()
 
 
@@ -326,12 +599,7 @@ def plot_input_output_polyhedral_term_list(
     """
     x_lims = get_bounds(ptl, x_var.name)
     y_lims = get_bounds(ptl, y_var.name)
-    res_tuple = PolyhedralTermList.termlist_to_polytope(ptl, PolyhedralTermList([]))
-    # variables = res_tuple[0]
-    a_mat = res_tuple[1]
-    b = res_tuple[2]
-
-    x, y = plh_plots._get_bounding_vertices(a_mat, b)
+    polygon = PolygonSlice(ptl, x_var, y_var)
 
     # generate figure
     fig = plt.figure()
@@ -343,8 +611,7 @@ def plot_input_output_polyhedral_term_list(
     ax.set_aspect((x_lims[1] - x_lims[0]) / (y_lims[1] - y_lims[0]))
 
     poly = MplPatchPolygon(
-        xy=np.column_stack([x, y]).tolist(),
-        # xy=np.column_stack([x, y]).flatten().tolist(),
+        xy=polygon.vertices(),
         animated=False,
         closed=True,
         facecolor="deepskyblue",
@@ -354,7 +621,7 @@ def plot_input_output_polyhedral_term_list(
 
     # Connect the event to the callback function
     fig.canvas.mpl_connect(
-        "button_press_event", lambda event: _on_hover(ptl, x_var, y_var, fig, ax, event)
+        "button_press_event", lambda event: _on_hover(polygon, fig, ax, event)
     )
 
     return fig
@@ -424,24 +691,16 @@ def plot_input_outputs_polyhedral_term_list(
         constrained_layout=True
     )
 
-    ptls: List[PolyhedralTermList] = []
+    polygons: List[PolygonSlice] = []
     axl: List[Axes] = []
     for i, y_var in enumerate(y_vars):
         y_ptl: PolyhedralTermList = retain_constraints_involving_variables(
             ptl, [x_var, y_var]
         )
-        ptls.append(y_ptl)
         y_lim: Tuple[float, float] = get_bounds(y_ptl, y_var.name)
 
-        res_tuple = PolyhedralTermList.termlist_to_polytope(
-            y_ptl, PolyhedralTermList([])
-        )
-        # variables = res_tuple[0]
-        a_mat: np.ndarray = res_tuple[1]
-        b: np.ndarray = res_tuple[2]
-
         try:
-            x, y = plh_plots._get_bounding_vertices(a_mat, b)
+            polygon = PolygonSlice(y_ptl, x_var, y_var)
 
             ax: Axes = axs if num_plots == 1 else axs[i]
             ax.set_xlim(x_lims)
@@ -451,14 +710,14 @@ def plot_input_outputs_polyhedral_term_list(
             ax.set_aspect((x_lims[1] - x_lims[0]) / (y_lim[1] - y_lim[0]))
 
             poly = MplPatchPolygon(
-                xy=np.column_stack([x, y]).tolist(),
-                # xy=np.column_stack([x, y]).flatten().tolist(),
+                xy=polygon.vertices(),
                 animated=False,
                 closed=True,
                 facecolor="deepskyblue",
                 edgecolor="deepskyblue",
             )
             ax.add_patch(poly)
+            polygons.append(polygon)
             axl.append(ax)
         except QhullError as e:
             print(f"x_var: {x_var.name}, y_var: {y_var.name}")
@@ -470,10 +729,15 @@ def plot_input_outputs_polyhedral_term_list(
             print(f"term list\n" + show_termlist(y_ptl))
             print(f"IndexError: {e}")
             pass
+        except ValueError as e:
+            print(f"x_var: {x_var.name}, y_var: {y_var.name}")
+            print(f"term list\n" + show_termlist(y_ptl))
+            print(f"ValueError: {e}")
+            pass
 
     # Connect the event to the callback function
     fig.canvas.mpl_connect(
-        "button_press_event", lambda event: _on_hovers(ptls, x_var, y_vars, fig, axl, event)
+        "button_press_event", lambda event: _on_hovers(polygons, fig, axl, event)
     )
 
     return fig
@@ -632,19 +896,61 @@ def add_constant_and_replace(s: str, constant: int) -> str:
     # Use re.sub with a function as the replacement argument
     return re.sub(r'\d+', replacer, s)
 
+@dataclass(frozen=True)
+class IndexedName:
+    """A variable name split into its step indices and the text around them.
+
+    For example, `t4_exit` has parts ("t", "_exit") and indices (4,), and `output_trtd3` has parts ("output_trtd", "").
+    """
+
+    parts: Tuple[str, ...]
+    indices: Tuple[int, ...]
+
+    def shifted(self, offset: int) -> str:
+        return self.parts[0] + "".join(str(i + offset) + p for i, p in zip(self.indices, self.parts[1:]))
+
+
+@functools.lru_cache(maxsize=None)
+def indexed_name(name: str) -> IndexedName:
+    return IndexedName(tuple(re.split(r"\d+", name)), tuple(int(i) for i in re.findall(r"\d+", name)))
+
+
+@functools.lru_cache(maxsize=None)
+def shifted_var(name: str, offset: int) -> Var:
+    """The variable whose step indices are those of the named variable plus an offset, as `add_constant_and_replace`.
+
+    Names are parsed once and the shifted variables are memoized: shifting a contract only relabels its variables.
+    """
+    return Var(indexed_name(name).shifted(offset))
+
+
 def contract_shift(c: PolyhedralIoContract, offset: int) -> PolyhedralIoContract:
-    a_vars, a_a, a_b, _, _ = PolyhedralTermList.termlist_to_polytope(c.a, PolyhedralTermList())
-    a_renamed = [Var(add_constant_and_replace(s=v.name, constant=offset)) for v in a_vars]
-    a_shifted = PolyhedralTermList.polytope_to_termlist(a_a, a_b, a_renamed)
-    
-    g_vars, g_a, g_b, _, _ = PolyhedralTermList.termlist_to_polytope(c.g, PolyhedralTermList())
-    g_renamed = [Var(add_constant_and_replace(s=v.name, constant=offset)) for v in g_vars]
-    g_shifted = PolyhedralTermList.polytope_to_termlist(g_a, g_b, g_renamed)
-    
-    inputs_shifted = [Var(add_constant_and_replace(s=v.name, constant=offset)) for v in c.inputvars]
-    outputs_shifted = [Var(add_constant_and_replace(s=v.name, constant=offset)) for v in c.outputvars]
-    
-    return PolyhedralIoContract(a_shifted, g_shifted, inputs_shifted, outputs_shifted)
+    """Shifts the step indices of the variables of a contract.
+
+    The terms keep their coefficients and constants; only their variables are relabeled.
+    Since the constraints are unchanged, the guarantees are not simplified again.
+
+    Args:
+        c: PolyhedralIoContract
+        offset: the number of steps to add to each step index
+
+    Returns:
+        The shifted contract.
+    """
+    remap: Dict[Var, Var] = {v: shifted_var(v.name, offset) for v in c.inputvars + c.outputvars}
+
+    def shift_terms(ptl: PolyhedralTermList) -> PolyhedralTermList:
+        return PolyhedralTermList(
+            [PolyhedralTerm({remap[v]: coeff for v, coeff in t.variables.items()}, t.constant) for t in ptl.terms]
+        )
+
+    return PolyhedralIoContract(
+        shift_terms(c.a),
+        shift_terms(c.g),
+        [remap[v] for v in c.inputvars],
+        [remap[v] for v in c.outputvars],
+        simplify=False,
+    )
 
 def contract_statistics(c: PolyhedralIoContract) -> Tuple[float, List[Tuple[int, int]]]:
     """For a given contract, calculate summary statistics about its assumptions and guarantees.
@@ -668,4 +974,151 @@ def contract_statistics(c: PolyhedralIoContract) -> Tuple[float, List[Tuple[int,
     # Convert Counter to sorted list of tuples
     sorted_counts = sorted(count_occurrences.items(), reverse=True)
     
-    return density, sorted_counts
\ No newline at end of file
+    return density, sorted_counts
+
+def composition_cost(c: PolyhedralIoContract) -> float:
+    """Estimates the cost of composing a contract as the number of nonzero coefficients of its constraints.
+
+    This is the product of the constraint count, the number of variables and the density of `contract_statistics`.
+    """
+    terms: int = len(c.a.terms) + len(c.g.terms)
+    if terms == 0:
+        return 0.0
+    density, _ = contract_statistics(c)
+    return density * len(c.vars) * terms
+
+
+@dataclass(frozen=True)
+class CompositionPlan:
+    """A binary tree of compositions over a chain of step contracts.
+
+    A leaf is the contract at index `first == last`; an inner node composes the chain of its `left` subtree
+    with that of its `right` subtree, which starts right after it. The cost is the sum of the leaf costs.
+    """
+
+    first: int
+    last: int
+    cost: float
+    left: Optional["CompositionPlan"] = None
+    right: Optional["CompositionPlan"] = None
+
+    def depth(self) -> int:
+        if self.left is None or self.right is None:
+            return 0
+        return 1 + max(self.left.depth(), self.right.depth())
+
+    def subtrees(self, depth: int) -> List["CompositionPlan"]:
+        """The subtrees at a given depth below this node, and the leaves above it, from left to right."""
+        if depth == 0 or self.left is None or self.right is None:
+            return [self]
+        return self.left.subtrees(depth - 1) + self.right.subtrees(depth - 1)
+
+
+@dataclass(frozen=True)
+class CompositionRecord:
+    """Timing, tactics and size of the composition of an inner node of a composition plan."""
+
+    first: int
+    last: int
+    compose_time: float
+    tactics: List[List[Tuple[int, float, int]]]
+    variables: int
+    constraints: int
+
+
+def plan_balanced_composition(steps: List[PolyhedralIoContract]) -> CompositionPlan:
+    """Arranges a chain of step contracts into a cost-balanced binary composition tree.
+
+    Each chain is split where the estimated costs (see `composition_cost`) of its two halves are the closest,
+    so that the operands of each composition have similar sizes and the largest composition, at the root,
+    happens only once instead of at every step of a linear chain.
+
+    Args:
+        steps: the contracts of the chain, in sequence order
+
+    Returns:
+        The composition plan.
+
+    Raises:
+        ValueError: there are no steps.
+    """
+    if not steps:
+        raise ValueError("Cannot plan the composition of an empty chain.")
+    prefix = np.concatenate(([0.0], np.cumsum([composition_cost(c) for c in steps])))
+
+    def plan(first: int, last: int) -> CompositionPlan:
+        cost = float(prefix[last + 1] - prefix[first])
+        if first == last:
+            return CompositionPlan(first, last, cost)
+        # Split after k, with ties broken towards the middle of the chain.
+        k = min(
+            range(first, last),
+            key=lambda k: (abs(2 * prefix[k + 1] - prefix[first] - prefix[last + 1]), abs(2 * k + 1 - first - last)),
+        )
+        return CompositionPlan(first, last, cost, plan(first, k), plan(k + 1, last))
+
+    return plan(0, len(steps) - 1)
+
+
+def _compose_subtree(
+    plan: CompositionPlan,
+    steps: List[PolyhedralIoContract],
+    ends: List[int],
+    variables: List[str],
+    tactics_order: Optional[List[int]],
+    done: Dict[Tuple[int, int], Tuple[PolyhedralIoContract, List[CompositionRecord]]],
+) -> Tuple[PolyhedralIoContract, List[CompositionRecord]]:
+    if (plan.first, plan.last) in done:
+        return done[(plan.first, plan.last)]
+    if plan.left is None or plan.right is None:
+        return steps[plan.first], []
+    c1, left_records = _compose_subtree(plan.left, steps, ends, variables, tactics_order, done)
+    c2, right_records = _compose_subtree(plan.right, steps, ends, variables, tactics_order, done)
+    ta = time.time()
+    c12, tactics = scenario_sequence(
+        c1=c1, c2=c2, variables=variables, c1index=ends[plan.left.last], tactics_order=tactics_order
+    )
+    c12.simplify()
+    record = CompositionRecord(
+        plan.first, plan.last, time.time() - ta, tactics, len(c12.vars), len(c12.a.terms) + len(c12.g.terms)
+    )
+    return c12, left_records + right_records + [record]
+
+
+def compose_plan(
+    plan: CompositionPlan,
+    steps: List[PolyhedralIoContract],
+    ends: List[int],
+    variables: List[str],
+    tactics_order: Optional[List[int]] = None,
+    parallel_depth: int = 0,
+    subtree_map: Callable[..., Iterable[Tuple[PolyhedralIoContract, List[CompositionRecord]]]] = map,
+) -> Tuple[PolyhedralIoContract, List[CompositionRecord]]:
+    """Composes a chain of step contracts following a composition plan.
+
+    Each composition connects the exit variables of the last step of its left chain to the entry variables
+    of its right chain with `scenario_sequence` and simplifies the result.
+    The subtrees at `parallel_depth` are independent: they are composed with `subtree_map`, e.g., p_tqdm.p_map
+    to compose them in parallel processes, before the compositions above them.
+
+    Args:
+        plan: the composition plan, e.g., from `plan_balanced_composition`
+        steps: the contracts of the chain, in sequence order
+        ends: the step number of the last step of each contract
+        variables: list of entry/exit variable names for renaming
+        tactics_order: the order of tactics to try for variable term elimination
+        parallel_depth: the depth of the subtrees composed with `subtree_map`
+        subtree_map: the map function used to compose the subtrees
+
+    Returns:
+        The composed contract and the record of each composition.
+    """
+    done: Dict[Tuple[int, int], Tuple[PolyhedralIoContract, List[CompositionRecord]]] = {}
+    if parallel_depth > 0:
+        subtrees = [p for p in plan.subtrees(parallel_depth) if p.left is not None]
+        compose = functools.partial(
+            _compose_subtree, steps=steps, ends=ends, variables=variables, tactics_order=tactics_order, done={}
+        )
+        for p, result in zip(subtrees, subtree_map(compose, subtrees)):
+            done[(p.first, p.last)] = result
+    return _compose_subtree(plan, steps, ends, variables, tactics_order, done)
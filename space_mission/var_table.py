@@ -0,0 +1,289 @@
+"""Process-wide interning of variable names and compact, array-backed storage of polyhedral contracts."""
+import copyreg
+import pickle
+import sys
+from typing import Any, BinaryIO, Dict, List, Sequence, Tuple
+
+import numpy as np
+from pacti.contracts import PolyhedralIoContract
+from pacti.iocontract import Var
+from pacti.terms.polyhedra import PolyhedralTerm, PolyhedralTermList
+
+# The id of each variable name interned in this process, and the name and Var of each id.
+_ids: Dict[str, int] = {}
+_names: List[str] = []
+_vars: List[Var] = []
+
+
+def var_id(name: str) -> int:
+    """
+    Interns a variable name.
+
+    Args:
+        name: the variable name
+
+    Returns:
+        The id of the name in this process; ids are assigned in the order names are first seen.
+    """
+    i = _ids.get(name)
+    if i is None:
+        name = sys.intern(name)
+        i = _ids[name] = len(_names)
+        _names.append(name)
+        _vars.append(Var(name))
+    return i
+
+
+def var_name(i: int) -> str:
+    return _names[i]
+
+
+def interned_var(name: str) -> Var:
+    """
+    Args:
+        name: the variable name
+
+    Returns:
+        The Var of the name shared by all the contracts of this process that use `interned_var`.
+    """
+    return _vars[var_id(name)]
+
+
+def contract_from_rows(
+    input_names: Sequence[str],
+    output_names: Sequence[str],
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    data: np.ndarray,
+    constants: np.ndarray,
+    n_assumptions: int,
+) -> PolyhedralIoContract:
+    """
+    Builds a contract from the CSR arrays of its assumptions followed by its guarantees, with interned variables.
+
+    The arrays are those of a valid contract, e.g., saved by `contract_rows`: the contract is restored as unpickling
+    does, without re-checking its variables.
+
+    Args:
+        input_names: the input variable names
+        output_names: the output variable names
+        indptr: the row pointers, starting at 0
+        indices: the column of each coefficient, in the order of the inputs followed by the outputs
+        data: the coefficients
+        constants: the constant of each row
+        n_assumptions: the number of assumption rows
+
+    Returns:
+        The contract.
+    """
+    variables = [interned_var(name) for name in list(input_names) + list(output_names)]
+    columns, coeffs, bounds = indices.tolist(), data.tolist(), indptr.tolist()
+    terms = [
+        PolyhedralTerm({variables[columns[k]]: coeffs[k] for k in range(bounds[r], bounds[r + 1])}, constant)
+        for r, constant in enumerate(constants.tolist())
+    ]
+    c: PolyhedralIoContract = PolyhedralIoContract.__new__(PolyhedralIoContract)
+    c.a = PolyhedralTermList(terms[:n_assumptions])
+    c.g = PolyhedralTermList(terms[n_assumptions:])
+    c.inputvars = variables[: len(input_names)]
+    c.outputvars = variables[len(input_names) :]
+    return c
+
+
+def contract_rows(
+    c: PolyhedralIoContract,
+) -> Tuple[List[str], List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Args:
+        c: the contract
+
+    Returns:
+        The arguments of `contract_from_rows` restoring the contract.
+    """
+    local = {v.name: i for i, v in enumerate(c.inputvars + c.outputvars)}
+    terms: List[PolyhedralTerm] = c.a.terms + c.g.terms
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(t.variables) for t in terms], out=indptr[1:])
+    return (
+        [v.name for v in c.inputvars],
+        [v.name for v in c.outputvars],
+        indptr,
+        np.array([local[v.name] for t in terms for v in t.variables], dtype=np.int32),
+        np.array([coeff for t in terms for coeff in t.variables.values()], dtype=np.float64),
+        np.array([t.constant for t in terms], dtype=np.float64),
+        len(c.a.terms),
+    )
+
+
+class CompactContract:
+    """
+    A polyhedral contract stored as arrays of interned variable ids and coefficients.
+
+    It takes a fraction of the memory of the contract's `Var` and term objects, e.g., to hold many scenario
+    contracts in a worker, and renames variables with integer array operations. The ids are process-local:
+    a compact contract is pickled with the names of its variables and re-interned when unpickled.
+    """
+
+    __slots__ = ("inputs", "outputs", "indptr", "ids", "coeffs", "constants", "n_assumptions")
+
+    def __init__(
+        self,
+        inputs: np.ndarray,
+        outputs: np.ndarray,
+        indptr: np.ndarray,
+        ids: np.ndarray,
+        coeffs: np.ndarray,
+        constants: np.ndarray,
+        n_assumptions: int,
+    ):
+        """
+        Args:
+            inputs: the ids of the input variables
+            outputs: the ids of the output variables
+            indptr: the row pointers of the assumptions followed by the guarantees
+            ids: the variable id of each coefficient
+            coeffs: the coefficients
+            constants: the constant of each row
+            n_assumptions: the number of assumption rows
+        """
+        self.inputs = inputs
+        self.outputs = outputs
+        self.indptr = indptr
+        self.ids = ids
+        self.coeffs = coeffs
+        self.constants = constants
+        self.n_assumptions = n_assumptions
+
+    @classmethod
+    def from_contract(cls, c: PolyhedralIoContract) -> "CompactContract":
+        input_names, output_names, indptr, indices, data, constants, n_assumptions = contract_rows(c)
+        variables = np.array([var_id(name) for name in input_names + output_names], dtype=np.int32)
+        return cls(
+            variables[: len(input_names)],
+            variables[len(input_names) :],
+            indptr,
+            variables[indices],
+            data,
+            constants,
+            n_assumptions,
+        )
+
+    def to_contract(self) -> PolyhedralIoContract:
+        variables = np.concatenate([self.inputs, self.outputs])
+        # The column of each id among the contract's variables.
+        columns = np.zeros(max(int(variables.max(initial=-1)), int(self.ids.max(initial=-1))) + 1, dtype=np.int32)
+        columns[variables] = np.arange(len(variables), dtype=np.int32)
+        return contract_from_rows(
+            [_names[i] for i in self.inputs],
+            [_names[i] for i in self.outputs],
+            self.indptr,
+            columns[self.ids],
+            self.coeffs,
+            self.constants,
+            self.n_assumptions,
+        )
+
+    def renamed(self, pairs: Sequence[Tuple[str, str]]) -> "CompactContract":
+        """
+        Renames variables, as `rename_variables` does for the contract, without building terms.
+
+        Args:
+            pairs: the (source, target) names
+
+        Returns:
+            The renamed compact contract.
+        """
+        sources, targets = [var_id(s) for s, _ in pairs], [var_id(t) for _, t in pairs]
+        mapping = np.arange(len(_names), dtype=np.int32)
+        mapping[sources] = targets
+        return CompactContract(
+            mapping[self.inputs],
+            mapping[self.outputs],
+            self.indptr,
+            mapping[self.ids],
+            self.coeffs,
+            self.constants,
+            self.n_assumptions,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, k).nbytes for k in ("inputs", "outputs", "indptr", "ids", "coeffs", "constants"))
+
+    def __getstate__(self) -> tuple:
+        variables, local = np.unique(np.concatenate([self.inputs, self.outputs, self.ids]), return_inverse=True)
+        local = local.astype(np.int32)
+        n_in, n_out = len(self.inputs), len(self.outputs)
+        return (
+            [_names[i] for i in variables],
+            local[:n_in],
+            local[n_in : n_in + n_out],
+            self.indptr,
+            local[n_in + n_out :],
+            self.coeffs,
+            self.constants,
+            self.n_assumptions,
+        )
+
+    def __setstate__(self, state: tuple) -> None:
+        names, inputs, outputs, self.indptr, ids, self.coeffs, self.constants, self.n_assumptions = state
+        variables = np.array([var_id(name) for name in names], dtype=np.int32)
+        self.inputs, self.outputs, self.ids = variables[inputs], variables[outputs], variables[ids]
+
+
+def intern_contract(c: PolyhedralIoContract) -> PolyhedralIoContract:
+    """
+    Args:
+        c: the contract
+
+    Returns:
+        The same contract with its terms and variable lists sharing the interned Vars of this process.
+    """
+    return contract_from_rows(*contract_rows(c))
+
+
+def _contract_from_buffers(
+    input_names: List[str],
+    output_names: List[str],
+    indptr: bytes,
+    indices: bytes,
+    data: bytes,
+    constants: bytes,
+    n: int,
+) -> PolyhedralIoContract:
+    return contract_from_rows(
+        input_names,
+        output_names,
+        np.frombuffer(indptr, dtype=np.int64),
+        np.frombuffer(indices, dtype=np.int32),
+        np.frombuffer(data, dtype=np.float64),
+        np.frombuffer(constants, dtype=np.float64),
+        n,
+    )
+
+
+def _reduce_contract(c: PolyhedralIoContract) -> tuple:
+    try:
+        input_names, output_names, indptr, indices, data, constants, n = contract_rows(c)
+    except KeyError:
+        # A term uses a variable that is neither an input nor an output: pickle the objects as they are.
+        return c.__reduce_ex__(2)
+    # Raw buffers rather than arrays, which take a few hundred bytes each to pickle.
+    buffers = (indptr.tobytes(), indices.tobytes(), data.tobytes(), constants.tobytes())
+    return _contract_from_buffers, (input_names, output_names) + buffers + (n,)
+
+
+def dump_compact(obj: Any, f: BinaryIO) -> None:
+    """
+    Pickles an object with the contracts it holds as the arrays of `contract_rows`.
+
+    The contracts are unpickled with interned variables; loading the pickle requires this module. Other pickles,
+    e.g., of a NAV scenario state, keep the default form of the contracts.
+
+    Args:
+        obj: the object, e.g., a chunk of results
+        f: the binary file
+    """
+    pickler = pickle.Pickler(f)
+    pickler.dispatch_table = {**copyreg.dispatch_table, PolyhedralIoContract: _reduce_contract}
+    pickler.dump(obj)